@@ -0,0 +1,96 @@
+import asyncio
+import struct
+import time
+
+from Communication.ModbusTCP import ModbusTCP, ModbusTransaction
+from Communication.AsyncSocketConnection import AsyncSocketConnection
+
+
+class AsyncModbusTCP(ModbusTCP):
+    """
+    asyncio version of :class:`ModbusTCP`.
+    Messages are built and checked the same way, but the connection is kept open between requests,
+    and only reopened after an error.
+    """
+
+    def __init__(self, host, port=502, timeout=1.0):
+        """
+        :param host: IP address to connect with
+        :param port: Pot (standard 502) to connect with
+        :param timeout: Seconds to wait for a response
+        """
+        super().__init__(host, port)
+        self.connection = AsyncSocketConnection(host, port, timeout)
+        # Only one transaction can be in flight on the connection
+        self._lock = asyncio.Lock()
+
+    async def open(self):
+        return await self.connection.connect()
+
+    async def close(self):
+        await self.connection.disconnect()
+
+    async def read_coils(self, bit_address, quantity=1):
+        """ Main function 1 of Modbus/TCP - 0x01
+        """
+        data_bytes = struct.pack(">HH", bit_address, quantity)
+        return await self._send_async(self.READ_COILS, data_bytes)
+
+    async def read_holding_registers(self, reg_address, quantity=1):
+        """Main function 3 of Modbus/TCP - 0x03.
+
+        See :meth:`ModbusTCP.read_holding_registers`
+        """
+        data_bytes = struct.pack(">HH", reg_address, quantity)
+        return await self._send_async(self.READ_HOLDING_REGISTERS, data_bytes)
+
+    async def _send_async(self, function_code, data_bytes):
+        """ Send a request and wait for its response
+
+        Transactions are timed and handed to the transaction hooks like in :meth:`ModbusTCP._send`.
+        The connect time is only spent when the connection has to be reopened.
+        :return: Bytes response, or None if the transaction failed
+        """
+        async with self._lock:
+            adu = self._create_message(function_code, data_bytes)
+            transaction = ModbusTransaction(adu) if self.hooks else None
+            if not self.connection.opened and not await self.open():
+                if transaction is not None:
+                    transaction.error = "ConnectError"
+                    self._finish_transaction(transaction)
+                return None
+            connected = time.perf_counter()
+            try:
+                await self.connection.send(adu)
+                sent = time.perf_counter()
+                mbap = await self.connection.receive_exactly(7)
+                first_byte = time.perf_counter()
+                length = struct.unpack(">H", mbap[4:6])[0]
+                response = mbap + await self.connection.receive_exactly(length - 1)
+                received = time.perf_counter()
+            except (OSError, RuntimeError, asyncio.TimeoutError) as error:
+                print("Modbus: {0}".format(error or type(error).__name__))
+                await self.close()
+                if transaction is not None:
+                    transaction.error = type(error).__name__
+                    self._finish_transaction(transaction)
+                return None
+
+        if self.pretty_print_response:
+            self.pretty_print(response)
+
+        failed = self._error_check(response)
+        if transaction is not None:
+            transaction.connect_time = connected - transaction.start
+            transaction.send_time = sent - connected
+            transaction.first_byte_time = first_byte - sent
+            transaction.rtt = received - transaction.start
+            transaction.response_size = len(response)
+            if failed:
+                transaction.error = "ResponseError"
+            self._finish_transaction(transaction)
+        if failed:
+            # The stream may be out of sync, start over on the next request
+            await self.close()
+            return None
+        return response
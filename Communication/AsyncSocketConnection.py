@@ -0,0 +1,80 @@
+import asyncio
+
+
+class AsyncSocketConnection:
+    """
+    asyncio version of :class:`SocketConnection`
+    """
+    def __init__(self, host, port, timeout=1.0):
+        """
+        :param host: The IP to connect with
+        :param port: Port to connect with
+        :param timeout: Seconds to wait for connecting and receiving
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.opened = False
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        """
+        Opens a socket connection with the robot for communication.
+        :return: True if the connection was opened
+        """
+        if self.opened:
+            await self.disconnect()
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+            self.opened = True
+        except (OSError, asyncio.TimeoutError) as error:
+            print("Connecting OS error: {0}".format(error))
+            return False
+        return True
+
+    async def send(self, message):
+        """
+        Send data over the socket connection
+        :param message: The data to send
+        """
+        if not self.opened:
+            raise RuntimeError("socket connection broken")
+        self.writer.write(message)
+        await self.writer.drain()
+
+    async def receive(self, size=1024):
+        """
+        Recieve up to `size` bytes over the socket connection
+        """
+        response = await asyncio.wait_for(self.reader.read(size), self.timeout)
+        if len(response) == 0:
+            raise RuntimeError("socket connection broken")
+        return response
+
+    async def receive_exactly(self, size):
+        """
+        Recieve exactly `size` bytes over the socket connection
+        """
+        try:
+            return await asyncio.wait_for(self.reader.readexactly(size), self.timeout)
+        except asyncio.IncompleteReadError:
+            raise RuntimeError("socket connection broken")
+
+    async def disconnect(self):
+        """
+        Closes the socket connection
+        """
+        self.opened = False
+        if self.writer is None:
+            return
+        try:
+            self.writer.close()
+            await self.writer.wait_closed()
+        except OSError as error:
+            print("Disconnecting OS error: {0}".format(error))
+        finally:
+            self.writer = None
+            self.reader = None
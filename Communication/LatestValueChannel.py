@@ -0,0 +1,152 @@
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def merge_detections(old, new):
+    """
+    Merges two (detections, trace, camera) readings into one with the boxes of both and the newest trace
+    """
+    return old[0] + new[0], new[1], new[2]
+
+
+class LatestValueChannel:
+    """
+    Bounded channel between a producer and a consumer that always hands out fresh data.
+    It has the put/get/get_nowait interface of queue.Queue, so it can replace it directly.
+
+    Policies:
+    - "latest": keeps the latest `size` items, dropping the oldest ones.
+    - "conflate": keeps only the newest item, dropping whatever the consumer did not read.
+    - "merge": combines every item since the last read into one, with `merge(old, new)`.
+
+    With "conflate" and "merge", `key(item)` separates items that must not replace each other
+    (e.g. readings of different cameras). Each key keeps its own pending item.
+    """
+
+    POLICIES = ("latest", "conflate", "merge")
+
+    def __init__(self, policy: str = "conflate", size: int = 1, key=None, merge=merge_detections):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown channel policy: {policy}")
+        if size < 1:
+            raise ValueError("Channel size must be at least 1")
+        self.policy = policy
+        self.size = size
+        self.key = key if key is not None else (lambda item: None)
+        self.merge = merge
+
+        self._items = deque()                # "latest": (put time, item)
+        self._pending = OrderedDict()        # "conflate"/"merge": key -> (put time, item)
+        self._not_empty = threading.Condition(threading.Lock())
+        self._listeners = []
+
+        # Counters
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.max_age = 0.0
+        self.last_age = 0.0
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Never blocks: when the channel is full, old data is dropped (or merged) instead.
+        `block` and `timeout` are only accepted for compatibility with queue.Queue
+        """
+        now = time.monotonic()
+        with self._not_empty:
+            self.produced += 1
+            if self.policy == "latest":
+                if len(self._items) >= self.size:
+                    self._items.popleft()
+                    self.dropped += 1
+                self._items.append((now, item))
+            else:
+                key = self.key(item)
+                previous = self._pending.get(key)
+                if previous is None:
+                    self._pending[key] = (now, item)
+                elif self.policy == "conflate":
+                    self.dropped += 1
+                    # Keep the position of the key, so one busy camera can not starve the others
+                    self._pending[key] = (now, item)
+                else:
+                    self.merged += 1
+                    # The age of a merged item is the age of its oldest data
+                    self._pending[key] = (previous[0], self.merge(previous[1], item))
+            self._not_empty.notify()
+        for listener in self._listeners:
+            listener()
+
+    def add_listener(self, listener):
+        """
+        Calls `listener()` after every put, from the producer thread. Used to wake up consumers that do not
+        block on get, like asyncio tasks
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def _pop(self):
+        if self.policy == "latest":
+            put_time, item = self._items.popleft()
+        else:
+            _, (put_time, item) = self._pending.popitem(last=False)
+        age = time.monotonic() - put_time
+        self.consumed += 1
+        self.last_age = age
+        if age > self.max_age:
+            self.max_age = age
+        return item
+
+    def get(self, block=True, timeout=None):
+        """
+        Returns the oldest pending item, waiting for one if `block` is set
+        :raises queue.Empty: if there is nothing to read
+        """
+        with self._not_empty:
+            if not block:
+                if not self._qsize():
+                    raise queue.Empty
+            elif timeout is None:
+                while not self._qsize():
+                    self._not_empty.wait()
+            else:
+                end = time.monotonic() + timeout
+                while not self._qsize():
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self._not_empty.wait(remaining)
+            return self._pop()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def _qsize(self) -> int:
+        return len(self._items) if self.policy == "latest" else len(self._pending)
+
+    def qsize(self) -> int:
+        with self._not_empty:
+            return self._qsize()
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def get_metrics(self) -> dict:
+        with self._not_empty:
+            return {
+                "produced": self.produced,
+                "consumed": self.consumed,
+                "dropped": self.dropped,
+                "merged": self.merged,
+                "pending": self._qsize(),
+                "max_age": round(self.max_age, 6),
+                "last_age": round(self.last_age, 6),
+            }
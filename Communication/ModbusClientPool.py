@@ -0,0 +1,55 @@
+from Communication.AsyncModbusTCP import AsyncModbusTCP
+from Communication.ModbusTCP import TransactionHook
+
+
+class ModbusClientPool:
+    """
+    Shares one :class:`AsyncModbusTCP` per robot between the users of an event loop.
+
+    The UR Modbus server handles a few clients at most, and a client only has one transaction in flight, so
+    everything polling the same robot goes through the same persistent connection instead of opening its own.
+    Clients are reference counted, and closed when their last user releases them.
+
+    :param timeout: Seconds to wait for a response
+    :param hooks: Transaction hooks added to every client (e.g. modbus_stats)
+    """
+
+    def __init__(self, timeout: float = 1.0, hooks: tuple[TransactionHook, ...] = ()):
+        self.timeout = timeout
+        self.hooks = hooks
+        self.clients = {}
+        self.users = {}
+
+    def acquire(self, host: str, port: int = 502) -> AsyncModbusTCP:
+        """
+        :return: The client of the robot, created on first use. Must be given back with release()
+        """
+        key = (host, port)
+        client = self.clients.get(key)
+        if client is None:
+            client = AsyncModbusTCP(host, port, self.timeout)
+            for hook in self.hooks:
+                client.add_hook(hook)
+            self.clients[key] = client
+            self.users[key] = 0
+        self.users[key] += 1
+        return client
+
+    async def release(self, client: AsyncModbusTCP):
+        key = (client.connection.host, client.connection.port)
+        if self.clients.get(key) is not client:
+            return
+        self.users[key] -= 1
+        if self.users[key] == 0:
+            del self.clients[key], self.users[key]
+            await client.close()
+
+    async def close(self):
+        clients = list(self.clients.values())
+        self.clients.clear()
+        self.users.clear()
+        for client in clients:
+            await client.close()
+
+    def get_metrics(self) -> dict:
+        return {f"{host}:{port}": users for (host, port), users in self.users.items()}
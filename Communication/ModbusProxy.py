@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import struct
+import time
+
+from Communication.AsyncModbusTCP import AsyncModbusTCP
+from Telemetry.Metrics import metrics, start_metrics_server
+from Telemetry.ModbusStats import modbus_stats
+
+# Local Modbus TCP server sharing one connection to the robot between any number of clients (dashboards, loggers,
+# the sentry...):
+#
+#     python -m Communication.ModbusProxy --robot 172.22.114.160 --port 5020
+#
+# The register blocks are read from the robot at a fixed rate, and register reads falling inside a block are answered
+# from that copy, as long as it is not older than the maximum age. Other reads are forwarded, and their answer is
+# reused for the same maximum age. Identical reads in flight are sent to the robot only once. So the load on the
+# robot controller depends on the poll rate, not on the number of clients.
+# Only reads are supported (functions 1 and 3); the proxy answers writes with an illegal function exception.
+
+# Joint angles (270), joint speeds (280) and their signs (320), and the TCP pose (400)
+DEFAULT_BLOCKS = ((270, 56), (400, 6))
+
+# Forwarded answers kept for reuse, the oldest are dropped beyond this
+MAX_FORWARDED = 256
+
+READ_COILS = 0x01
+READ_HOLDING_REGISTERS = 0x03
+MAX_QUANTITY = {READ_COILS: 2000, READ_HOLDING_REGISTERS: 125}
+
+# Exception codes
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_DATA_VALUE = 0x03
+GATEWAY_TARGET_FAILED = 0x0B
+
+proxy_requests_total = metrics.counter("sentry_modbus_proxy_requests_total", "Client requests answered by the Modbus proxy, by source (cache, forwarded, coalesced, error)")
+proxy_upstream_reads_total = metrics.counter("sentry_modbus_proxy_upstream_reads_total", "Reads sent to the robot by the Modbus proxy")
+proxy_clients = metrics.gauge("sentry_modbus_proxy_clients", "Clients connected to the Modbus proxy")
+
+
+class RegisterBlock:
+    """
+    Copy of a range of holding registers of the robot
+    """
+
+    def __init__(self, address: int, quantity: int):
+        self.address = address
+        self.quantity = quantity
+        self.data = None
+        self.time = None
+
+    def contains(self, address: int, quantity: int) -> bool:
+        return self.address <= address and address + quantity <= self.address + self.quantity
+
+    def age(self) -> float:
+        return time.monotonic() - self.time if self.time is not None else float("inf")
+
+    def slice(self, address: int, quantity: int) -> bytes:
+        start = 2 * (address - self.address)
+        return self.data[start:start + 2 * quantity]
+
+
+class ModbusProxy:
+    """
+    :param host: IP address of the robot
+    :param blocks: (address, quantity) of the register blocks to poll
+    :param poll_period: Seconds between two polls of the blocks
+    :param max_age: Oldest data, in seconds, given to a client
+    :param upstream: Client of the robot, by default a new AsyncModbusTCP
+    """
+
+    def __init__(self, host: str, port: int = 502, blocks=DEFAULT_BLOCKS, poll_period: float = 0.05,
+                 max_age: float = 0.1, timeout: float = 1.0, upstream: AsyncModbusTCP | None = None):
+        if upstream is None:
+            upstream = AsyncModbusTCP(host, port, timeout)
+            upstream.add_hook(modbus_stats)
+        self.upstream = upstream
+        self.blocks = [RegisterBlock(address, quantity) for address, quantity in blocks]
+        self.poll_period = poll_period
+        self.max_age = max_age
+        self.in_flight = {}
+        self.forwarded = {}
+        self.server = None
+        self.clients = 0
+        self.upstream_reads = 0
+
+    # Robot side
+
+    async def poll(self):
+        """
+        Reads every block at a fixed rate. Deadlines are absolute, so a slow read does not shift the following ones
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            for block in self.blocks:
+                await self.refresh(block)
+            self.expire_forwarded()
+            deadline += self.poll_period
+            delay = deadline - loop.time()
+            if delay < 0:
+                deadline = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def refresh(self, block: RegisterBlock) -> bool:
+        data = await self.fetch(READ_HOLDING_REGISTERS, block.address, block.quantity)
+        if data is None:
+            return False
+        block.data = data
+        block.time = time.monotonic()
+        return True
+
+    async def fetch(self, function: int, address: int, quantity: int) -> bytes | None:
+        """
+        Reads from the robot, or waits for the identical read already in flight
+        :return: The data bytes of the response, or None if the read failed
+        """
+        key = (function, address, quantity)
+        pending = self.in_flight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        data = None
+        try:
+            self.upstream_reads += 1
+            proxy_upstream_reads_total.inc()
+            if function == READ_COILS:
+                response = await self.upstream.read_coils(address, quantity)
+            else:
+                response = await self.upstream.read_holding_registers(address, quantity)
+            if response is not None:
+                data = bytes(response[9:9 + response[8]])
+            return data
+        finally:
+            del self.in_flight[key]
+            future.set_result(data)
+
+    async def read(self, function: int, address: int, quantity: int) -> tuple[bytes | None, str]:
+        """
+        :return: The data bytes, or None if the robot did not answer, and where they came from
+        """
+        if function == READ_HOLDING_REGISTERS:
+            for block in self.blocks:
+                if block.contains(address, quantity):
+                    if block.age() > self.max_age and not await self.refresh(block):
+                        return None, "error"
+                    return block.slice(address, quantity), "cache"
+
+        key = (function, address, quantity)
+        cached = self.forwarded.get(key)
+        if cached is not None and time.monotonic() - cached[0] <= self.max_age:
+            return cached[1], "cache"
+        coalesced = key in self.in_flight
+        data = await self.fetch(function, address, quantity)
+        if data is None:
+            return None, "error"
+        if not coalesced:
+            # Reinserted, so the dict stays ordered from the oldest to the newest answer
+            self.forwarded.pop(key, None)
+            self.forwarded[key] = (time.monotonic(), data)
+            if len(self.forwarded) > MAX_FORWARDED:
+                del self.forwarded[next(iter(self.forwarded))]
+        return data, "coalesced" if coalesced else "forwarded"
+
+    def expire_forwarded(self):
+        """
+        Drops the forwarded answers older than the maximum age, which would not be reused anymore
+        """
+        now = time.monotonic()
+        while self.forwarded:
+            key = next(iter(self.forwarded))
+            if now - self.forwarded[key][0] <= self.max_age:
+                break
+            del self.forwarded[key]
+
+    # Client side
+
+    async def answer(self, request: bytes) -> bytes:
+        """
+        :param request: PDU of a client request
+        :return: PDU of the response
+        """
+        function = request[0]
+        if function not in MAX_QUANTITY:
+            return struct.pack(">BB", function | 0x80, ILLEGAL_FUNCTION)
+        if len(request) != 5:
+            return struct.pack(">BB", function | 0x80, ILLEGAL_DATA_VALUE)
+        address, quantity = struct.unpack(">HH", request[1:5])
+        if not 1 <= quantity <= MAX_QUANTITY[function]:
+            return struct.pack(">BB", function | 0x80, ILLEGAL_DATA_VALUE)
+
+        data, source = await self.read(function, address, quantity)
+        proxy_requests_total.inc(source=source)
+        if data is None:
+            return struct.pack(">BB", function | 0x80, GATEWAY_TARGET_FAILED)
+        return struct.pack(">BB", function, len(data)) + data
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients += 1
+        proxy_clients.set(self.clients)
+        try:
+            while True:
+                mbap = await reader.readexactly(7)
+                transaction_id, protocol_id, length, unit_id = struct.unpack(">HHHB", mbap)
+                if length < 2:
+                    break
+                request = await reader.readexactly(length - 1)
+                response = await self.answer(request)
+                writer.write(struct.pack(">HHHB", transaction_id, protocol_id, len(response) + 1, unit_id) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients -= 1
+            proxy_clients.set(self.clients)
+            writer.close()
+
+    async def start(self, address: str = "127.0.0.1", port: int = 5020):
+        self.server = await asyncio.start_server(self.handle, address, port)
+        print(f"[ModbusProxy] Serving {self.upstream.connection.host} on {address}:{port}")
+
+    async def run(self, address: str = "127.0.0.1", port: int = 5020):
+        """
+        Serves clients and polls the robot until cancelled
+        """
+        await self.start(address, port)
+        try:
+            await self.poll()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            await self.upstream.close()
+
+    def get_metrics(self) -> dict:
+        return {
+            "clients": self.clients,
+            "upstream_reads": self.upstream_reads,
+            "forwarded": len(self.forwarded),
+            "block_ages": {block.address: round(block.age(), 3) for block in self.blocks},
+        }
+
+
+def parse_block(text: str) -> tuple[int, int]:
+    address, quantity = text.split(":")
+    return int(address), int(quantity)
+
+
+if __name__ == "__main__":
+    from Config.SentryConfig import load_config
+
+    parser = argparse.ArgumentParser(description="Shares one Modbus connection to the robot between many local clients")
+    parser.add_argument("--robot", default=None, help="Robot address, from the configuration by default")
+    parser.add_argument("--address", default="127.0.0.1", help="Address to serve on")
+    parser.add_argument("--port", type=int, default=5020, help="Port to serve on")
+    parser.add_argument("--period", type=float, default=0.05, help="Seconds between polls of the register blocks")
+    parser.add_argument("--max-age", type=float, default=0.1, help="Oldest data given to a client, in seconds")
+    parser.add_argument("--block", type=parse_block, action="append", help="address:quantity of a block to poll, can be repeated")
+    args = parser.parse_args()
+
+    proxy = ModbusProxy(args.robot or load_config().robot_host, blocks=args.block or DEFAULT_BLOCKS,
+                        poll_period=args.period, max_age=args.max_age)
+    metrics_server = start_metrics_server()
+    try:
+        asyncio.run(proxy.run(args.address, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        print(proxy.get_metrics())
+        modbus_stats.print_summary()
@@ -1,5 +1,6 @@
 import struct
 import random
+import time
 
 from Communication.SocketConnection import SocketConnection
 
@@ -89,6 +90,42 @@ from Communication.SocketConnection import SocketConnection
 # http://www.modbus.org/docs/Modbus_Messaging_Implementation_Guide_V1_0b.pdf
 
 
+class ModbusTransaction:
+    """
+    Timings of a single request/response, handed to the transaction hooks.
+    Durations are in seconds, and None for the phases the transaction did not reach.
+    `error` is the class name of the exception that ended the transaction, "ResponseError" if the response failed
+    the error check, or None if it succeeded.
+    """
+    __slots__ = ("function_code", "address", "quantity", "start", "connect_time", "send_time", "first_byte_time",
+                 "rtt", "response_size", "error")
+
+    def __init__(self, adu: bytes):
+        self.function_code = adu[7]
+        self.address, self.quantity = struct.unpack_from(">HH", adu, 8)
+        self.start = time.perf_counter()
+        self.connect_time = None
+        self.send_time = None
+        self.first_byte_time = None
+        self.rtt = None
+        self.response_size = 0
+        self.error = None
+
+    def __repr__(self):
+        return (f"ModbusTransaction(function={self.function_code}, address={self.address}, quantity={self.quantity}, "
+                f"rtt={self.rtt}, error={self.error})")
+
+
+class TransactionHook:
+    """
+    Receives every finished transaction of the ModbusTCP clients it is added to.
+    Called on the thread (or event loop) doing the request, so it must be quick
+    """
+
+    def on_transaction(self, transaction: ModbusTransaction):
+        pass
+
+
 class ModbusTCP:
     """
     A Modbus communication class designed for use with modbusTCP
@@ -124,8 +161,26 @@ class ModbusTCP:
 
         self.pretty_print_response = False  # Check to print out response message in console
 
+        self.hooks = []                     # TransactionHooks called after every transaction
+
         self.connection = SocketConnection(host, port)
 
+    def add_hook(self, hook: TransactionHook):
+        """
+        Calls `hook.on_transaction` with the timings of every following transaction
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: TransactionHook):
+        self.hooks.remove(hook)
+
+    def _finish_transaction(self, transaction: ModbusTransaction):
+        for hook in self.hooks:
+            try:
+                hook.on_transaction(transaction)
+            except Exception as e:
+                print("Modbus: Transaction hook failed: {}".format(e))
+
     def open(self):
         """
         Open the socket for communication
@@ -177,18 +232,45 @@ class ModbusTCP:
     def _send(self, adu):
         """ Send message over the socket
 
+        If there are transaction hooks, each phase of the transaction is timed and handed to them
         :param adu: The data to send over the socket
         :return: Bytes response from the other end of the socket
         """
-        self.open()
-        self.connection.send(adu)
-        response = self.connection.receive()
-        self.close()
+        hooked = bool(self.hooks)
+        if not hooked:
+            self.open()
+            self.connection.send(adu)
+            response = self.connection.receive()
+            self.close()
+        else:
+            transaction = ModbusTransaction(adu)
+            try:
+                self.open()
+                connected = time.perf_counter()
+                transaction.connect_time = connected - transaction.start
+                self.connection.send(adu)
+                sent = time.perf_counter()
+                transaction.send_time = sent - connected
+                response = self.connection.receive()
+                received = time.perf_counter()
+                transaction.first_byte_time = received - sent
+                transaction.rtt = received - transaction.start
+                transaction.response_size = len(response)
+                self.close()
+            except Exception as e:
+                transaction.error = type(e).__name__
+                self._finish_transaction(transaction)
+                raise
 
         if self.pretty_print_response:
             self.pretty_print(response)
 
-        if self._error_check(response):
+        failed = self._error_check(response)
+        if hooked:
+            if failed:
+                transaction.error = "ResponseError"
+            self._finish_transaction(transaction)
+        if failed:
             return None
         return response
 
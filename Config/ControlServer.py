@@ -0,0 +1,149 @@
+import dataclasses
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Config.SentryConfig import SentryConfig, update_control
+from Telemetry.SamplingProfiler import profiler
+
+# Local HTTP API to inspect and tune a running sentry, on 127.0.0.1:9109 by default:
+#
+#     curl localhost:9109/config
+#     curl -X PATCH localhost:9109/config/control -d '{"base_max_speed": 1.0, "horizontal_dead_zone": 0.08}'
+#     curl -X POST localhost:9109/profiler
+#     curl -X POST localhost:9109/estop -d '{"reason": "person in the cell"}'
+#     curl -X POST localhost:9109/estop/reset
+#     curl localhost:9109/robot
+#
+# Control parameters are validated, then handed to URSentry, which switches to them at the start of its next tick.
+# The robot and camera addresses can only be changed with a restart.
+# The e-stop is sent by the request's thread, so it does not wait for the control tick.
+
+
+class ControlServer:
+    """
+    :param sentry: URSentry receiving the control parameters and e-stops
+    :param config: Configuration the sentry was started with
+    """
+
+    def __init__(self, sentry, config: SentryConfig, port: int = 9109, address: str = "127.0.0.1"):
+        self.sentry = sentry
+        self.config = config
+        self._lock = threading.Lock()
+        control = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/config":
+                    self.reply(200, control.get_config())
+                elif self.path == "/estop":
+                    self.reply(200, control.sentry.estop.status())
+                elif self.path == "/robot":
+                    self.reply(200, control.get_robot_status())
+                else:
+                    self.reply(404, {"error": "not found"})
+
+            def do_PATCH(self):
+                if self.path != "/config/control":
+                    self.reply(404, {"error": "not found"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    changes = json.loads(self.rfile.read(length) or b"{}")
+                    if not isinstance(changes, dict):
+                        raise ValueError("expected a JSON object")
+                    self.reply(200, control.update(changes))
+                except ValueError as e:
+                    self.reply(400, {"error": str(e)})
+
+            def do_POST(self):
+                if self.path == "/profiler":
+                    path = profiler.toggle()
+                    self.reply(200, {"running": profiler.running, "written": path})
+                elif self.path == "/config/control":
+                    self.do_PATCH()
+                elif self.path == "/estop":
+                    try:
+                        length = int(self.headers.get("Content-Length", 0))
+                        body = json.loads(self.rfile.read(length) or b"{}")
+                        reason = body.get("reason", "control API") if isinstance(body, dict) else "control API"
+                    except ValueError:
+                        reason = "control API"
+                    # A malformed body still stops the arm
+                    control.sentry.emergency_stop(str(reason))
+                    self.reply(200, control.sentry.estop.status())
+                elif self.path == "/estop/reset":
+                    reset = control.sentry.reset_emergency_stop()
+                    self.reply(200 if reset else 409, control.sentry.estop.status())
+                else:
+                    self.reply(404, {"error": "not found"})
+
+            def reply(self, status: int, body: dict):
+                data = json.dumps(body, indent=2).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="control", daemon=True)
+
+    def get_config(self) -> dict:
+        with self._lock:
+            return self.config.to_dict()
+
+    def get_robot_status(self) -> dict:
+        """
+        The robot fault the sentry is holding for, and what the dashboard server last reported
+        """
+        monitor = self.sentry.monitor
+        return {
+            "state": self.sentry.get_state(),
+            "fault": self.sentry.robot_fault,
+            "dashboard": monitor.get_metrics() if monitor is not None else None,
+        }
+
+    def update(self, changes: dict) -> dict:
+        """
+        Validates and applies changes to the control parameters
+        :return: The resulting configuration
+        :raises ValueError: if a parameter is unknown or invalid, in which case nothing is changed
+        """
+        with self._lock:
+            control = update_control(self.config.control, changes)
+            self.config = dataclasses.replace(self.config, control=control)
+            self.sentry.set_config(control)
+            print(f"[Control] Updated {', '.join(f'{key}={value}' for key, value in changes.items())}")
+            return self.config.to_dict()
+
+    def start(self):
+        self.thread.start()
+        print(f"[Control] Serving on http://{self.server.server_address[0]}:{self.server.server_address[1]}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_control_server(sentry, config: SentryConfig) -> ControlServer | None:
+    """
+    Starts the control server on CONTROL_ADDRESS:CONTROL_PORT (127.0.0.1:9109 by default).
+    Setting CONTROL_PORT to 0 disables it
+    :return: The running server, or None if it is disabled or could not start
+    """
+    port = int(os.getenv('CONTROL_PORT', '9109'))
+    if port == 0:
+        return None
+    try:
+        server = ControlServer(sentry, config, port, os.getenv('CONTROL_ADDRESS', "127.0.0.1"))
+    except OSError as e:
+        print(f"[Control] Could not start the server: {e}")
+        return None
+    server.start()
+    return server
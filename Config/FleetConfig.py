@@ -0,0 +1,88 @@
+import json
+import os
+from dataclasses import dataclass, field
+
+from Config.SentryConfig import ControlConfig, SentryConfig, TrackerConfig, _convert, load_config, update_control, update_tracker
+
+# Cells run by fleetmain.py, from the JSON file at FLEET_CONFIG, e.g.
+#
+#     {"cells": [
+#         {"name": "lobby", "robot_host": "172.22.114.160", "cameras": ["668daa1e019ce603e4002d31"]},
+#         {"name": "lab", "robot_host": "172.22.114.161", "calibration": "lab_cameras.json",
+#          "control": {"base_max_speed": 1.0}, "tracker": {"time_to_live": 0.8}}
+#     ]}
+#
+# A cell follows the camera it lists, or fuses the cameras of its calibration file (see Tracking/CameraFusion.py).
+# Its control and tracker sections override those of the base configuration (SENTRY_CONFIG), which also
+# gives the Unifi addresses shared by the whole fleet.
+# An optional aim_calibration gives the table of its arm (see Tracking/AimCalibration.py).
+
+
+@dataclass(frozen=True)
+class CellConfig:
+    """
+    One robot and the cameras it follows
+    """
+    name: str
+    robot_host: str
+    cameras: tuple = ()
+    calibration: str | None = None
+    control: ControlConfig = field(default_factory=ControlConfig)
+    tracker: TrackerConfig = field(default_factory=TrackerConfig)
+    # Aim calibration table of the robot, see Tracking/AimCalibration.py
+    aim_calibration: str | None = None
+
+
+def cell_from_dict(data: dict, base: ControlConfig, base_tracker: TrackerConfig = TrackerConfig()) -> CellConfig:
+    """
+    :raises ValueError: if a field is missing, unknown or invalid
+    """
+    data = dict(data)
+    for name in ("name", "robot_host"):
+        if not isinstance(data.get(name), str) or not data[name]:
+            raise ValueError(f"Every cell needs a {name}")
+    name = data.pop("name")
+    robot_host = data.pop("robot_host")
+    try:
+        control = update_control(base, data.pop("control", {}))
+        tracker = update_tracker(base_tracker, data.pop("tracker", {}))
+    except ValueError as e:
+        raise ValueError(f"{name}: {e}") from None
+    calibration = data.pop("calibration", None)
+    if calibration is not None:
+        calibration = _convert(f"{name}: calibration", "", calibration)
+    aim_calibration = data.pop("aim_calibration", None)
+    if aim_calibration is not None:
+        aim_calibration = _convert(f"{name}: aim_calibration", "", aim_calibration)
+    cameras = data.pop("cameras", [])
+    if not isinstance(cameras, list) or not all(isinstance(camera, str) for camera in cameras):
+        raise ValueError(f"{name}: cameras must be a list of camera IDs")
+    if data:
+        raise ValueError(f"{name}: unknown cell fields: {', '.join(sorted(data))}")
+    if calibration is None and len(cameras) != 1:
+        raise ValueError(f"{name}: a cell without a calibration file follows exactly one camera")
+    return CellConfig(name, robot_host, tuple(cameras), calibration, control, tracker, aim_calibration)
+
+
+def load_fleet(path: str | None = None, base: SentryConfig | None = None) -> tuple[SentryConfig, list[CellConfig]]:
+    """
+    Loads the cells from the JSON file at `path` (FLEET_CONFIG by default)
+    :return: The base configuration and the cells
+    :raises ValueError: if the file is invalid, or two cells have the same name or robot
+    """
+    path = path if path is not None else os.getenv('FLEET_CONFIG')
+    if not path:
+        raise ValueError("No fleet configuration, set FLEET_CONFIG")
+    if base is None:
+        base = load_config()
+    with open(path) as file:
+        data = json.load(file)
+    if not isinstance(data, dict) or not isinstance(data.get("cells"), list) or not data["cells"]:
+        raise ValueError("The fleet configuration needs a non empty list of cells")
+    cells = [cell_from_dict(cell, base.control, base.tracker) for cell in data["cells"]]
+    for attribute in ("name", "robot_host"):
+        values = [getattr(cell, attribute) for cell in cells]
+        duplicates = sorted({value for value in values if values.count(value) > 1})
+        if duplicates:
+            raise ValueError(f"Several cells have the same {attribute}: {', '.join(duplicates)}")
+    return base, cells
@@ -0,0 +1,211 @@
+import dataclasses
+import json
+import os
+from dataclasses import dataclass, field
+
+# Configuration of the sentry. Defaults are the values the sentry has always used, a JSON file (SENTRY_CONFIG)
+# overrides any of them, and a few environment variables override the addresses, e.g.
+#
+#     {"robot_host": "172.22.114.160", "control": {"base_max_speed": 1.2, "horizontal_dead_zone": 0.08}}
+#
+# The tracker section sets the tracking of the detections (see BBoxProcessor.py), e.g. {"tracker": {"time_to_live": 0.8}}.
+# The control section can be changed while running through the control server (see ControlServer.py).
+# The configs are immutable, an update builds a new one, so readers always see a consistent set of values.
+
+
+@dataclass(frozen=True)
+class ControlConfig:
+    """
+    Tunable parameters of URSentry. Speeds are in rad/s, accelerations in rad/s², angles in radians,
+    except `base_max_angle` which is in degrees, like the base angle it is compared to
+    """
+    # Joystick
+    horizontal_dead_zone: float = 0.05
+    vertical_dead_zone: float = 0.01
+    vertical_clamp: float = 0.5
+
+    # Speed control
+    base_max_speed: float = 1.5
+    base_min_speed: float = 0.0
+    vertical_speed: float = 2.0
+    base_acceleration: float = 1.5
+    speedj_time: float = 1.0
+    # Jerk limited velocity profile of the speedj commands (see Motion/VelocityProfile.py), 0 disables it
+    max_jerk: float = 6.0
+    max_joint_speed: float = 2.0
+    base_max_angle: float = 315.0
+    # With an aim calibration (AIM_CALIBRATION), seconds to complete the move centering the target. A few control
+    # ticks at least, or the arm overshoots
+    calibration_horizon: float = 0.5
+
+    # Stopping
+    smooth_stop_delay: float = 0.4
+    smooth_stop_acceleration: float = 1.5
+    estop_deceleration: float = 3.0
+    await_stop_ticks: int = 6
+    return_to_sentry_ticks: int = 600
+    return_to_sentry_ticks_before_detection: int = 3000
+
+    # Poses, and the movej used to reach them
+    pose_acceleration: float = 0.5
+    pose_speed: float = 1.5
+    awake_acceleration: float = 1.5
+    awake_speed: float = 0.8
+    sentry_pose: tuple = (0.785, -2.094, 0.96, -0.436, -1.571, 1.326)
+    imposing_pose: tuple = (1.571, -1.41, 1.411, -2.859, -1.604, 1.326)
+    looking_down_pose: tuple = (1.571, -2.3, 2.323, -2.452, -1.604, 1.326)
+
+    def validate(self):
+        """
+        :raises ValueError: if a value is out of range
+        """
+        for name in ("horizontal_dead_zone", "vertical_dead_zone", "vertical_clamp"):
+            if not 0 <= getattr(self, name) <= 1:
+                raise ValueError(f"{name} must be between 0 and 1")
+        for name in ("base_max_speed", "base_min_speed", "vertical_speed", "base_acceleration", "speedj_time", "max_jerk", "max_joint_speed",
+                     "smooth_stop_delay", "smooth_stop_acceleration", "estop_deceleration", "pose_acceleration", "pose_speed",
+                     "awake_acceleration", "awake_speed", "await_stop_ticks", "return_to_sentry_ticks",
+                     "return_to_sentry_ticks_before_detection"):
+            if getattr(self, name) < 0:
+                raise ValueError(f"{name} must not be negative")
+        if self.base_min_speed > self.base_max_speed:
+            raise ValueError("base_min_speed must not exceed base_max_speed")
+        if self.calibration_horizon <= 0:
+            raise ValueError("calibration_horizon must be positive")
+        if not 0 < self.base_max_angle < 360:
+            raise ValueError("base_max_angle must be between 0 and 360 degrees")
+
+
+@dataclass(frozen=True)
+class TrackerConfig:
+    """
+    Parameters of the tracker of BBoxProcessor: the largest distance, in image units, between a detection and the
+    track it continues, and the seconds a track survives without detections
+    """
+    dist_threshold: float = 80.0
+    time_to_live: float = 0.5
+
+    def validate(self):
+        """
+        :raises ValueError: if a value is out of range
+        """
+        for name in ("dist_threshold", "time_to_live"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} must be positive")
+
+
+@dataclass(frozen=True)
+class SentryConfig:
+    """
+    Addresses of the robot and of Unifi Protect and the tracker parameters, which need a restart to change, and the
+    control parameters
+    """
+    robot_host: str = "172.22.114.160"
+    unifi_base_url: str = "https://172.22.114.176"
+    unifi_ws_url: str = "wss://172.22.114.176/proxy/protect/ws/liveDetectTrack"
+    unifi_username: str = "engr-ugaif"
+    control: ControlConfig = field(default_factory=ControlConfig)
+    tracker: TrackerConfig = field(default_factory=TrackerConfig)
+
+    def to_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+
+# Environment variables overriding the fields of SentryConfig
+ENVIRONMENT = {
+    "robot_host": "ROBOT_HOST",
+    "unifi_base_url": "UNIFI_BASE_URL",
+    "unifi_ws_url": "UNIFI_WS_URL",
+    "unifi_username": "UNIFI_USERNAME",
+}
+
+
+def _convert(name: str, default, value):
+    """
+    Converts a value to the type of the field's default
+    :raises ValueError: if it can not be converted
+    """
+    if isinstance(default, bool) or isinstance(value, bool):
+        raise ValueError(f"{name}: unsupported value {value!r}")
+    if isinstance(default, int):
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if not isinstance(value, int):
+            raise ValueError(f"{name} must be an integer")
+        return value
+    if isinstance(default, float):
+        if not isinstance(value, (int, float)):
+            raise ValueError(f"{name} must be a number")
+        return float(value)
+    if isinstance(default, str):
+        if not isinstance(value, str):
+            raise ValueError(f"{name} must be a string")
+        return value
+    if isinstance(default, tuple):
+        if not isinstance(value, (list, tuple)) or len(value) != len(default) \
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+            raise ValueError(f"{name} must be a list of {len(default)} numbers")
+        return tuple(float(v) for v in value)
+    raise ValueError(f"{name}: unsupported value {value!r}")
+
+
+def update_control(control: ControlConfig, changes: dict) -> ControlConfig:
+    """
+    :return: A new ControlConfig with the changes applied
+    :raises ValueError: if a field is unknown or a value is invalid
+    """
+    fields = {f.name: getattr(control, f.name) for f in dataclasses.fields(ControlConfig)}
+    unknown = set(changes) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown control parameters: {', '.join(sorted(unknown))}")
+    converted = {name: _convert(name, fields[name], value) for name, value in changes.items()}
+    updated = dataclasses.replace(control, **converted)
+    updated.validate()
+    return updated
+
+
+def update_tracker(tracker: TrackerConfig, changes: dict) -> TrackerConfig:
+    """
+    :return: A new TrackerConfig with the changes applied
+    :raises ValueError: if a field is unknown or a value is invalid
+    """
+    fields = {f.name: getattr(tracker, f.name) for f in dataclasses.fields(TrackerConfig)}
+    unknown = set(changes) - set(fields)
+    if unknown:
+        raise ValueError(f"Unknown tracker parameters: {', '.join(sorted(unknown))}")
+    converted = {name: _convert(name, fields[name], value) for name, value in changes.items()}
+    updated = dataclasses.replace(tracker, **converted)
+    updated.validate()
+    return updated
+
+
+def config_from_dict(data: dict) -> SentryConfig:
+    """
+    :raises ValueError: if a field is unknown or a value is invalid
+    """
+    default = SentryConfig()
+    data = dict(data)
+    control = update_control(default.control, data.pop("control", {}))
+    tracker = update_tracker(default.tracker, data.pop("tracker", {}))
+    known = {f.name for f in dataclasses.fields(SentryConfig)} - {"control", "tracker"}
+    unknown = set(data) - known
+    if unknown:
+        raise ValueError(f"Unknown configuration fields: {', '.join(sorted(unknown))}")
+    converted = {name: _convert(name, getattr(default, name), value) for name, value in data.items()}
+    return dataclasses.replace(default, control=control, tracker=tracker, **converted)
+
+
+def load_config(path: str | None = None) -> SentryConfig:
+    """
+    Loads the configuration from the JSON file at `path` (SENTRY_CONFIG by default, if set), then applies the
+    environment overrides
+    """
+    path = path if path is not None else os.getenv('SENTRY_CONFIG')
+    data = {}
+    if path:
+        with open(path) as file:
+            data = json.load(file)
+    for name, variable in ENVIRONMENT.items():
+        if os.getenv(variable):
+            data[name] = os.getenv(variable)
+    return config_from_dict(data)
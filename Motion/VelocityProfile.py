@@ -0,0 +1,113 @@
+import math
+
+# Online velocity trajectory generator for the speedj commands of URSentry.
+#
+# The joystick gives a new speed setpoint every tick, possibly in the opposite direction. Instead of sending it
+# as is, and letting the robot ramp to it with a constant acceleration, each joint follows it with a bounded
+# velocity, acceleration and jerk. The acceleration is reduced in time to reach the setpoint with no acceleration
+# left, so the joint does not overshoot it, and a reversal goes through a smooth S curve.
+
+
+class JointProfile:
+    """
+    Velocity and acceleration of a single joint, moved towards a velocity setpoint with bounded jerk
+    """
+    __slots__ = ("velocity", "acceleration")
+
+    def __init__(self):
+        self.velocity = 0.0
+        self.acceleration = 0.0
+
+    def step(self, target: float, dt: float, max_velocity: float, max_acceleration: float, max_jerk: float) -> float:
+        """
+        Advances the joint by `dt` seconds towards the target velocity
+        :return: The new velocity
+        """
+        target = max(-max_velocity, min(max_velocity, target))
+        velocity = self.velocity
+        acceleration = self.acceleration
+
+        # Pick the acceleration at the end of the step such that bringing it back to zero at the maximum jerk
+        # right after lands exactly on the target: v + (a + a') dt / 2 + a'|a'| / 2J = target
+        # The left side grows with a', so there is a single solution, on the side given by the sign of c
+        c = velocity + 0.5 * acceleration * dt - target
+        half_dt = 0.5 * dt
+        if c <= 0:
+            new_acceleration = max_jerk * (-half_dt + math.sqrt(half_dt * half_dt - 2 * c / max_jerk))
+        else:
+            new_acceleration = max_jerk * (half_dt - math.sqrt(half_dt * half_dt + 2 * c / max_jerk))
+
+        # Within reach of the jerk and acceleration limits
+        jerk_step = max_jerk * dt
+        new_acceleration = max(acceleration - jerk_step, min(acceleration + jerk_step, new_acceleration))
+        new_acceleration = max(-max_acceleration, min(max_acceleration, new_acceleration))
+
+        new_velocity = velocity + half_dt * (acceleration + new_acceleration)
+        # The braking above is continuous, the steps are not: settle once the rest is within a jerk step, instead
+        # of cycling around the target
+        if abs(acceleration) <= jerk_step and abs(new_acceleration) <= jerk_step \
+                and abs(target - new_velocity) <= 0.5 * jerk_step * dt:
+            new_velocity, new_acceleration = target, 0.0
+        self.velocity = max(-max_velocity, min(max_velocity, new_velocity))
+        self.acceleration = new_acceleration
+        return self.velocity
+
+
+class VelocityProfile:
+    """
+    Jerk limited velocities of the 6 joints, kept across ticks.
+
+    :param max_velocity: Speed limit of every joint, rad/s
+    :param max_acceleration: Acceleration limit of every joint, rad/s²
+    :param max_jerk: Jerk limit of every joint, rad/s³
+    :param period: Expected time between updates, used for the first one. Longer steps are cut to twice the
+                   period, so a late tick does not turn into a large jump
+    """
+
+    def __init__(self, max_velocity: float, max_acceleration: float, max_jerk: float, joints: int = 6,
+                 period: float = 0.1):
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.max_jerk = max_jerk
+        self.period = period
+        self.joints = [JointProfile() for _ in range(joints)]
+        self.last_time = None
+
+    def set_limits(self, max_velocity: float, max_acceleration: float, max_jerk: float):
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+        self.max_jerk = max_jerk
+
+    def update(self, targets, now: float) -> list[float]:
+        """
+        Moves every joint towards its target velocity, by the time elapsed since the previous update
+        :param now: Monotonic time of the update
+        :return: The velocities to command
+        """
+        if self.last_time is None:
+            dt = self.period
+        else:
+            dt = min(max(now - self.last_time, 0.0), 2 * self.period)
+        self.last_time = now
+        if dt == 0:
+            return self.velocities()
+        return [
+            round(joint.step(target, dt, self.max_velocity, self.max_acceleration, self.max_jerk), 5)
+            for joint, target in zip(self.joints, targets)
+        ]
+
+    def velocities(self) -> list[float]:
+        return [round(joint.velocity, 5) for joint in self.joints]
+
+    def at_rest(self) -> bool:
+        return all(joint.velocity == 0 and joint.acceleration == 0 for joint in self.joints)
+
+    def reset(self, velocities=None):
+        """
+        Sets the state of the joints, after the robot was moved or stopped by another command
+        :param velocities: Current joint velocities, all 0 by default
+        """
+        for i, joint in enumerate(self.joints):
+            joint.velocity = velocities[i] if velocities is not None else 0.0
+            joint.acceleration = 0.0
+        self.last_time = None
@@ -0,0 +1,80 @@
+import asyncio
+
+from Robot.UR.URDashboard import RECOVERY_COMMANDS, STATUS_COMMANDS, DashboardError, RobotStatus, URDashboard, parse_status
+
+
+class AsyncURDashboard(URDashboard):
+    """
+    asyncio version of :class:`URDashboard`, to poll the dashboard servers of many robots from one event loop.
+    Commands and answers are the same, status and recover are coroutines.
+    """
+
+    def __init__(self, host: str, port: int = 29999, timeout: float = 1.0):
+        super().__init__(host, port, timeout)
+        self.reader = None
+        self.writer = None
+        # Only one command can wait for its answer on the connection
+        self.lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None
+
+    async def connect(self):
+        """
+        :raises DashboardError: if the server cannot be reached
+        """
+        await self.close()
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+            # "Connected: Universal Robots Dashboard Server"
+            await self._read_line()
+        except (OSError, asyncio.TimeoutError, DashboardError) as e:
+            await self.close()
+            raise DashboardError(f"Could not connect to the dashboard server at {self.host}:{self.port}: "
+                                 f"{e or type(e).__name__}") from e
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = None
+        self.writer = None
+
+    async def _read_line(self) -> str:
+        line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        if not line:
+            raise DashboardError("connection closed")
+        return line.decode(errors="replace").strip()
+
+    async def command(self, command: str) -> str:
+        """
+        Sends a command, connecting first if needed
+        :return: The answer line
+        :raises DashboardError: if the server cannot be reached or does not answer. The connection is then closed
+        """
+        async with self.lock:
+            if self.writer is None:
+                await self.connect()
+            try:
+                self.writer.write(command.encode() + b"\n")
+                await self.writer.drain()
+                return await self._read_line()
+            except (OSError, asyncio.TimeoutError, DashboardError) as e:
+                await self.close()
+                raise DashboardError(f"{command}: {e or type(e).__name__}") from e
+
+    async def status(self) -> RobotStatus:
+        return parse_status([await self.command(command) for command in STATUS_COMMANDS])
+
+    async def recover(self, action: str) -> bool:
+        """
+        :param action: One of the actions of RECOVERY_ACTIONS
+        :return: True if the controller accepted it
+        """
+        commands, accepted = RECOVERY_COMMANDS[action]
+        answers = [await self.command(command) for command in commands]
+        return answers[-1].startswith(accepted)
@@ -0,0 +1,214 @@
+import asyncio
+import math
+import time
+
+from Communication.AsyncModbusTCP import AsyncModbusTCP
+from Communication.AsyncSocketConnection import AsyncSocketConnection
+from Robot.UR.URModbusServer import URModbusServer, ModbusError, modbus_request_seconds, modbus_failures_total
+from Robot.UR.URRobot import scripts_sent_total, script_errors_total
+from Robot.UR.URScript import URScript
+from Telemetry.ModbusStats import modbus_stats
+
+
+class AsyncURRobot:
+    """
+    Interface for communicating with the UR Robot from an asyncio event loop.
+
+    It has the same command and query methods as :class:`URRobot`, so :class:`URSentry` can use it unchanged,
+    but none of them block:
+    - Commands (movej, speedj, stopj...) are queued, and sent on the secondary port by the `run` task.
+    - Queries (joint angles and speeds) return the state read by `poll_state`, which reads it over async Modbus.
+      If the state is older than `max_state_age`, a ModbusError is raised like a failed read would.
+    """
+
+    def __init__(self, host, max_state_age=0.5, timeout=1.0, modbus: AsyncModbusTCP | None = None):
+        """
+        :param modbus: Shared Modbus client of the robot (see ModbusClientPool), which is then left open by close()
+        """
+        self.host = host
+        self.secondaryPort = 30002
+        self.secondaryInterface = AsyncSocketConnection(host, self.secondaryPort, timeout)
+        self.owns_modbus = modbus is None
+        if modbus is None:
+            modbus = AsyncModbusTCP(host, 502, timeout)
+            modbus.add_hook(modbus_stats)
+        self.modbusTCP = modbus
+        self.max_state_age = max_state_age
+
+        self.joint_angles = None
+        self.joint_speeds = None
+        self.state_time = None
+        self.poll_failures = 0
+
+        self.outbox = asyncio.Queue()
+        self.scripts_sent = 0
+        # Set by emergency_stop, every other script is dropped until clear_emergency_stop
+        self.estopped = False
+        self.loop = None
+        self._estop_task = None
+
+    # Commands
+
+    def movel(self, pose, a=0.1, v=0.1, joint_p=False):
+        return self._send_script(URScript.movel(pose, a, v, joint_p=joint_p).encode())
+
+    def movej(self, q, a=0.1, v=0.1, joint_p=True):
+        return self._send_script(URScript.movej(q, a, v, joint_p=joint_p).encode())
+
+    def speedj(self, qd, a=0.5, t=0):
+        return self._send_script(URScript.speedj(qd, a, t).encode())
+
+    def stopj(self, a=1.5):
+        return self._send_script(URScript.stopj(a).encode())
+
+    def emergency_stop(self, a=3.0, on_sent=None):
+        """Sends stopj ahead of the queued scripts, which are dropped, and drops every other script until
+        clear_emergency_stop. Can be called from any thread, once the `run` task has started
+
+        :param a: joint deceleration [rad/s^2]
+        :param on_sent: Called on the event loop with True once the stopj is written to the socket,
+                        or False if it could not be
+        """
+        self.estopped = True
+        script = URScript.stopj(a).encode()
+        if self.loop is None or self.loop.is_closed():
+            script_errors_total.inc()
+            if on_sent is not None:
+                on_sent(False)
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._start_emergency_stop(script, on_sent)
+        else:
+            self.loop.call_soon_threadsafe(self._start_emergency_stop, script, on_sent)
+
+    def _start_emergency_stop(self, script, on_sent):
+        while not self.outbox.empty():
+            self.outbox.get_nowait()
+            self.outbox.task_done()
+        self._estop_task = self.loop.create_task(self._send_now(script))
+        if on_sent is not None:
+            self._estop_task.add_done_callback(lambda task: on_sent(task.result()))
+
+    async def _send_now(self, script) -> bool:
+        try:
+            if not self.secondaryInterface.opened and not await self.secondaryInterface.connect():
+                script_errors_total.inc()
+                return False
+            await self.secondaryInterface.send(script)
+        except (OSError, RuntimeError) as error:
+            print("OS error: {0}".format(error))
+            script_errors_total.inc()
+            await self.secondaryInterface.disconnect()
+            return False
+        self.scripts_sent += 1
+        scripts_sent_total.inc()
+        return True
+
+    def clear_emergency_stop(self):
+        self.estopped = False
+
+    def _send_script(self, _script):
+        """ Queue URScript to be sent to the UR controller
+
+        :return: True if the script is queued, False while the e-stop is latched
+        """
+        if self.estopped:
+            return False
+        self.outbox.put_nowait(_script)
+        return True
+
+    async def run(self):
+        """
+        Sends the queued scripts, reconnecting whenever the connection drops
+        """
+        self.loop = asyncio.get_running_loop()
+        while True:
+            script = await self.outbox.get()
+            if self.estopped:
+                self.outbox.task_done()
+                continue
+            try:
+                if not self.secondaryInterface.opened and not await self.secondaryInterface.connect():
+                    # The script is dropped, like URRobot does when the socket is down
+                    script_errors_total.inc()
+                    await asyncio.sleep(0.1)
+                    continue
+                await self.secondaryInterface.send(script)
+                self.scripts_sent += 1
+                scripts_sent_total.inc()
+            except (OSError, RuntimeError) as error:
+                print("OS error: {0}".format(error))
+                script_errors_total.inc()
+                await self.secondaryInterface.disconnect()
+            finally:
+                self.outbox.task_done()
+
+    async def close(self):
+        await self.secondaryInterface.disconnect()
+        if self.owns_modbus:
+            await self.modbusTCP.close()
+
+    # Queries
+
+    async def _read(self, reg_address, quantity):
+        start = time.perf_counter()
+        packet = await self.modbusTCP.read_holding_registers(reg_address, quantity=quantity)
+        modbus_request_seconds.observe(time.perf_counter() - start, register=str(reg_address))
+        if packet is None:
+            modbus_failures_total.inc(register=str(reg_address))
+        return packet
+
+    async def read_joint_angles(self):
+        packet = await self._read(270, 6)
+        packet_signs = await self._read(320, 6)
+        if (packet is None) or (packet_signs is None):
+            return None
+        return tuple(
+            URModbusServer._format_sign(packet[i:i + 2], packet_signs[i:i + 2]) for i in range(9, 21, 2)
+        )
+
+    async def read_joint_speeds(self):
+        packet = await self._read(280, 6)
+        if packet is None:
+            return None
+        return tuple(URModbusServer._format(packet[i:i + 2]) / 1000 for i in range(9, 21, 2))
+
+    async def poll_state(self) -> bool:
+        """
+        Reads joint angles and speeds, keeping the previous state if a read fails
+        :return: True if the state was updated
+        """
+        angles = await self.read_joint_angles()
+        speeds = await self.read_joint_speeds()
+        if angles is None or speeds is None:
+            self.poll_failures += 1
+            return False
+        self.joint_angles = angles
+        self.joint_speeds = speeds
+        self.state_time = time.monotonic()
+        return True
+
+    def _check_state(self, name):
+        if self.state_time is None or time.monotonic() - self.state_time > self.max_state_age:
+            raise ModbusError(f"[{name}] Modbus Error: no recent state")
+
+    def get_joint_angles(self):
+        self._check_state("Angles")
+        return self.joint_angles
+
+    def last_joint_state(self):
+        """
+        Joint angles and speeds from the last poll, however old
+        """
+        return self.joint_angles, self.joint_speeds
+
+    def get_joint_angles_degrees(self):
+        return tuple([round(math.degrees(angle), 3) for angle in self.get_joint_angles()])
+
+    def get_joint_speeds(self):
+        self._check_state("Speeds")
+        return self.joint_speeds
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import threading
+import time
+
+from Robot.UR.AsyncURDashboard import AsyncURDashboard
+from Robot.UR.URDashboard import FAULTS, POWER_ACTIONS, PROTECTIVE_STOP_HOLD, RECOVERY_ACTIONS, DashboardError, RobotStatus, URDashboard
+from Telemetry.Metrics import metrics
+
+robot_fault = metrics.gauge("sentry_robot_fault", "1 for the fault reported by the dashboard server, 0 for the others")
+robot_faults_total = metrics.counter("sentry_robot_faults_total", "Faults detected through the dashboard server")
+robot_recoveries_total = metrics.counter("sentry_robot_recoveries_total", "Automatic recovery actions sent to the dashboard server, by action and result")
+dashboard_up = metrics.gauge("sentry_dashboard_up", "1 while the dashboard server answers")
+
+
+class DashboardMonitor:
+    """
+    Polls the robot mode, safety status and program state on a background thread, classifies what keeps the arm
+    from moving (see RobotStatus.fault), and recovers on its own from the faults that allow it: it unlocks protective
+    stops once the controller allows it, and stops a paused program. Powering the arm on and releasing its brakes
+    moves it, so they are only sent if `power_recovery` is set.
+    E-stops, safeguard stops, safety faults and local control are left to an operator, who also powers the arm back
+    on after them.
+
+    URSentry reads `fault` on every tick and holds the arm while it is set.
+    With an AsyncURDashboard, the monitor runs as the run_async task of an event loop instead of a thread, so a fleet
+    polls all its robots from its loop.
+
+    :param dashboard: Client of the dashboard server, a URDashboard for the thread or an AsyncURDashboard
+    :param period: Seconds between two polls
+    :param auto_recover: Send the recovery actions, otherwise only report the faults
+    :param power_recovery: Also power the arm on and release its brakes
+    :param recovery_interval: Seconds between two recovery attempts for the same fault
+    :param max_recoveries: Attempts for a single fault, before waiting for an operator
+    :param labels: Labels of the metrics, e.g. the cell of a fleet
+    """
+
+    def __init__(self, dashboard: URDashboard, period: float = 0.1, auto_recover: bool = True,
+                 power_recovery: bool = False, recovery_interval: float = 5.0, max_recoveries: int = 3,
+                 labels: dict | None = None):
+        self.dashboard = dashboard
+        self.period = period
+        self.auto_recover = auto_recover
+        self.power_recovery = power_recovery
+        self.recovery_interval = recovery_interval
+        self.max_recoveries = max_recoveries
+        self.labels = labels or {}
+
+        self.status: RobotStatus | None = None
+        self.fault = None
+        self.fault_since = None
+        self.reachable = None
+        self.error = None
+        self.recoveries = 0
+        self.last_recovery = None
+        self.last_recovery_result = None
+        # Last fault that needed an operator, until the arm runs again
+        self.operator_fault = None
+        self.polls = 0
+        self.poll_time = 0.0
+        self.listeners = []
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="dashboard-monitor", daemon=True)
+
+    def add_listener(self, listener):
+        """
+        :param listener: listener(fault, status) is called from the monitor thread when the fault changes
+        """
+        self.listeners.append(listener)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.dashboard.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.poll()
+            # Back off while the server does not answer
+            self._stopped.wait(self.period if self.reachable else max(self.period, 1.0))
+
+    async def run_async(self):
+        """
+        Polls until cancelled, then closes the connection
+        """
+        try:
+            while True:
+                await self.poll_async()
+                await asyncio.sleep(self.period if self.reachable else max(self.period, 1.0))
+        finally:
+            await self.dashboard.close()
+
+    def poll(self) -> RobotStatus | None:
+        """
+        Reads the status once, and recovers from the fault if possible
+        :return: The status, or None if the dashboard server did not answer
+        """
+        start = time.perf_counter()
+        try:
+            status = self.dashboard.status()
+        except DashboardError as e:
+            self._unreachable(e)
+            return None
+        self._update(status, time.perf_counter() - start)
+        action = self._recovery_action()
+        if action is not None:
+            try:
+                accepted = self.dashboard.recover(action)
+            except DashboardError as e:
+                print(f"[Dashboard] {action} failed: {e}")
+                accepted = False
+            self._recovered(action, accepted)
+        return status
+
+    async def poll_async(self) -> RobotStatus | None:
+        """
+        Same as poll, with an AsyncURDashboard
+        """
+        start = time.perf_counter()
+        try:
+            status = await self.dashboard.status()
+        except DashboardError as e:
+            self._unreachable(e)
+            return None
+        self._update(status, time.perf_counter() - start)
+        action = self._recovery_action()
+        if action is not None:
+            try:
+                accepted = await self.dashboard.recover(action)
+            except DashboardError as e:
+                print(f"[Dashboard] {action} failed: {e}")
+                accepted = False
+            self._recovered(action, accepted)
+        return status
+
+    def _unreachable(self, error: DashboardError):
+        if self.reachable is not False:
+            print(f"[Dashboard] {error}")
+        self.reachable = False
+        self.error = str(error)
+        dashboard_up.set(0, **self.labels)
+
+    def _update(self, status: RobotStatus, poll_time: float):
+        self.poll_time = poll_time
+        self.polls += 1
+        if not self.reachable:
+            print(f"[Dashboard] Connected to {self.dashboard.host}:{self.dashboard.port}")
+        self.reachable = True
+        self.error = None
+        dashboard_up.set(1, **self.labels)
+
+        self.status = status
+        fault = status.fault()
+        if fault != self.fault:
+            self._set_fault(fault, status)
+
+    def _set_fault(self, fault: str | None, status: RobotStatus):
+        previous = self.fault
+        self.fault = fault
+        self.fault_since = time.monotonic() if fault is not None else None
+        self.recoveries = 0
+        self.last_recovery = None
+        if fault is None:
+            self.operator_fault = None
+        elif RECOVERY_ACTIONS[fault] is None:
+            self.operator_fault = fault
+        for name in FAULTS:
+            robot_fault.set(1 if name == fault else 0, fault=name, **self.labels)
+        if fault is not None:
+            robot_faults_total.inc(fault=fault, **self.labels)
+            print(f"[Dashboard] Robot fault: {fault} (mode {status.robot_mode}, safety {status.safety_status}, "
+                  f"program {status.program_state})")
+        else:
+            print(f"[Dashboard] Robot recovered from {previous}")
+        for listener in self.listeners:
+            listener(fault, status)
+
+    def _recovery_action(self) -> str | None:
+        """
+        :return: The recovery action to send now for the current fault, if any. It counts as an attempt
+        """
+        fault = self.fault
+        if fault is None or not self.auto_recover:
+            return None
+        action = RECOVERY_ACTIONS[fault]
+        if action is None or self.recoveries >= self.max_recoveries:
+            return None
+        if action in POWER_ACTIONS and (not self.power_recovery or self.operator_fault is not None):
+            return None
+        now = time.monotonic()
+        if fault == "protective_stop" and now - self.fault_since < PROTECTIVE_STOP_HOLD:
+            return None
+        if self.last_recovery is not None and now - self.last_recovery < self.recovery_interval:
+            return None
+        self.recoveries += 1
+        self.last_recovery = now
+        return action
+
+    def _recovered(self, action: str, accepted: bool):
+        self.last_recovery_result = f"{action}: {'accepted' if accepted else 'refused'}"
+        robot_recoveries_total.inc(action=action, result="accepted" if accepted else "refused", **self.labels)
+        print(f"[Dashboard] Recovering from {self.fault}, {self.last_recovery_result} "
+              f"(attempt {self.recoveries}/{self.max_recoveries})")
+
+    def describe(self) -> str:
+        if not self.reachable:
+            return f"dashboard server unreachable ({self.error})"
+        if self.fault is None:
+            return "no fault"
+        return f"{self.fault} for {time.monotonic() - self.fault_since:.1f}s"
+
+    def get_metrics(self) -> dict:
+        return {
+            "reachable": self.reachable,
+            "error": self.error,
+            "status": self.status.to_dict() if self.status is not None else None,
+            "fault": self.fault,
+            "fault_for_s": round(time.monotonic() - self.fault_since, 3) if self.fault_since is not None else None,
+            "recoveries": self.recoveries,
+            "operator_fault": self.operator_fault,
+            "last_recovery": self.last_recovery_result,
+            "polls": self.polls,
+            "poll_ms": round(self.poll_time * 1000, 3),
+        }
+
+
+def start_dashboard_monitor(host: str, labels: dict | None = None, asynchronous: bool = False) -> DashboardMonitor | None:
+    """
+    Starts monitoring the dashboard server of the robot at host:DASHBOARD_PORT (29999 by default), every
+    DASHBOARD_PERIOD seconds (0.1 by default). Setting DASHBOARD_PORT to 0 disables it, DASHBOARD_AUTO_RECOVER=0
+    only reports the faults, and DASHBOARD_POWER_RECOVERY=1 also lets it power the arm on and release the brakes
+    :param asynchronous: Use an AsyncURDashboard and leave the monitor to the caller, who runs its run_async task
+        on the event loop, instead of starting its thread
+    :return: The running monitor, or None if it is disabled
+    """
+    port = int(os.getenv('DASHBOARD_PORT', '29999'))
+    if port == 0:
+        return None
+    dashboard = AsyncURDashboard(host, port) if asynchronous else URDashboard(host, port)
+    monitor = DashboardMonitor(dashboard, float(os.getenv('DASHBOARD_PERIOD', '0.1')),
+                               os.getenv('DASHBOARD_AUTO_RECOVER', '1') != '0',
+                               os.getenv('DASHBOARD_POWER_RECOVERY', '0') == '1', labels=labels)
+    if not asynchronous:
+        monitor.start()
+    return monitor
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from Telemetry.Metrics import metrics
+
+ESTOP_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+estop_latency_seconds = metrics.histogram("sentry_estop_latency_seconds", "Time from an e-stop trigger until its stopj is sent", ESTOP_BUCKETS)
+estops_total = metrics.counter("sentry_estops_total", "E-stops triggered")
+estop_latched = metrics.gauge("sentry_estop_latched", "1 while the e-stop is latched")
+
+
+class EmergencyStop:
+    """
+    Latching stop of the robot, which can be triggered from any thread.
+
+    The robot interface sends stopj ahead of anything it has queued, without waiting for the control loop, and drops
+    every other command until the e-stop is reset. The latency from the trigger until the stopj is written to the
+    socket is recorded for each trigger.
+
+    :param robot: URRobot, AsyncURRobot or FakeURRobot, anything with `emergency_stop` and `clear_emergency_stop`
+    """
+
+    def __init__(self, robot):
+        self.robot = robot
+        self._latched = threading.Event()
+        self._lock = threading.Lock()
+        self.reason = None
+        self.triggered_at = None
+        self.triggers = 0
+        self.last_latency = None
+        self.last_sent = None
+
+    @property
+    def latched(self) -> bool:
+        return self._latched.is_set()
+
+    def trigger(self, reason: str = "manual", deceleration: float = 3.0):
+        """
+        Latches the e-stop and stops the arm. Triggering it again while latched sends stopj again
+        :param deceleration: Joint deceleration of the stopj in rad/s²
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if not self._latched.is_set():
+                self.reason = reason
+                self.triggered_at = time.time()
+                self._latched.set()
+            self.triggers += 1
+        estops_total.inc()
+        estop_latched.set(1)
+
+        def on_sent(sent: bool):
+            latency = time.perf_counter() - start
+            self.last_latency = latency
+            self.last_sent = sent
+            if sent:
+                estop_latency_seconds.observe(latency)
+            print(f"[E-stop] {reason}: stopj {'sent' if sent else 'NOT SENT'} after {latency * 1000:.2f}ms")
+
+        self.robot.emergency_stop(deceleration, on_sent)
+
+    def reset(self) -> bool:
+        """
+        Unlatches the e-stop, so the robot accepts commands again
+        :return: False if it was not latched
+        """
+        with self._lock:
+            if not self._latched.is_set():
+                return False
+            self.robot.clear_emergency_stop()
+            self._latched.clear()
+            self.reason = None
+        estop_latched.set(0)
+        print("[E-stop] Reset")
+        return True
+
+    def status(self) -> dict:
+        return {
+            "latched": self.latched,
+            "reason": self.reason,
+            "triggered_at": self.triggered_at,
+            "triggers": self.triggers,
+            "last_latency_ms": round(self.last_latency * 1000, 3) if self.last_latency is not None else None,
+            "last_sent": self.last_sent,
+        }
@@ -0,0 +1,171 @@
+import argparse
+import socketserver
+import sys
+import threading
+import time
+
+from Robot.UR.URDashboard import PROTECTIVE_STOP_HOLD
+
+# Local stand-in for the dashboard server of the robot controller, to try the DashboardMonitor without a robot:
+#
+#     python -m Robot.UR.FakeDashboardServer --port 29999
+#
+# Faults are injected by typing their name on stdin (protective_stop, emergency_stop, release_emergency_stop,
+# safeguard_stop, release_safeguard_stop, power_off, local_control, remote_control, pause), and the server follows
+# the recovery commands like the controller does, with the same rules: a protective stop cannot be unlocked in its
+# first 5 seconds, and power on and brake release take a moment.
+
+
+class FakeDashboardServer:
+    """
+    :param power_delay: Seconds from power on to IDLE, and from brake release to RUNNING
+    """
+
+    def __init__(self, address: str = "127.0.0.1", port: int = 29999, power_delay: float = 0.5):
+        self.power_delay = power_delay
+        self.lock = threading.Lock()
+        self.robot_mode = "RUNNING"
+        self.safety_status = "NORMAL"
+        self.program_state = "PLAYING"
+        self.remote_control = True
+        self.protective_stop_time = None
+        # (mode, time) the robot mode changes to once the time has passed
+        self.pending_mode = None
+        self.commands = {}
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                self.wfile.write(b"Connected: Universal Robots Dashboard Server\n")
+                for line in self.rfile:
+                    command = line.decode(errors="replace").strip()
+                    if command in ("quit", "close"):
+                        self.wfile.write(b"Disconnected\n")
+                        return
+                    self.wfile.write(server.answer(command).encode() + b"\n")
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-dashboard", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print(f"[FakeDashboard] Serving on {self.server.server_address[0]}:{self.server.server_address[1]}")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _update(self):
+        if self.pending_mode is not None and time.monotonic() >= self.pending_mode[1]:
+            self.robot_mode = self.pending_mode[0]
+            self.pending_mode = None
+
+    def answer(self, command: str) -> str:
+        with self.lock:
+            self._update()
+            self.commands[command] = self.commands.get(command, 0) + 1
+            if command == "robotmode":
+                return f"Robotmode: {self.robot_mode}"
+            if command == "safetystatus":
+                return f"Safetystatus: {self.safety_status}"
+            if command == "programState":
+                return f"{self.program_state} sentry.urp"
+            if command == "is in remote control":
+                return "true" if self.remote_control else "false"
+            if command == "close safety popup":
+                return "closing safety popup"
+            if command == "unlock protective stop":
+                if self.safety_status != "PROTECTIVE_STOP":
+                    return "Cannot unlock protective stop, robot is not in protective stop"
+                if time.monotonic() - self.protective_stop_time < PROTECTIVE_STOP_HOLD:
+                    return "Cannot unlock protective stop until 5s after occurrence. " \
+                           "Always inspect cause of protective stop before unlocking"
+                self.safety_status = "NORMAL"
+                return "Protective stop releasing"
+            if not self.remote_control and command in ("power on", "brake release", "play", "stop", "pause"):
+                return "Command is not allowed due to safety reasons"
+            if command == "power on":
+                if self.robot_mode == "POWER_OFF":
+                    self.robot_mode = "POWER_ON"
+                    self.pending_mode = ("IDLE", time.monotonic() + self.power_delay)
+                return "Powering on"
+            if command == "power off":
+                self._power_off()
+                return "Powering off"
+            if command == "brake release":
+                if self.robot_mode == "POWER_OFF":
+                    self.robot_mode = "POWER_ON"
+                self.pending_mode = ("RUNNING", time.monotonic() + self.power_delay)
+                return "Brake releasing"
+            if command == "stop":
+                self.program_state = "STOPPED"
+                return "Stopped"
+            if command == "pause":
+                self.program_state = "PAUSED"
+                return "Pausing program"
+            if command == "play":
+                self.program_state = "PLAYING"
+                return "Starting program"
+            return f"could not understand: '{command}'"
+
+    def _power_off(self):
+        self.robot_mode = "POWER_OFF"
+        self.program_state = "STOPPED"
+        self.pending_mode = None
+
+    # Faults
+
+    def inject(self, fault: str):
+        """
+        :param fault: One of the names listed at the top of this file
+        """
+        with self.lock:
+            if fault == "protective_stop":
+                self.safety_status = "PROTECTIVE_STOP"
+                self.protective_stop_time = time.monotonic()
+            elif fault == "emergency_stop":
+                self.safety_status = "ROBOT_EMERGENCY_STOP"
+                self._power_off()
+            elif fault == "release_emergency_stop":
+                # Releasing the button leaves the arm powered off
+                self.safety_status = "NORMAL"
+            elif fault == "safeguard_stop":
+                self.safety_status = "SAFEGUARD_STOP"
+            elif fault == "release_safeguard_stop":
+                self.safety_status = "NORMAL"
+            elif fault == "power_off":
+                self._power_off()
+            elif fault == "local_control":
+                self.remote_control = False
+            elif fault == "remote_control":
+                self.remote_control = True
+            elif fault == "pause":
+                self.program_state = "PAUSED"
+            else:
+                raise ValueError(f"unknown fault {fault}")
+        print(f"[FakeDashboard] {fault}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in for the dashboard server of a UR controller")
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=29999)
+    parser.add_argument("--power-delay", type=float, default=0.5, help="Seconds to power on and to release the brakes")
+    args = parser.parse_args()
+
+    fake = FakeDashboardServer(args.address, args.port, args.power_delay)
+    fake.start()
+    try:
+        for line in sys.stdin:
+            if line.strip():
+                try:
+                    fake.inject(line.strip())
+                except ValueError as e:
+                    print(e)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
@@ -0,0 +1,161 @@
+import math
+
+from Timing.Clock import Clock, system_clock
+
+
+class FakeURRobot:
+    """
+    Simulated UR robot with the command and query methods of :class:`URRobot`, so :class:`URSentry` can drive it
+    without hardware. The joints are integrated on demand, from the time of the clock, so with a VirtualClock
+    hours of motion cost nothing more than the queries made.
+
+    Simplified motion model:
+    - movej moves every joint in a straight line at constant speed, so that they all arrive together, with the
+      fastest joint at `v`. Acceleration is ignored.
+    - speedj ramps each joint towards its target speed at `a`, and back to 0 once `t` seconds have passed.
+    - stopj ramps every joint to 0 at `a`.
+    Speeds are reported rounded to 1/1000 rad/s, like the Modbus registers of the real robot.
+    """
+
+    def __init__(self, clock: Clock = system_clock, joint_angles=(0.785, -2.094, 0.96, -0.436, -1.571, 1.326),
+                 step: float = 0.01):
+        """
+        :param clock: Time source
+        :param joint_angles: Initial joint angles, in radians
+        :param step: Longest integration step, in seconds
+        """
+        self.clock = clock
+        self.step = step
+        self.angles = list(joint_angles)
+        self.speeds = [0.0] * 6
+        self.last_update = clock.monotonic()
+
+        # Current motion: None, "move" or "speed"
+        self.mode = None
+        self.move_target = None
+        self.move_speeds = None
+        self.target_speeds = [0.0] * 6
+        self.acceleration = 0.0
+        self.speed_deadline = None
+
+        self.commands = {"movej": 0, "movel": 0, "speedj": 0, "stopj": 0}
+        self.estopped = False
+
+    # Commands
+
+    def movej(self, q, a=0.1, v=0.1, joint_p=True):
+        self._update()
+        if self.estopped:
+            return False
+        self.commands["movej"] += 1
+        distance = max(abs(target - angle) for target, angle in zip(q, self.angles))
+        if distance == 0:
+            self._halt()
+            return True
+        duration = distance / v
+        self.mode = "move"
+        self.move_target = list(q)
+        self.move_speeds = [(target - angle) / duration for target, angle in zip(q, self.angles)]
+        self.speeds = list(self.move_speeds)
+        return True
+
+    def movel(self, pose, a=0.1, v=0.1, joint_p=False):
+        # Tool space motion is not simulated, only joint space poses are followed
+        if self.estopped:
+            return False
+        self.commands["movel"] += 1
+        if joint_p:
+            return self.movej(pose, a, v)
+        return True
+
+    def speedj(self, qd, a=0.5, t=0):
+        self._update()
+        if self.estopped:
+            return False
+        self.commands["speedj"] += 1
+        self.mode = "speed"
+        self.target_speeds = list(qd)
+        self.acceleration = a
+        self.speed_deadline = self.clock.monotonic() + t if t > 0 else None
+        return True
+
+    def stopj(self, a=1.5):
+        self._update()
+        self.commands["stopj"] += 1
+        if self.mode == "move":
+            self.speeds = list(self.move_speeds)
+        self.mode = "speed"
+        self.target_speeds = [0.0] * 6
+        self.acceleration = a
+        self.speed_deadline = None
+        return True
+
+    def emergency_stop(self, a=3.0, on_sent=None):
+        self.estopped = True
+        self.stopj(a)
+        if on_sent is not None:
+            on_sent(True)
+        return True
+
+    def clear_emergency_stop(self):
+        self.estopped = False
+
+    # Queries
+
+    def get_joint_angles(self):
+        self._update()
+        return tuple(self.angles)
+
+    def last_joint_state(self):
+        return tuple(self.angles), tuple(self.speeds)
+
+    def get_joint_angles_degrees(self):
+        return tuple([round(math.degrees(angle), 3) for angle in self.get_joint_angles()])
+
+    def get_joint_speeds(self):
+        self._update()
+        return tuple(round(speed, 3) + 0.0 for speed in self.speeds)
+
+    # Simulation
+
+    def _halt(self):
+        self.mode = None
+        self.speeds = [0.0] * 6
+
+    def _update(self):
+        now = self.clock.monotonic()
+        while self.last_update < now and self.mode is not None:
+            dt = min(self.step, now - self.last_update)
+            self._advance(dt)
+            self.last_update += dt
+        self.last_update = now
+
+    def _advance(self, dt: float):
+        if self.mode == "move":
+            arrived = True
+            for i in range(6):
+                remaining = self.move_target[i] - self.angles[i]
+                movement = self.move_speeds[i] * dt
+                if abs(movement) >= abs(remaining):
+                    self.angles[i] = self.move_target[i]
+                    self.speeds[i] = 0.0
+                else:
+                    self.angles[i] += movement
+                    arrived = False
+            if arrived:
+                self._halt()
+            return
+
+        if self.speed_deadline is not None and self.last_update + dt >= self.speed_deadline:
+            self.target_speeds = [0.0] * 6
+            self.speed_deadline = None
+        change = self.acceleration * dt
+        for i in range(6):
+            difference = self.target_speeds[i] - self.speeds[i]
+            if abs(difference) <= change:
+                self.speeds[i] = self.target_speeds[i]
+            else:
+                self.speeds[i] += math.copysign(change, difference)
+            self.angles[i] += self.speeds[i] * dt
+        if all(speed == 0 for speed in self.speeds) and all(target == 0 for target in self.target_speeds):
+            self._halt()
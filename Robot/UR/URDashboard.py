@@ -0,0 +1,250 @@
+import socket
+import threading
+import time
+
+# Client of the dashboard server of the robot controller (port 29999), a line based text protocol:
+#
+#     robotmode            -> "Robotmode: RUNNING"
+#     safetystatus         -> "Safetystatus: PROTECTIVE_STOP"
+#     programState         -> "PLAYING sentry.urp"
+#     is in remote control -> "true"
+#
+# Unlike the Modbus registers, it tells why the robot does not move: protective stop, e-stop, power off, brakes...
+# Each command takes a few milliseconds.
+
+# Robot modes
+RUNNING = "RUNNING"
+POWER_OFF = "POWER_OFF"
+POWER_ON = "POWER_ON"
+IDLE = "IDLE"
+BOOTING = "BOOTING"
+
+# Safety statuses where the arm can move
+SAFE_STATUSES = ("NORMAL", "REDUCED")
+EMERGENCY_STOPS = ("ROBOT_EMERGENCY_STOP", "SYSTEM_EMERGENCY_STOP")
+SAFEGUARD_STOPS = ("SAFEGUARD_STOP", "AUTOMATIC_MODE_SAFEGUARD_STOP", "SYSTEM_THREE_POSITION_ENABLING_STOP")
+
+# Faults, from the most to the least severe, and the action recovering from them (None needs an operator)
+RECOVERY_ACTIONS = {
+    "emergency_stop": None,
+    "safety_fault": None,
+    "safeguard_stop": None,
+    "local_control": None,
+    "protective_stop": "unlock_protective_stop",
+    "powered_off": "power_on",
+    "brakes_locked": "brake_release",
+    "program_paused": "stop",
+    "booting": None,
+}
+FAULTS = tuple(RECOVERY_ACTIONS)
+# Recovery actions that set the arm in motion, only sent when explicitly enabled
+POWER_ACTIONS = ("power_on", "brake_release")
+
+# The controller refuses to unlock a protective stop earlier than this after it happened
+PROTECTIVE_STOP_HOLD = 5.0
+
+# Commands of RobotStatus, in the order of parse_status
+STATUS_COMMANDS = ("robotmode", "safetystatus", "programState", "is in remote control")
+# Commands sent by each recovery action, and the start of the last answer when the controller accepts it
+RECOVERY_COMMANDS = {
+    "unlock_protective_stop": (("close safety popup", "unlock protective stop"), "Protective stop releasing"),
+    "power_on": (("power on",), "Powering on"),
+    "brake_release": (("brake release",), "Brake releasing"),
+    "stop": (("stop",), "Stopped"),
+}
+
+
+class DashboardError(Exception):
+    pass
+
+
+class RobotStatus:
+    """
+    Answers of the dashboard server at one point in time
+    """
+    __slots__ = ("robot_mode", "safety_status", "program_state", "remote_control", "time")
+
+    def __init__(self, robot_mode: str, safety_status: str, program_state: str, remote_control: bool | None,
+                 time: float):
+        self.robot_mode = robot_mode
+        self.safety_status = safety_status
+        self.program_state = program_state
+        self.remote_control = remote_control
+        self.time = time
+
+    def fault(self) -> str | None:
+        """
+        :return: The fault keeping the arm from moving, one of FAULTS, or None if it can move
+        """
+        if self.safety_status in EMERGENCY_STOPS:
+            return "emergency_stop"
+        if self.safety_status in ("VIOLATION", "FAULT"):
+            return "safety_fault"
+        if self.safety_status in SAFEGUARD_STOPS:
+            return "safeguard_stop"
+        if self.remote_control is False:
+            return "local_control"
+        if self.safety_status == "PROTECTIVE_STOP":
+            return "protective_stop"
+        if self.safety_status not in SAFE_STATUSES:
+            # RECOVERY: a joint is outside its limits and must be moved back by hand
+            return "safety_fault"
+        if self.robot_mode == POWER_OFF:
+            return "powered_off"
+        if self.robot_mode in (POWER_ON, IDLE):
+            return "brakes_locked"
+        if self.robot_mode != RUNNING:
+            return "booting"
+        if self.program_state == "PAUSED":
+            return "program_paused"
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "robot_mode": self.robot_mode,
+            "safety_status": self.safety_status,
+            "program_state": self.program_state,
+            "remote_control": self.remote_control,
+            "time": self.time,
+            "fault": self.fault(),
+        }
+
+
+def parse_robot_mode(answer: str) -> str:
+    # "Robotmode: RUNNING"
+    return answer.split(":", 1)[-1].strip()
+
+
+def parse_safety_status(answer: str) -> str:
+    # "Safetystatus: NORMAL", or "Safetymode: NORMAL" on older controllers
+    return answer.split(":", 1)[-1].strip()
+
+
+def parse_program_state(answer: str) -> str:
+    # "STOPPED <unnamed>"
+    return answer.split(" ", 1)[0]
+
+
+def parse_remote_control(answer: str) -> bool | None:
+    """
+    :return: None if the controller does not know the command (CB3 robots)
+    """
+    answer = answer.lower()
+    if answer in ("true", "false"):
+        return answer == "true"
+    return None
+
+
+def parse_status(answers) -> RobotStatus:
+    """
+    :param answers: Answers to STATUS_COMMANDS
+    """
+    robot_mode, safety_status, program_state, remote_control = answers
+    return RobotStatus(parse_robot_mode(robot_mode), parse_safety_status(safety_status),
+                       parse_program_state(program_state), parse_remote_control(remote_control), time.time())
+
+
+class URDashboard:
+    """
+    :param host: IP address of the robot
+    :param timeout: Seconds to wait for the connection and for each answer
+    """
+
+    def __init__(self, host: str, port: int = 29999, timeout: float = 1.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.socket = None
+        self.file = None
+        self.lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self.socket is not None
+
+    def connect(self):
+        """
+        :raises DashboardError: if the server cannot be reached
+        """
+        self.close()
+        try:
+            self.socket = socket.create_connection((self.host, self.port), self.timeout)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.file = self.socket.makefile("rb")
+            # "Connected: Universal Robots Dashboard Server"
+            self._read_line()
+        except (OSError, DashboardError) as e:
+            self.close()
+            raise DashboardError(f"Could not connect to the dashboard server at {self.host}:{self.port}: {e}") from e
+
+    def close(self):
+        if self.socket is not None:
+            try:
+                self.file.close()
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+        self.file = None
+
+    def _read_line(self) -> str:
+        line = self.file.readline()
+        if not line:
+            raise DashboardError("connection closed")
+        return line.decode(errors="replace").strip()
+
+    def command(self, command: str) -> str:
+        """
+        Sends a command, connecting first if needed
+        :return: The answer line
+        :raises DashboardError: if the server cannot be reached or does not answer. The connection is then closed
+        """
+        with self.lock:
+            if self.socket is None:
+                self.connect()
+            try:
+                self.socket.sendall(command.encode() + b"\n")
+                return self._read_line()
+            except (OSError, DashboardError) as e:
+                self.close()
+                raise DashboardError(f"{command}: {e}") from e
+
+    # Status
+
+    def robot_mode(self) -> str:
+        return parse_robot_mode(self.command("robotmode"))
+
+    def safety_status(self) -> str:
+        return parse_safety_status(self.command("safetystatus"))
+
+    def program_state(self) -> str:
+        return parse_program_state(self.command("programState"))
+
+    def is_in_remote_control(self) -> bool | None:
+        return parse_remote_control(self.command("is in remote control"))
+
+    def status(self) -> RobotStatus:
+        return parse_status([self.command(command) for command in STATUS_COMMANDS])
+
+    # Recovery
+
+    def unlock_protective_stop(self) -> bool:
+        return self.recover("unlock_protective_stop")
+
+    def power_on(self) -> bool:
+        return self.recover("power_on")
+
+    def brake_release(self) -> bool:
+        return self.recover("brake_release")
+
+    def stop(self) -> bool:
+        return self.recover("stop")
+
+    def recover(self, action: str) -> bool:
+        """
+        :param action: One of the actions of RECOVERY_ACTIONS
+        :return: True if the controller accepted it
+        """
+        commands, accepted = RECOVERY_COMMANDS[action]
+        answers = [self.command(command) for command in commands]
+        return answers[-1].startswith(accepted)
@@ -1,4 +1,6 @@
 from Communication.ModbusTCP import ModbusTCP
+from Telemetry.Metrics import metrics
+from Telemetry.ModbusStats import MODBUS_BUCKETS, modbus_stats
 
 import time, math, struct
 
@@ -17,6 +19,10 @@ import time, math, struct
 # Be aware that some other devices are 1-based (e.g. Anybus X-gateways), then just add one to the address
 # on that device. (e.g. address 3 on the robot will be address 4 on the Anybus X-gateway)
 
+modbus_request_seconds = metrics.histogram("sentry_modbus_request_seconds", "Round trip time of Modbus register reads", MODBUS_BUCKETS)
+modbus_failures_total = metrics.counter("sentry_modbus_failures_total", "Modbus register reads that returned no valid response")
+modbus_retries_total = metrics.counter("sentry_modbus_retries_total", "Modbus queries retried after a failed read")
+
 
 class URModbusServer:
     """Give read and write access to data in the robot controller for other devices
@@ -27,22 +33,37 @@ class URModbusServer:
     All information will be formatted to human readable information.
     """
 
-    def __init__(self, host):
+    def __init__(self, host, port=502):
         """
         :param host: IP address to connect with
+        :param port: Modbus port of the robot, or of a ModbusProxy sharing its connection
+        """
+        self.modbusTCP = ModbusTCP(host, port)
+        self.modbusTCP.add_hook(modbus_stats)
+
+    def _read(self, reg_address, quantity):
         """
-        self.modbusTCP = ModbusTCP(host, 502)
+        Reads holding registers, recording the round trip time of the request
+        :return: The response packet, or None if the read failed
+        """
+        start = time.perf_counter()
+        packet = self.modbusTCP.read_holding_registers(reg_address, quantity=quantity)
+        modbus_request_seconds.observe(time.perf_counter() - start, register=str(reg_address))
+        if packet is None:
+            modbus_failures_total.inc(register=str(reg_address))
+        return packet
 
     def get_tcp_position(self):
         """
         Connects with the Modbus server to requests Cartesian data of the TCP
         :return: Readable cartesian data of TCP, vector in mm, axis in radials
         """
-        packet = self.modbusTCP.read_holding_registers(400, quantity=6)
+        packet = self._read(400, 6)
 
         if packet is None:
             time.sleep(0.5)
             print("[TCP] Modbus Error: retrying")
+            modbus_retries_total.inc(query="tcp_position")
             return self.get_tcp_position()
         else:
             x = self._format(packet[9:11]) / 10
@@ -62,13 +83,14 @@ class URModbusServer:
             raise ModbusError("[Angles] Modbus Error: Failed")
             #return 0, 0, 0, 0, 0, 0
 
-        packet = self.modbusTCP.read_holding_registers(270, quantity=6)
+        packet = self._read(270, 6)
         time.sleep(0.001)
-        packet_signs = self.modbusTCP.read_holding_registers(320, quantity=6)
+        packet_signs = self._read(320, 6)
 
         if (packet is None) or (packet_signs is None):
             time.sleep(0.01)
             print(f"[Angles] Modbus Error #{tries}: retrying")
+            modbus_retries_total.inc(query="joint_angles")
             return self.get_joint_angles(tries+1)
         else:
             base = self._format_sign(packet[9:11], packet_signs[9:11])
@@ -93,11 +115,12 @@ class URModbusServer:
             #print("[Speeds] Modbus Error: Failed")
             raise ModbusError("[Speeds] Modbus Error: Failed")
 
-        packet = self.modbusTCP.read_holding_registers(280, quantity=6)
+        packet = self._read(280, 6)
 
         if (packet is None):
             time.sleep(0.01)
             print(f"[Speeds] Modbus Error #{tries}: retrying")
+            modbus_retries_total.inc(query="joint_speeds")
             return self.get_joint_speeds(tries+1)
         else:
             base = self._format(packet[9:11]) / 1000
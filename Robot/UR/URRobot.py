@@ -1,6 +1,13 @@
+import threading
+
 from Communication.SocketConnection import SocketConnection
 from Robot.UR.URModbusServer import URModbusServer
 from Robot.UR.URScript import URScript
+from Telemetry.Metrics import metrics
+from Telemetry.ReadinessGate import readiness
+
+scripts_sent_total = metrics.counter("sentry_scripts_sent_total", "URScript commands sent to the controller")
+script_errors_total = metrics.counter("sentry_script_errors_total", "URScript commands that could not be sent")
 
 
 class URRobot:
@@ -9,10 +16,20 @@ class URRobot:
     SecondaryPort used for sending commands
     ModbusServer used for retrieving info
     """
-    def __init__(self, host):
+    def __init__(self, host, connect=True):
+        """
+        :param host: IP address of the robot
+        :param connect: Connect to the secondary port right away. Otherwise connect() must be called before
+                        sending commands, which lets the connection be opened in parallel with other startup work
+        """
         self.secondaryPort = 30002
         self.secondaryInterface = SocketConnection(host, self.secondaryPort)
-        self.secondaryInterface.connect()
+        # Scripts are sent whole, one thread at a time
+        self.send_lock = threading.Lock()
+        # Set by emergency_stop, every other script is dropped until clear_emergency_stop
+        self.estopped = False
+        if connect:
+            self.connect()
         self.URModbusServer = URModbusServer(host)
         self.URScript = URScript()
 
@@ -25,6 +42,20 @@ class URRobot:
         self.acceleration = 0.1
         self.velocity = 0.1
 
+        # Last values read, None until the first successful read
+        self.last_joint_angles = None
+        self.last_joint_speeds = None
+
+    def connect(self):
+        """
+        Opens the connection to the secondary port
+        :return: True if the connection was opened
+        """
+        self.secondaryInterface.connect()
+        if self.secondaryInterface.opened:
+            readiness.mark("robot_connected")
+        return self.secondaryInterface.opened
+
     def movel(self, pose, a=0.1, v=0.1, joint_p=False):
         """Move to position (linear in tool-space)
 
@@ -60,6 +91,42 @@ class URRobot:
         script = URScript.stopj(a).encode()
         return self._send_script(script)
 
+    def emergency_stop(self, a=3.0, on_sent=None):
+        """Sends stopj right away from the calling thread, and drops every other script until clear_emergency_stop
+
+        A script being sent by another thread is finished first, scripts waiting to be sent are dropped.
+        The connection is reopened once if the stopj can not be sent.
+        :param a: joint deceleration [rad/s^2]
+        :param on_sent: Called with True once the stopj is written to the socket, or False if it could not be
+        :return: Boolean to check if the command has been send
+        """
+        self.estopped = True
+        script = URScript.stopj(a).encode()
+        with self.send_lock:
+            try:
+                if not self.secondaryInterface.opened:
+                    self.connect()
+                self.secondaryInterface.send(script)
+                sent = True
+            except (OSError, RuntimeError) as error:
+                print("OS error: {0}".format(error))
+                self.connect()
+                try:
+                    self.secondaryInterface.send(script)
+                    sent = True
+                except (OSError, RuntimeError):
+                    sent = False
+        if sent:
+            scripts_sent_total.inc()
+        else:
+            script_errors_total.inc()
+        if on_sent is not None:
+            on_sent(sent)
+        return sent
+
+    def clear_emergency_stop(self):
+        self.estopped = False
+
     def set_tcp(self, pose):
         """Set the Tool Center Point
 
@@ -83,8 +150,16 @@ class URRobot:
         :return: 6 Floats - Position joint angles (base, shoulder, elbow, wrist_1, wrist_2, wrist_3) in radians
         """
         position_data = self.URModbusServer.get_joint_angles()
+        self.last_joint_angles = position_data
         return position_data
     
+    def last_joint_state(self):
+        """ Joint angles and speeds from the last reads, without reading them again
+
+        :return: (angles, speeds), each None if it was never read
+        """
+        return self.last_joint_angles, self.last_joint_speeds
+
     def get_joint_angles_degrees(self):
         """ Get joint angles in degrees
 
@@ -99,6 +174,7 @@ class URRobot:
         :return: 6 Floats - Position joint speeds (base, shoulder, elbow, wrist_1, wrist_2, wrist_3) in rads/s
         """
         speed_data = self.URModbusServer.get_joint_speeds()
+        self.last_joint_speeds = speed_data
         return speed_data
 
     def set_io(self, io, value):
@@ -135,11 +211,16 @@ class URRobot:
         :param _script: formatted script to send
         :return: Boolean to check if the script has been send
         """
-        try:
-            self.secondaryInterface.send(_script)
-        except OSError as error:
-            print("OS error: {0}".format(error))
-            return False
+        with self.send_lock:
+            if self.estopped:
+                return False
+            try:
+                self.secondaryInterface.send(_script)
+            except OSError as error:
+                print("OS error: {0}".format(error))
+                script_errors_total.inc()
+                return False
+        scripts_sent_total.inc()
         return True
 
     @ staticmethod
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from Config.SentryConfig import ControlConfig
+from Robot.UR.URRobot import URRobot
+from Timing.Clock import Clock, system_clock
+from URSentry import URSentry
+
+# Brings the robot side of the sentry up while the camera ingest (started before, on its own thread or process)
+# logs in and connects. The connection to the secondary port and the Modbus health check do not depend on each
+# other, so they run in parallel. Startup milestones are reported by the readiness gate (Telemetry/ReadinessGate.py).
+
+
+class SentryStartup:
+    """
+    :param host: IP address of the robot
+    :param clock: Time source of the sentry
+    :param config: Control parameters of the sentry
+    :param recorder: TelemetryRecorder of the sentry
+    :param monitor: DashboardMonitor of the robot
+    :param aim_calibration: AimCalibration table of the sentry
+    """
+
+    def __init__(self, host: str, clock: Clock = system_clock, config: ControlConfig | None = None, recorder=None,
+                 monitor=None, aim_calibration=None):
+        self.host = host
+        self.clock = clock
+        self.config = config
+        self.recorder = recorder
+        self.monitor = monitor
+        self.aim_calibration = aim_calibration
+
+    def start_robot(self) -> URSentry:
+        """
+        Connects to the robot and runs the Modbus health check concurrently
+        :return: The sentry, with its pose initialized
+        """
+        robot = URRobot(self.host, connect=False)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="robot-connect") as pool:
+            connecting = pool.submit(robot.connect)
+            # The health check only uses Modbus, so it does not wait for the secondary port
+            sentry = URSentry(self.host, robot=robot, clock=self.clock, config=self.config, recorder=self.recorder,
+                             monitor=self.monitor, aim_calibration=self.aim_calibration)
+            if not connecting.result():
+                print("Could not connect to the secondary port of the robot")
+        sentry.initialize_pose()
+        return sentry
@@ -0,0 +1,416 @@
+import argparse
+import bisect
+import contextlib
+import functools
+import itertools
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Config.SentryConfig import ControlConfig, update_control
+from Simulation.SentrySimulation import SentrySimulation
+from Tracking.AimCalibration import AimCalibration
+from Tracking.CameraFusion import CameraCalibration, arm_heading, load_calibrations, wrap_degrees
+
+# Searches control and tracker parameters offline, by running the sentry of SentrySimulation in closed loop against
+# targets moving in the world, seen through a camera carried by the simulated arm. Every set of parameters is scored
+# on tracking error, settle time and direction switches, and the evaluations are spread over a process pool.
+#
+#     python -m Simulation.ParameterTuner --recording lobby.rec --search random --trials 200
+#     python -m Simulation.ParameterTuner --search grid --param base_max_speed=1,1.5,2 --param horizontal_dead_zone=0.03,0.05
+#
+# Targets come from a recording of the camera streams (see UnifiWebsockets/StreamRecorder.py), whose boxes are turned
+# into bearings as if the recording camera was fixed (or with the calibrations of CAMERA_CALIBRATION), or from a
+# synthetic walk across the room. The best parameters are written as a SENTRY_CONFIG file, if they beat the current
+# ones.
+
+# Parameters of BBoxProcessor (TrackerConfig), the others are fields of ControlConfig
+TRACKER_PARAMETERS = ("dist_threshold", "time_to_live")
+
+DEFAULT_SPACE = {
+    "horizontal_dead_zone": (0.02, 0.15),
+    "vertical_dead_zone": (0.005, 0.05),
+    "base_max_speed": (0.5, 2.0),
+    "vertical_speed": (0.5, 3.0),
+    "base_acceleration": (0.5, 3.0),
+    "dist_threshold": (40.0, 160.0),
+    "time_to_live": (0.2, 1.5),
+}
+
+HOLD = 0.5  # Seconds a recorded frame stays visible without a new one
+
+
+class WalkingTargets:
+    """
+    A target walking back and forth across the room, visible for `visible` seconds of every `period`
+    """
+
+    def __init__(self, period: float = 60.0, visible: float = 30.0, width: float = 120.0, speed: float = 8.0):
+        self.period = period
+        self.visible = visible
+        self.width = width
+        self.speed = speed
+
+    def targets(self, t: float) -> list[tuple]:
+        phase = t % self.period
+        if phase >= self.visible:
+            return []
+        # Degrees per second along a zigzag between -60 and 60 degrees, slightly up and down
+        travel = (phase * self.speed) % 240
+        azimuth = -60 + travel if travel < 120 else 180 - travel
+        elevation = 4 * math.sin(phase / 3)
+        return [(azimuth, elevation, self.width, 2.5 * self.width)]
+
+    def duration(self) -> float:
+        return self.period
+
+
+class RecordedTargets:
+    """
+    Targets of a camera stream recording, as bearings in the world.
+    Every camera is taken as fixed: the recordings do not hold the arm pose, so the boxes of the camera on the arm
+    still include the motion of the arm when they were recorded. Recordings of fixed cameras give the true targets
+    :param calibrations: Calibration of each recorded camera, a fixed camera facing azimuth 0 by default
+    """
+
+    def __init__(self, path: str, calibrations: dict[str, CameraCalibration] | None = None):
+        from UnifiWebsockets.Detection import decode_message
+        from UnifiWebsockets.StreamRecorder import BINARY, StreamReader
+
+        calibrations = calibrations or {}
+        reader = StreamReader(path)
+        self.times = []
+        self.frames = []
+        first = None
+        for frame in reader:
+            message = frame.payload if frame.kind == BINARY else frame.message()
+            decoded = decode_message(message, frame.camera)
+            if decoded is None:
+                continue
+            _, detections = decoded
+            if first is None:
+                first = frame.receive_mono
+            calibration = calibrations.get(frame.camera) or CameraCalibration(frame.camera)
+            targets = []
+            for detection in detections:
+                x, y, w, h = detection.box
+                azimuth, elevation = calibration.to_bearing(x + w / 2, y + h / 3)
+                targets.append((azimuth, elevation, w, h))
+            self.times.append(frame.receive_mono - first)
+            self.frames.append(targets)
+        reader.close()
+
+    def targets(self, t: float) -> list[tuple]:
+        i = bisect.bisect_right(self.times, t) - 1
+        if i < 0 or t - self.times[i] > HOLD:
+            return []
+        return self.frames[i]
+
+    def duration(self) -> float:
+        return self.times[-1] if self.times else 0.0
+
+
+class ArmCamera:
+    """
+    Camera carried by the arm.
+
+    Following a target, it faces the azimuth opposite to the base angle (a positive base speed turns it left, like
+    URSentry expects), and its pitch follows the sum of the shoulder, elbow and wrist 1 angles, level at the middle
+    point pose. In the sentry pose it looks down over its surroundings: a target at azimuth `a` appears at the polar
+    angle `a + 45` around the image center, which is how awake_from_sentry_mode reads it.
+    """
+
+    def __init__(self, config: ControlConfig, horizontal_fov: float = 90.0, vertical_fov: float = 60.0,
+                 overview_radius: float = 300.0):
+        self.horizontal_fov = horizontal_fov
+        self.vertical_fov = vertical_fov
+        self.overview_radius = overview_radius
+        self.level = sum((config.imposing_pose[i] + config.looking_down_pose[i]) / 2 for i in range(1, 4))
+
+    def heading(self, angles) -> tuple[float, float]:
+        return arm_heading(angles, self.level)
+
+    def boxes(self, yaw: float, pitch: float, targets, overview: bool = False) -> list[list]:
+        boxes = []
+        if overview:
+            for azimuth, _, w, h in targets:
+                theta = math.radians(azimuth + 45)
+                x = 500 + self.overview_radius * math.sin(theta)
+                y = 500 - self.overview_radius * math.cos(theta)
+                boxes.append([x - w / 2, y - h / 3, w, h])
+            return boxes
+
+        calibration = CameraCalibration("arm", yaw, pitch, self.horizontal_fov, self.vertical_fov)
+        for azimuth, elevation, w, h in targets:
+            x, y = calibration.to_image(azimuth, elevation)
+            if 0 <= x <= 1000 and 0 <= y <= 1000:
+                boxes.append([x - w / 2, y - h / 3, w, h])
+        return boxes
+
+
+class TrackingWorld:
+    """
+    Scenario of SentrySimulation: gives the boxes the arm camera sees at each tick, and scores how well the arm
+    points at the nearest target
+    :param settle_error: Error, in degrees, under which the arm is on target
+    """
+
+    def __init__(self, targets, simulation: SentrySimulation, camera: ArmCamera, settle_error: float = 5.0):
+        self.targets = targets
+        self.simulation = simulation
+        self.camera = camera
+        self.settle_error = settle_error
+
+        self.error_sum = 0.0
+        self.error_ticks = 0
+        self.on_target_ticks = 0
+        self.episodes = 0
+        self.settle_times = []
+        self.episode_start = None
+        self.settled = False
+        self.switches = 0
+        self.last_direction = 0
+
+    def __call__(self, t: float) -> list[list]:
+        angles = self.simulation.robot.get_joint_angles()
+        yaw, pitch = self.camera.heading(angles)
+        targets = self.targets.targets(t)
+
+        base_speed = self.simulation.sentry.commanded_speed[0]
+        if base_speed != 0:
+            direction = 1 if base_speed > 0 else -1
+            if self.last_direction and direction != self.last_direction:
+                self.switches += 1
+            self.last_direction = direction
+
+        if targets:
+            error = min(math.hypot(wrap_degrees(azimuth - yaw), elevation - pitch)
+                        for azimuth, elevation, _, _ in targets)
+            self.error_sum += error
+            self.error_ticks += 1
+            if self.episode_start is None:
+                self.episode_start = t
+                self.settled = False
+                self.episodes += 1
+            if error < self.settle_error:
+                self.on_target_ticks += 1
+                if not self.settled:
+                    self.settled = True
+                    self.settle_times.append(t - self.episode_start)
+        elif self.episode_start is not None:
+            if not self.settled:
+                # Never on target, the whole episode counts
+                self.settle_times.append(t - self.episode_start)
+            self.episode_start = None
+        return self.camera.boxes(yaw, pitch, targets, self.simulation.sentry.is_on_sentry_mode)
+
+    def scores(self, duration: float) -> dict:
+        ticks = max(self.error_ticks, 1)
+        return {
+            "tracking_error": round(self.error_sum / ticks, 3),
+            "on_target": round(self.on_target_ticks / ticks, 3),
+            "settle_time": round(sum(self.settle_times) / len(self.settle_times), 3) if self.settle_times else 0.0,
+            "switches_per_min": round(self.switches / max(duration, 1e-9) * 60, 3),
+            "episodes": self.episodes,
+        }
+
+
+@functools.lru_cache(maxsize=4)
+def load_targets(recording: str | None, calibration: str | None):
+    """
+    Loaded once per worker process
+    """
+    if recording is None:
+        return WalkingTargets()
+    return RecordedTargets(recording, load_calibrations(calibration) if calibration else None)
+
+
+@functools.lru_cache(maxsize=4)
+def load_aim_calibration(path: str) -> AimCalibration:
+    return AimCalibration.load(path)
+
+
+def evaluate(params: dict, recording: str | None = None, calibration: str | None = None,
+             duration: float | None = None, tick_period: float = 0.1, weights=(1.0, 2.0, 0.5),
+             aim_calibration: str | None = None) -> dict:
+    """
+    Runs the sentry with the parameters against the targets, in its own process
+    :param aim_calibration: Aim calibration table of the sentry (see Tracking/AimCalibration.py), none by default
+    :param weights: Weights of the tracking error (degrees), settle time (seconds) and switches per minute in the score
+    :return: The parameters, their scores, and the weighted score (lower is better)
+    """
+    control = {name: value for name, value in params.items() if name not in TRACKER_PARAMETERS}
+    tracker = {name: value for name, value in params.items() if name in TRACKER_PARAMETERS}
+    try:
+        config = update_control(ControlConfig(), control)
+    except ValueError as e:
+        return {"params": params, "score": math.inf, "error": str(e)}
+
+    targets = load_targets(recording, calibration)
+    duration = duration or targets.duration()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        simulation = SentrySimulation(None, tick_period, config, **tracker,
+                                      aim_calibration=load_aim_calibration(aim_calibration) if aim_calibration else None)
+    world = TrackingWorld(targets, simulation, ArmCamera(config))
+    simulation.scenario = world
+    simulation.run(duration)
+
+    scores = world.scores(duration)
+    score = weights[0] * scores["tracking_error"] + weights[1] * scores["settle_time"] \
+        + weights[2] * scores["switches_per_min"]
+    return {"params": params, "score": round(score, 3), **scores}
+
+
+def grid_candidates(space: dict) -> list[dict]:
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_candidates(space: dict, trials: int, rng: random.Random) -> list[dict]:
+    integers = {name for name, value in vars(ControlConfig()).items() if isinstance(value, int)}
+    candidates = []
+    for _ in range(trials):
+        candidate = {}
+        for name, (low, high) in space.items():
+            value = rng.uniform(low, high)
+            candidate[name] = round(value) if name in integers else round(value, 4)
+        candidates.append(candidate)
+    return candidates
+
+
+class ParameterTuner:
+    """
+    :param space: For each parameter, a (low, high) range for random search, or a list of values for grid search
+    :param workers: Processes evaluating in parallel, one per CPU by default
+    """
+
+    def __init__(self, space: dict, recording: str | None = None, calibration: str | None = None,
+                 duration: float | None = None, workers: int | None = None, seed: int = 0,
+                 aim_calibration: str | None = None):
+        self.space = space
+        self.aim_calibration = aim_calibration
+        self.recording = recording
+        self.calibration = calibration
+        self.duration = duration
+        self.workers = workers or os.cpu_count()
+        self.rng = random.Random(seed)
+        self.results = []
+
+    def evaluate_all(self, candidates: list[dict]) -> list[dict]:
+        evaluate_candidate = functools.partial(evaluate, recording=self.recording, calibration=self.calibration,
+                                               duration=self.duration, aim_calibration=self.aim_calibration)
+        with ProcessPoolExecutor(self.workers) as pool:
+            results = list(pool.map(evaluate_candidate, candidates, chunksize=max(1, len(candidates) // (4 * self.workers))))
+        self.results += results
+        return results
+
+    def grid(self) -> list[dict]:
+        return self.evaluate_all(grid_candidates(self.space))
+
+    def random(self, trials: int) -> list[dict]:
+        return self.evaluate_all(random_candidates(self.space, trials, self.rng))
+
+    def refine(self, trials: int, rounds: int = 3, keep: float = 0.2) -> list[dict]:
+        """
+        Random search in rounds, each one sampling around the best results of the previous ones, within the
+        range they span (a simple stand-in for a Bayesian optimizer)
+        """
+        space = dict(self.space)
+        per_round = max(1, trials // rounds)
+        for _ in range(rounds):
+            self.evaluate_all(random_candidates(space, per_round, self.rng))
+            best = self.best(max(2, int(len(self.results) * keep)))
+            for name, (low, high) in self.space.items():
+                values = [result["params"][name] for result in best]
+                margin = (max(values) - min(values)) * 0.25 or (high - low) * 0.05
+                space[name] = (max(low, min(values) - margin), min(high, max(values) + margin))
+        return self.results
+
+    def best(self, count: int = 10) -> list[dict]:
+        """
+        :return: The best valid results, the candidates rejected by ControlConfig have an `error` instead of scores
+        """
+        valid = [result for result in self.results if "error" not in result]
+        return sorted(valid, key=lambda result: result["score"])[:count]
+
+    def invalid(self) -> list[dict]:
+        return [result for result in self.results if "error" in result]
+
+
+def describe(result: dict) -> str:
+    if "error" in result:
+        return f"invalid: {result['error']}"
+    return f"score {result['score']}  error {result['tracking_error']}  settle {result['settle_time']}  " \
+           f"switches/min {result['switches_per_min']}"
+
+
+def parse_parameter(text: str) -> tuple[str, object]:
+    """
+    name=low:high for a range, or name=v1,v2,... for values
+    """
+    name, values = text.split("=", 1)
+    if ":" in values:
+        low, high = values.split(":")
+        return name, (float(low), float(high))
+    return name, [float(value) for value in values.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tunes the sentry parameters against simulated or recorded targets")
+    parser.add_argument("--recording", help="Camera stream recording to replay, a synthetic walk by default. Its cameras "
+                        "are taken as fixed, so a recording of the camera on the arm also holds the motion of the arm "
+                        "at the time, and only gives approximate targets")
+    parser.add_argument("--calibration", default=os.getenv('CAMERA_CALIBRATION'),
+                        help="Calibrations of the recorded cameras, see Tracking/CameraFusion.py")
+    parser.add_argument("--aim-calibration", default=os.getenv('AIM_CALIBRATION'),
+                        help="Aim calibration table of the sentry, see Tracking/AimCalibration.py")
+    parser.add_argument("--search", choices=("grid", "random", "refine"), default="random")
+    parser.add_argument("--trials", type=int, default=100, help="Evaluations of the random searches")
+    parser.add_argument("--param", type=parse_parameter, action="append",
+                        help="name=low:high (random) or name=v1,v2 (grid), can be repeated")
+    parser.add_argument("--duration", type=float, help="Simulated seconds per evaluation, the recording by default")
+    parser.add_argument("--workers", type=int, help="Processes, one per CPU by default")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10, help="Results to show")
+    parser.add_argument("-o", "--output", help="Writes the best parameters as a SENTRY_CONFIG file, "
+                        "if they score better than the current ones")
+    args = parser.parse_args()
+
+    space = dict(args.param) if args.param else dict(DEFAULT_SPACE)
+    if args.search == "grid" and not all(isinstance(values, list) for values in space.values()):
+        parser.error("grid search needs lists of values: --param name=v1,v2")
+    if args.search != "grid" and not all(isinstance(values, tuple) for values in space.values()):
+        parser.error("random searches need ranges: --param name=low:high")
+
+    tuner = ParameterTuner(space, args.recording, args.calibration, args.duration, args.workers, args.seed,
+                           args.aim_calibration)
+    start = time.perf_counter()
+    if args.search == "grid":
+        tuner.grid()
+    elif args.search == "random":
+        tuner.random(args.trials)
+    else:
+        tuner.refine(args.trials)
+    elapsed = time.perf_counter() - start
+    print(f"{len(tuner.results)} evaluations in {elapsed:.1f}s on {tuner.workers} processes")
+    invalid = tuner.invalid()
+    if invalid:
+        print(f"{len(invalid)} invalid candidates, e.g. {invalid[0]['params']}: {invalid[0]['error']}")
+    baseline = evaluate({}, args.recording, args.calibration, args.duration, aim_calibration=args.aim_calibration)
+    print(f"current: {describe(baseline)}")
+    for result in tuner.best(args.top):
+        print(f"{describe(result)}  {result['params']}")
+
+    if args.output and tuner.best(1):
+        best = tuner.best(1)[0]
+        if best["score"] >= baseline["score"]:
+            print(f"No candidate beats the current parameters (score {baseline['score']}), {args.output} not written")
+        else:
+            control = {name: value for name, value in best["params"].items() if name not in TRACKER_PARAMETERS}
+            tracker = {name: value for name, value in best["params"].items() if name in TRACKER_PARAMETERS}
+            with open(args.output, "w") as file:
+                json.dump({"control": control, "tracker": tracker}, file, indent=2)
+            print(f"Best parameters written to {args.output}")
@@ -0,0 +1,124 @@
+import argparse
+import contextlib
+import math
+import os
+import time
+
+from BBoxProcessor import BBoxProcessor
+from Config.SentryConfig import ControlConfig
+from Robot.UR.FakeURRobot import FakeURRobot
+from Telemetry.LatencyTrace import tracer
+from Timing.Clock import VirtualClock
+from URSentry import URSentry
+
+# Runs the control loop of main.py against a FakeURRobot on a VirtualClock, with detections from a scripted
+# scenario, as fast as the CPU allows. Used to check the tick based behaviour (await stop, return to sentry...)
+# and to measure the cost of a tick, without a robot or cameras.
+#
+#     python -m Simulation.SentrySimulation --hours 2
+
+
+def patrol_scenario(period: float = 180.0, visible: float = 20.0):
+    """
+    A target walks across the image for `visible` seconds, then nothing is seen until the end of the period
+    :return: scenario(t) giving the boxes seen at time t
+    """
+    def scenario(t: float) -> list:
+        phase = t % period
+        if phase >= visible:
+            return []
+        progress = phase / visible
+        x = 100 + 700 * progress
+        y = 350 + 100 * math.sin(2 * math.pi * progress)
+        return [[x, y, 120, 300]]
+    return scenario
+
+
+class SentrySimulation:
+    """
+    :param scenario: scenario(t) returns the boxes seen t seconds into the simulation
+    :param tick_period: Simulated seconds between control ticks, like the sleep of main.py
+    :param config: Control parameters of the sentry
+    :param dist_threshold: Matching distance of the tracker, see BBoxProcessor
+    :param time_to_live: Lifetime of the tracks, see BBoxProcessor
+    :param aim_calibration: Aim calibration table of the sentry, see Tracking/AimCalibration.py
+    """
+
+    def __init__(self, scenario, tick_period: float = 0.1, config: ControlConfig | None = None,
+                 dist_threshold: float = 80, time_to_live: float = 0.5, aim_calibration=None):
+        self.scenario = scenario
+        self.tick_period = tick_period
+        self.clock = VirtualClock()
+        self.robot = FakeURRobot(self.clock)
+        self.sentry = URSentry(None, robot=self.robot, tick_period=tick_period, clock=self.clock, config=config,
+                              aim_calibration=aim_calibration)
+        self.processor = BBoxProcessor(dist_threshold=dist_threshold, time_to_live=time_to_live, clock=self.clock)
+
+        self.ticks = 0
+        self.state_ticks = {}
+        self.transitions = {}
+        self.returns_to_sentry = 0
+        self.wall_time = 0.0
+        # Every frame with boxes is traced on the virtual clock, the tracer counts those that led to no command
+        self.traces = 0
+        self.dropped_before = tracer.dropped
+
+    def run(self, duration: float, quiet: bool = True) -> dict:
+        """
+        Simulates `duration` seconds of control
+        :param quiet: Discards what the sentry prints
+        :return: The results, see results()
+        """
+        end = self.clock.monotonic() + duration
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.ExitStack() as stack:
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            if not self.sentry.has_initialized:
+                self.sentry.initialize_pose()
+            state = self.sentry.get_state()
+            while self.clock.monotonic() < end:
+                boxes = self.scenario(self.clock.monotonic())
+                trace = tracer.start(clock=self.clock) if boxes else None
+                if trace is not None:
+                    self.traces += 1
+                joystick = self.processor.get_joystick_position_from_camera(None, boxes, trace)
+                self.sentry.control_robot(joystick, trace)
+                self.ticks += 1
+
+                new_state = self.sentry.get_state()
+                self.state_ticks[new_state] = self.state_ticks.get(new_state, 0) + 1
+                if new_state != state:
+                    transition = f"{state} -> {new_state}"
+                    self.transitions[transition] = self.transitions.get(transition, 0) + 1
+                    state = new_state
+                self.clock.sleep(self.tick_period)
+        self.wall_time += time.perf_counter() - start
+        return self.results()
+
+    def results(self) -> dict:
+        simulated = self.clock.monotonic()
+        return {
+            "ticks": self.ticks,
+            "simulated_s": round(simulated, 1),
+            "wall_s": round(self.wall_time, 3),
+            "speedup": round(simulated / self.wall_time) if self.wall_time else None,
+            "tick_us": round(self.wall_time / self.ticks * 1e6, 1) if self.ticks else None,
+            "state_s": {state: round(ticks * self.tick_period, 1) for state, ticks in self.state_ticks.items()},
+            "transitions": self.transitions,
+            "robot_commands": dict(self.robot.commands),
+            "traces": {"frames": self.traces, "dropped": tracer.dropped - self.dropped_before},
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates the sentry against a fake robot, faster than real time")
+    parser.add_argument("--hours", type=float, default=1.0, help="Simulated time")
+    parser.add_argument("--period", type=float, default=180.0, help="Seconds between target appearances")
+    parser.add_argument("--visible", type=float, default=20.0, help="Seconds the target stays visible")
+    parser.add_argument("--verbose", action="store_true", help="Show what the sentry prints")
+    args = parser.parse_args()
+
+    simulation = SentrySimulation(patrol_scenario(args.period, args.visible))
+    for key, value in simulation.run(args.hours * 3600, quiet=not args.verbose).items():
+        print(f"{key}: {value}")
@@ -0,0 +1,213 @@
+import bisect
+import threading
+import time
+
+from Timing.Clock import Clock, system_clock
+
+# Stages of the detection pipeline, in order. Each latency is measured between two consecutive stamps.
+STAGES = ("camera", "receive", "tracker", "tick", "send")
+
+
+class ClockSkew:
+    """
+    Keeps track of the relation between the wall clock and the monotonic clock.
+
+    Camera timestamps are wall clock values (from the NVR), while every local stage is stamped with time.monotonic(),
+    which cannot jump when NTP adjusts the system time. The offset wall - monotonic is re-sampled on every receive,
+    so camera timestamps are converted with the offset that was valid when the frame arrived.
+    The camera and host clocks are not synchronized either: the smallest camera->receive delay seen so far is kept
+    as an estimate of the clock skew plus the minimum network delay, and subtracted to get a corrected age.
+    """
+
+    def __init__(self):
+        self.wall_offset = time.time() - time.monotonic()
+        self.min_camera_delay = None
+        self.wall_jumps = 0
+
+    def sample(self, wall: float, mono: float, jump_threshold: float = 0.05) -> float:
+        """
+        Updates the wall - monotonic offset, counting jumps of the wall clock
+        :return: current offset
+        """
+        offset = wall - mono
+        if abs(offset - self.wall_offset) > jump_threshold:
+            self.wall_jumps += 1
+        self.wall_offset = offset
+        return offset
+
+    def camera_to_monotonic(self, camera_ts: float) -> float:
+        return camera_ts - self.wall_offset
+
+    def observe_camera_delay(self, delay: float):
+        if self.min_camera_delay is None or delay < self.min_camera_delay:
+            self.min_camera_delay = delay
+
+
+class DetectionTrace:
+    """
+    Timestamps of a single detection frame as it moves through the pipeline.
+    `camera_ts` and `receive_wall` are wall clock seconds, every other stamp is monotonic seconds of `clock`, which
+    is virtual in simulations.
+    """
+    __slots__ = ("camera_ts", "receive_wall", "receive_mono", "tracker_mono", "tick_mono", "send_mono", "camera_mono",
+                 "clock")
+
+    def __init__(self, camera_ts: float | None = None, receive_wall: float | None = None, receive_mono: float | None = None,
+                 clock: Clock = system_clock):
+        self.clock = clock
+        self.camera_ts = camera_ts
+        self.receive_wall = clock.time() if receive_wall is None else receive_wall
+        self.receive_mono = clock.monotonic() if receive_mono is None else receive_mono
+        self.tracker_mono = None
+        self.tick_mono = None
+        self.send_mono = None
+        self.camera_mono = None
+
+    def mark_tracker(self):
+        if self.tracker_mono is None:
+            self.tracker_mono = self.clock.monotonic()
+
+    def mark_tick(self):
+        if self.tick_mono is None:
+            self.tick_mono = self.clock.monotonic()
+
+    def mark_send(self):
+        if self.send_mono is None:
+            self.send_mono = self.clock.monotonic()
+
+    def age(self, now: float | None = None) -> float:
+        """
+        Seconds since the frame was captured (or received, if the camera timestamp is unknown)
+        """
+        now = self.clock.monotonic() if now is None else now
+        start = self.camera_mono if self.camera_mono is not None else self.receive_mono
+        return now - start
+
+    def __repr__(self):
+        return (f"DetectionTrace(camera={self.camera_ts}, receive={self.receive_mono}, tracker={self.tracker_mono}, "
+                f"tick={self.tick_mono}, send={self.send_mono})")
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of latencies, in seconds.
+    """
+
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th quantile
+        """
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def cumulative_counts(self) -> list:
+        """
+        (upper bound, cumulative count) pairs, with float('inf') for the last bucket
+        """
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+
+class LatencyTracer:
+    """
+    Collects finished DetectionTraces into one histogram per stage, plus the end to end latency.
+    """
+
+    def __init__(self):
+        self.skew = ClockSkew()
+        self.histograms = {f"{a}_to_{b}": LatencyHistogram() for a, b in zip(STAGES, STAGES[1:])}
+        self.histograms["camera_to_receive_corrected"] = LatencyHistogram()
+        self.histograms["end_to_end"] = LatencyHistogram()
+        self.histograms["receive_to_send"] = LatencyHistogram()
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def start(self, camera_ts: float | None = None, receive_wall: float | None = None, receive_mono: float | None = None,
+              clock: Clock = system_clock) -> DetectionTrace:
+        """
+        Creates the trace of a received frame. Receive times default to now
+        :param clock: Clock stamping the trace
+        """
+        trace = DetectionTrace(camera_ts, receive_wall, receive_mono, clock)
+        self.skew.sample(trace.receive_wall, trace.receive_mono)
+        if camera_ts is not None:
+            trace.camera_mono = self.skew.camera_to_monotonic(camera_ts)
+        return trace
+
+    def record(self, trace: DetectionTrace):
+        """
+        Adds a trace to the histograms. Stages that were never stamped are skipped, and a trace that never led to a
+        command is counted as dropped
+        """
+        with self._lock:
+            if trace.send_mono is None:
+                self.dropped += 1
+                return
+            if trace.camera_ts is not None:
+                camera_delay = trace.receive_wall - trace.camera_ts
+                self.skew.observe_camera_delay(camera_delay)
+                self.histograms["camera_to_receive"].observe(max(camera_delay, 0.0))
+                self.histograms["camera_to_receive_corrected"].observe(camera_delay - self.skew.min_camera_delay)
+                self.histograms["end_to_end"].observe(max(trace.send_mono - trace.camera_mono, 0.0))
+            stamps = (trace.receive_mono, trace.tracker_mono, trace.tick_mono, trace.send_mono)
+            for name, start, end in zip(("receive_to_tracker", "tracker_to_tick", "tick_to_send"), stamps, stamps[1:]):
+                if start is not None and end is not None:
+                    self.histograms[name].observe(max(end - start, 0.0))
+            self.histograms["receive_to_send"].observe(max(trace.send_mono - trace.receive_mono, 0.0))
+
+    def summary(self) -> dict:
+        """
+        Count, mean, p50, p99 and max (in ms) of every stage
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": h.count,
+                    "mean_ms": round(h.mean() * 1000, 3),
+                    "p50_ms": round(h.quantile(0.5) * 1000, 3),
+                    "p99_ms": round(h.quantile(0.99) * 1000, 3),
+                    "max_ms": round(h.max * 1000, 3),
+                }
+                for name, h in self.histograms.items()
+            }
+
+    def print_summary(self):
+        print("+----------------------------- Latency (ms) -----------------------------+")
+        for name, stats in self.summary().items():
+            print("| {:<28} n={count:<7} mean={mean_ms:<8} p50={p50_ms:<7} p99={p99_ms:<7} max={max_ms}".format(name, **stats))
+        print(f"| wall clock jumps: {self.skew.wall_jumps}  min camera delay: {self.skew.min_camera_delay}")
+        print("+------------------------------------------------------------------------+")
+
+
+# Tracer shared by the ingest, tracker and control stages of the process
+tracer = LatencyTracer()
@@ -0,0 +1,219 @@
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from Telemetry.LatencyTrace import LatencyHistogram, tracer
+
+# Minimal metrics in the Prometheus text exposition format, served over a local HTTP endpoint.
+# Metrics are created once, at import time, and can be updated from any thread.
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = LatencyHistogram.DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = LatencyHistogram(self.buckets)
+            histogram.observe(value)
+
+    def get(self, **labels) -> LatencyHistogram | None:
+        return self._values.get(self._key(labels))
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        with self._lock:
+            for labels, histogram in self._values.items():
+                lines.extend(render_histogram(self.name, labels, histogram))
+        return lines
+
+
+def render_histogram(name: str, labels: tuple, histogram: LatencyHistogram) -> list[str]:
+    lines = []
+    for bound, count in histogram.cumulative_counts():
+        bucket_labels = labels + (("le", _format_value(float(bound))),)
+        lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+
+class Registry:
+    """
+    Set of metrics to expose. Collectors are called on every scrape and return extra lines,
+    for values that are cheaper to read on demand than to keep updated.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LatencyHistogram.DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"[Metrics] Collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the whole process
+metrics = Registry()
+
+
+def collect_latency() -> list[str]:
+    """
+    Exports the histograms of the latency tracer
+    """
+    name = "sentry_detection_latency_seconds"
+    lines = [f"# HELP {name} Latency of detections through each stage of the pipeline",
+             f"# TYPE {name} histogram"]
+    with tracer._lock:
+        for stage, histogram in tracer.histograms.items():
+            lines.extend(render_histogram(name, (("stage", stage),), histogram))
+    return lines
+
+
+metrics.add_collector(collect_latency)
+
+
+class MetricsServer:
+    """
+    Serves the registry at http://<address>:<port>/metrics from a daemon thread
+    """
+
+    def __init__(self, port: int = 9108, address: str = "127.0.0.1", registry: Registry = metrics):
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry_.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        print(f"[Metrics] Serving on http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_metrics_server() -> MetricsServer | None:
+    """
+    Starts the metrics server on METRICS_ADDRESS:METRICS_PORT (127.0.0.1:9108 by default).
+    Setting METRICS_PORT to 0 disables it
+    :return: The running server, or None if it is disabled or could not start
+    """
+    port = int(os.getenv('METRICS_PORT', '9108'))
+    if port == 0:
+        return None
+    try:
+        server = MetricsServer(port, os.getenv('METRICS_ADDRESS', "127.0.0.1"))
+    except OSError as e:
+        print(f"[Metrics] Could not start the server: {e}")
+        return None
+    server.start()
+    return server
+
@@ -0,0 +1,113 @@
+import threading
+
+from Communication.ModbusTCP import ModbusTransaction, TransactionHook
+from Telemetry.LatencyTrace import LatencyHistogram
+from Telemetry.Metrics import metrics, render_histogram
+
+# Aggregates the Modbus transactions of the process into histograms per function code and register range,
+# e.g. to compare the joint angle (270), angle sign (320) and joint speed (280) reads, and to tell connection setup
+# apart from the time the controller takes to answer.
+
+MODBUS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)
+PHASES = ("connect", "send", "first_byte", "rtt")
+
+
+class RegisterRangeStats:
+    """
+    Histograms of the phases of the transactions on one register range
+    """
+    __slots__ = ("histograms", "count", "errors", "response_bytes")
+
+    def __init__(self, buckets: tuple):
+        self.histograms = {phase: LatencyHistogram(buckets) for phase in PHASES}
+        self.count = 0
+        self.errors = {}
+        self.response_bytes = 0
+
+
+class ModbusStats(TransactionHook):
+    """
+    Transaction hook keeping one RegisterRangeStats per (function code, register range).
+    Registers are grouped in ranges of `range_size`, so 270 and 275 fall in the range "270-279".
+    """
+
+    def __init__(self, range_size: int = 10, buckets: tuple = MODBUS_BUCKETS):
+        self.range_size = range_size
+        self.buckets = buckets
+        self.ranges = {}
+        self._lock = threading.Lock()
+
+    def register_range(self, address: int) -> str:
+        first = address - address % self.range_size
+        return f"{first}-{first + self.range_size - 1}"
+
+    def on_transaction(self, transaction: ModbusTransaction):
+        key = (transaction.function_code, self.register_range(transaction.address))
+        with self._lock:
+            stats = self.ranges.get(key)
+            if stats is None:
+                stats = self.ranges[key] = RegisterRangeStats(self.buckets)
+            stats.count += 1
+            stats.response_bytes += transaction.response_size
+            if transaction.error is not None:
+                stats.errors[transaction.error] = stats.errors.get(transaction.error, 0) + 1
+            for phase, value in zip(PHASES, (transaction.connect_time, transaction.send_time,
+                                             transaction.first_byte_time, transaction.rtt)):
+                if value is not None:
+                    stats.histograms[phase].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.ranges = {}
+
+    def summary(self) -> dict:
+        """
+        Count, errors, and the mean and p99 (in ms) of every phase, per function code and register range
+        """
+        with self._lock:
+            return {
+                f"fc{function_code} {registers}": {
+                    "count": stats.count,
+                    "errors": dict(stats.errors),
+                    **{
+                        f"{phase}_ms": (round(h.mean() * 1000, 3), round(h.quantile(0.99) * 1000, 3))
+                        for phase, h in stats.histograms.items()
+                    },
+                }
+                for (function_code, registers), stats in sorted(self.ranges.items())
+            }
+
+    def print_summary(self):
+        print("+------------------------ Modbus (ms, mean / p99) -----------------------+")
+        for name, stats in self.summary().items():
+            phases = "  ".join(f"{phase}={stats[f'{phase}_ms'][0]}/{stats[f'{phase}_ms'][1]}" for phase in PHASES)
+            print(f"| {name:<14} n={stats['count']:<7} {phases}  errors={stats['errors']}")
+        print("+------------------------------------------------------------------------+")
+
+    def collect(self) -> list[str]:
+        """
+        Prometheus lines of the transaction phases, errors and response sizes
+        """
+        name = "sentry_modbus_transaction_seconds"
+        lines = [f"# HELP {name} Duration of each phase of the Modbus transactions, per register range",
+                 f"# TYPE {name} histogram"]
+        errors = ["# HELP sentry_modbus_transaction_errors_total Failed Modbus transactions, per error class",
+                  "# TYPE sentry_modbus_transaction_errors_total counter"]
+        sizes = ["# HELP sentry_modbus_response_bytes_total Bytes received in Modbus responses",
+                 "# TYPE sentry_modbus_response_bytes_total counter"]
+        with self._lock:
+            for (function_code, registers), stats in self.ranges.items():
+                labels = (("function", str(function_code)), ("registers", registers))
+                for phase, histogram in stats.histograms.items():
+                    lines.extend(render_histogram(name, labels + (("phase", phase),), histogram))
+                for error, count in stats.errors.items():
+                    errors.append(f'sentry_modbus_transaction_errors_total{{function="{function_code}",'
+                                  f'registers="{registers}",error="{error}"}} {count}')
+                sizes.append(f'sentry_modbus_response_bytes_total{{function="{function_code}",'
+                             f'registers="{registers}"}} {stats.response_bytes}')
+        return lines + errors + sizes
+
+
+# Stats of every Modbus client of the process, exported with the other metrics
+modbus_stats = ModbusStats()
+metrics.add_collector(modbus_stats.collect)
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from Telemetry.Metrics import metrics
+
+# Startup milestones, in the order they usually happen. The sentry is ready once it has a track to follow.
+MILESTONES = ("robot_connected", "modbus_healthy", "camera_login", "camera_connected", "first_reading", "first_track")
+
+startup_seconds = metrics.gauge("sentry_startup_seconds", "Seconds from process start to each startup milestone")
+
+
+class ReadinessGate:
+    """
+    Records when each startup milestone is first reached, counted from the creation of the gate (at import, so
+    close to the process start). Waiters can block on a milestone, and every milestone time is reported once
+    the last one (the first track) is reached.
+    """
+
+    def __init__(self, milestones: tuple = MILESTONES):
+        self.milestones = milestones
+        self.start = time.monotonic()
+        self.times = {}
+        self._events = {milestone: threading.Event() for milestone in milestones}
+        self._lock = threading.Lock()
+
+    def mark(self, milestone: str):
+        """
+        Records the milestone. Only the first call counts, so it is cheap to call on every reading
+        """
+        event = self._events[milestone]
+        if event.is_set():
+            return
+        with self._lock:
+            if event.is_set():
+                return
+            elapsed = time.monotonic() - self.start
+            self.times[milestone] = elapsed
+            event.set()
+            ready = milestone == self.milestones[-1]
+        startup_seconds.set(round(elapsed, 3), milestone=milestone)
+        print(f"[Startup] {milestone} after {elapsed:.2f}s")
+        if ready:
+            self.print_summary()
+
+    def reached(self, milestone: str) -> bool:
+        return self._events[milestone].is_set()
+
+    def wait(self, milestone: str, timeout: float | None = None) -> bool:
+        """
+        :return: True if the milestone was reached before the timeout
+        """
+        return self._events[milestone].wait(timeout)
+
+    def is_ready(self) -> bool:
+        return self.reached(self.milestones[-1])
+
+    def print_summary(self):
+        print("+------------------------------- Startup --------------------------------+")
+        for milestone in self.milestones:
+            elapsed = self.times.get(milestone)
+            print(f"| {milestone:<20} {'-' if elapsed is None else f'{elapsed:.2f}s'}")
+        print("+------------------------------------------------------------------------+")
+
+
+# Gate shared by the startup steps of the process
+readiness = ReadinessGate()
@@ -0,0 +1,130 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+# Sampling profiler of every thread of the process, switched on and off at runtime.
+# While running, a daemon thread reads the stack of every other thread at a fixed rate.
+# When stopped, the samples are written as collapsed stacks, one "thread;outer;...;inner count" line per stack,
+# which flamegraph.pl or speedscope turn into a flame graph.
+# When idle there is no sampler thread, so it costs nothing.
+
+
+class SamplingProfiler:
+    """
+    :param interval: Seconds between samples
+    :param output_dir: Directory the collapsed stack files are written to
+    """
+
+    def __init__(self, interval: float = 0.005, output_dir: str = "profiles"):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started_at = None
+        self._labels = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def sample(self):
+        """
+        Records the current stack of every thread, except the sampler
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.samples[";".join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while not self._stop.is_set():
+            self.sample()
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay < 0:
+                # Sampling took longer than the interval, do not try to catch up
+                next_sample = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.samples = Counter()
+            self.sample_count = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        print(f"[Profiler] Sampling every {self.interval * 1000:.1f}ms")
+
+    def stop(self) -> str | None:
+        """
+        Stops sampling and writes the collapsed stacks
+        :return: Path of the written file, or None if the profiler was not running
+        """
+        with self._lock:
+            if not self.running:
+                return None
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            path = self.write()
+        print(f"[Profiler] {self.sample_count} samples written to {path}")
+        return path
+
+    def toggle(self) -> str | None:
+        """
+        Starts the profiler if it is idle, otherwise stops it
+        :return: Path of the written file when stopping
+        """
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def write(self, path: str | None = None) -> str:
+        if path is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            name = time.strftime("profile-%Y%m%d-%H%M%S", time.localtime(self.started_at)) + ".collapsed"
+            path = os.path.join(self.output_dir, name)
+        with open(path, "w") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
+
+    def install_signal_handler(self, signal_number: int = getattr(signal, "SIGUSR2", None)):
+        """
+        Toggles the profiler whenever the process receives the signal (SIGUSR2 by default).
+        Must be called from the main thread
+        """
+        if signal_number is None:
+            return
+        # Stopping joins the sampler and writes the file, so it is done off the signal handler
+        signal.signal(signal_number, lambda *_: threading.Thread(target=self.toggle, name="profiler-toggle").start())
+
+
+# Profiler of the process, configured with PROFILE_INTERVAL (seconds) and PROFILE_DIR
+profiler = SamplingProfiler(float(os.getenv('PROFILE_INTERVAL', '0.005')), os.getenv('PROFILE_DIR', "profiles"))
@@ -0,0 +1,438 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Records what the arm did on every control tick: joystick input, joint angles and speeds, speed setpoints and the
+# speeds actually commanded, and the state of the sentry.
+#
+# Each tick is one fixed width row of float64 written into a preallocated in-memory chunk, which costs a single
+# array assignment on the control thread. Full chunks (or chunks older than a second) are handed to a writer thread,
+# which copies them column by column into memory-mapped files. Several recorders (the cells of a fleet) can share
+# one TelemetryWriter thread:
+#
+#   <directory>/<segment>/segment.json : schema, number of rows written, first and last time
+#   <directory>/<segment>/<column>.bin : one file per column, rows of `width` values of `dtype`, little endian
+#
+# Segments are rotated after `segment_rows` rows, and the oldest ones are deleted to stay under `max_bytes`.
+#
+#     python -m Telemetry.TelemetryRecorder summary telemetry/
+#     python -m Telemetry.TelemetryRecorder export telemetry/ --since 2026-10-19T14:00 --columns angles,command -o run.csv
+
+# (name, dtype on disk, width)
+COLUMNS = (
+    ("time", "<f8", 1),       # Wall clock, seconds since the epoch
+    ("mono", "<f8", 1),       # Monotonic clock of the tick
+    ("state", "<f4", 1),      # Index in the "states" of the segment metadata
+    ("joystick", "<f4", 2),   # NaN when there was no input
+    ("angles", "<f4", 6),     # rad
+    ("speeds", "<f4", 6),     # rad/s
+    ("setpoint", "<f4", 6),   # Speeds asked by the joystick, rad/s
+    ("command", "<f4", 6),    # Speeds sent with speedj, rad/s
+)
+ROW_WIDTH = sum(width for _, _, width in COLUMNS)
+ROW_BYTES = sum(np.dtype(dtype).itemsize * width for _, dtype, width in COLUMNS)
+SEGMENT_FILE = "segment.json"
+
+
+class TelemetryWriter:
+    """
+    Thread writing the chunks handed over by one or more recorders, in order
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, recorder: "TelemetryRecorder", chunk: np.ndarray | None, rows: int = 0):
+        """
+        :param chunk: Rows to write, or None to close the segment of the recorder
+        """
+        self._queue.put((recorder, chunk, rows))
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            recorder, chunk, rows = item
+            if chunk is None:
+                recorder._close_segment()
+            else:
+                recorder._write_chunk(chunk, rows)
+
+
+class TelemetryRecorder:
+    """
+    :param directory: Where the segments are written
+    :param chunk_rows: Rows buffered in memory before they are handed to the writer thread
+    :param segment_rows: Rows per segment, before rotating to a new one
+    :param max_bytes: Disk space of all the segments, the oldest ones are deleted beyond it
+    :param flush_interval: Seconds after which a chunk is written even if it is not full
+    :param metadata: Stored in every segment, e.g. the names of the states
+    :param writer: Writer thread shared with other recorders, the recorder starts its own by default
+    """
+
+    def __init__(self, directory: str, chunk_rows: int = 128, segment_rows: int = 100_000,
+                 max_bytes: int = 512 * 1024 * 1024, flush_interval: float = 1.0, metadata: dict | None = None,
+                 writer: TelemetryWriter | None = None):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.segment_rows = segment_rows
+        self.max_bytes = max(max_bytes, segment_rows * ROW_BYTES)
+        self.flush_interval = flush_interval
+        self.metadata = metadata or {}
+        os.makedirs(directory, exist_ok=True)
+
+        # Chunks cycle between the recording thread and the writer thread, none is allocated while recording
+        self._free = queue.Queue()
+        for _ in range(4):
+            self._free.put(np.empty((chunk_rows, ROW_WIDTH), dtype=np.float64))
+        self._chunk = self._free.get()
+        self._row = 0
+        self._chunk_start = time.monotonic()
+
+        self.rows = 0
+        self.dropped = 0
+        self.segments_deleted = 0
+        self._segment = None
+        self._closed = threading.Event()
+        self._owns_writer = writer is None
+        self._writer = writer if writer is not None else TelemetryWriter()
+
+    # Recording thread
+
+    def record(self, row):
+        """
+        Appends a row of ROW_WIDTH numbers, in the order of COLUMNS. Never blocks: if the writer is so far behind
+        that no chunk is free, the row is dropped and counted
+        """
+        chunk = self._chunk
+        if chunk is None:
+            try:
+                chunk = self._chunk = self._free.get_nowait()
+            except queue.Empty:
+                self.dropped += 1
+                return
+            self._chunk_start = time.monotonic()
+        chunk[self._row] = row
+        self._row += 1
+        if self._row == self.chunk_rows or time.monotonic() - self._chunk_start > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Hands the rows recorded so far to the writer thread
+        """
+        if self._chunk is None or self._row == 0:
+            return
+        self._writer.submit(self, self._chunk, self._row)
+        self.rows += self._row
+        self._row = 0
+        try:
+            self._chunk = self._free.get_nowait()
+        except queue.Empty:
+            self._chunk = None
+        self._chunk_start = time.monotonic()
+
+    def close(self):
+        """
+        Writes the remaining rows and closes the segment, then stops the writer thread unless it is shared
+        """
+        self.flush()
+        self._writer.submit(self, None)
+        self._closed.wait()
+        if self._owns_writer:
+            self._writer.stop()
+
+    # Writer thread
+
+    def _write_chunk(self, chunk: np.ndarray, rows: int):
+        try:
+            self._write(chunk[:rows])
+        except OSError as e:
+            print(f"[Telemetry] Could not write {rows} rows: {e}")
+        self._free.put(chunk)
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        self._closed.set()
+
+    def _write(self, rows: np.ndarray):
+        while len(rows):
+            if self._segment is None or self._segment.full():
+                if self._segment is not None:
+                    self._segment.close()
+                self._segment = Segment.create(self._new_segment_path(), self.segment_rows, self.metadata)
+                self._enforce_disk_limit()
+            written = self._segment.append(rows)
+            rows = rows[written:]
+        self._segment.flush()
+
+    def _new_segment_path(self) -> str:
+        name = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, name)
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name}-{suffix}")
+            suffix += 1
+        return path
+
+    def _enforce_disk_limit(self):
+        segments = list_segments(self.directory)
+        # Segments are preallocated, count their full size
+        total = len(segments) * self.segment_rows * ROW_BYTES
+        for path in segments[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= self.segment_rows * ROW_BYTES
+            self.segments_deleted += 1
+
+    def get_metrics(self) -> dict:
+        return {"rows": self.rows, "dropped": self.dropped, "segments_deleted": self.segments_deleted}
+
+
+class Segment:
+    """
+    A directory of memory-mapped column files, sized for `capacity` rows
+    """
+
+    def __init__(self, path: str, meta: dict, mode: str):
+        self.path = path
+        self.meta = meta
+        self.capacity = meta["capacity"]
+        self.rows = meta["rows"]
+        shape_rows = self.capacity if mode == "r+" else self.rows
+        self.columns = {}
+        for name, dtype, width in meta["columns"]:
+            if shape_rows == 0:
+                self.columns[name] = np.empty((0, width), dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode=mode,
+                                               shape=(shape_rows, width))
+
+    @classmethod
+    def create(cls, path: str, capacity: int, metadata: dict) -> "Segment":
+        os.makedirs(path)
+        meta = dict(metadata, capacity=capacity, rows=0, start=None, end=None,
+                    columns=[list(column) for column in COLUMNS])
+        for name, dtype, width in COLUMNS:
+            # Sparse until written
+            with open(os.path.join(path, f"{name}.bin"), "wb") as file:
+                file.truncate(capacity * width * np.dtype(dtype).itemsize)
+        segment = cls(path, meta, "r+")
+        segment.write_meta()
+        return segment
+
+    @classmethod
+    def open(cls, path: str) -> "Segment":
+        with open(os.path.join(path, SEGMENT_FILE)) as file:
+            return cls(path, json.load(file), "r")
+
+    def full(self) -> bool:
+        return self.rows >= self.capacity
+
+    def append(self, rows: np.ndarray) -> int:
+        """
+        :return: The number of rows that fit
+        """
+        count = min(len(rows), self.capacity - self.rows)
+        rows = rows[:count]
+        offset = 0
+        for name, _, width in COLUMNS:
+            column = self.columns[name]
+            values = rows[:, offset:offset + width]
+            column[self.rows:self.rows + count] = values
+            offset += width
+        if self.meta["start"] is None:
+            self.meta["start"] = float(rows[0, 0])
+        self.meta["end"] = float(rows[-1, 0])
+        self.rows += count
+        return count
+
+    def flush(self):
+        # The columns reach the disk before the row count that makes them visible
+        for column in self.columns.values():
+            column.flush()
+        self.write_meta()
+
+    def write_meta(self):
+        self.meta["rows"] = self.rows
+        temporary = os.path.join(self.path, SEGMENT_FILE + ".tmp")
+        with open(temporary, "w") as file:
+            json.dump(self.meta, file)
+        os.replace(temporary, os.path.join(self.path, SEGMENT_FILE))
+
+    def close(self):
+        self.flush()
+        self.columns = {}
+
+
+def list_segments(directory: str) -> list[str]:
+    """
+    :return: The segment directories, oldest first
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if os.path.exists(os.path.join(directory, name, SEGMENT_FILE))
+    )
+
+
+class TelemetryReader:
+    """
+    Reads the segments of a recording directory, including the one being written
+    """
+
+    def __init__(self, directory: str):
+        self.segments = [Segment.open(path) for path in list_segments(directory)]
+
+    def states(self) -> list[str]:
+        for segment in reversed(self.segments):
+            if "states" in segment.meta:
+                return segment.meta["states"]
+        return []
+
+    def query(self, columns=None, since: float | None = None, until: float | None = None) -> dict[str, np.ndarray]:
+        """
+        :param columns: Names of the columns, all by default
+        :param since: Oldest wall clock time
+        :param until: Newest wall clock time
+        :return: The selected columns, concatenated over the segments in the time range
+        """
+        names = [name for name, _, _ in COLUMNS] if columns is None else list(columns)
+        unknown = set(names) - {name for name, _, _ in COLUMNS}
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        parts = {name: [] for name in names}
+        for segment in self.segments:
+            if segment.rows == 0:
+                continue
+            if since is not None and segment.meta["end"] < since or until is not None and segment.meta["start"] > until:
+                continue
+            times = segment.columns["time"][:, 0]
+            start = 0 if since is None else int(np.searchsorted(times, since, "left"))
+            end = len(times) if until is None else int(np.searchsorted(times, until, "right"))
+            for name in names:
+                parts[name].append(np.asarray(segment.columns[name][start:end]))
+        return {
+            name: np.concatenate(arrays) if arrays else np.empty((0, dict((n, w) for n, _, w in COLUMNS)[name]))
+            for name, arrays in parts.items()
+        }
+
+    def summary(self, since: float | None = None, until: float | None = None) -> dict:
+        data = self.query(["time", "state", "speeds", "command"], since, until)
+        times = data["time"][:, 0]
+        if len(times) == 0:
+            return {"rows": 0}
+        states = self.states()
+        state_counts = np.bincount(data["state"][:, 0].astype(np.int64), minlength=len(states))
+        period = float(np.median(np.diff(times))) if len(times) > 1 else 0.0
+        return {
+            "rows": int(len(times)),
+            "segments": len(self.segments),
+            "start": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(times[0])),
+            "end": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(times[-1])),
+            "tick_period_s": round(period, 4),
+            "state_s": {
+                (states[i] if i < len(states) else str(i)): round(float(count) * period, 1)
+                for i, count in enumerate(state_counts) if count
+            },
+            "max_joint_speed": [round(float(v), 3) for v in np.nanmax(np.abs(data["speeds"]), axis=0)],
+            "max_command": [round(float(v), 3) for v in np.nanmax(np.abs(data["command"]), axis=0)],
+        }
+
+    def export_csv(self, file, columns=None, since: float | None = None, until: float | None = None) -> int:
+        """
+        Writes the selected columns as CSV, one row per tick
+        :return: The number of rows written
+        """
+        data = self.query(columns, since, until)
+        names = list(data)
+        header = []
+        for name in names:
+            width = data[name].shape[1]
+            header += [name] if width == 1 else [f"{name}_{i}" for i in range(width)]
+        states = self.states()
+        file.write(",".join(header) + "\n")
+        rows = len(data[names[0]]) if names else 0
+        for i in range(rows):
+            values = []
+            for name in names:
+                if name == "state" and states:
+                    values.append(states[int(data[name][i, 0])])
+                elif name in ("time", "mono"):
+                    values.append(f"{data[name][i, 0]:.6f}")
+                else:
+                    values += [f"{value:.5g}" for value in data[name][i]]
+            file.write(",".join(values) + "\n")
+        return rows
+
+
+def start_telemetry_recorder(metadata: dict | None = None, directory: str | None = None,
+                             writer: TelemetryWriter | None = None) -> TelemetryRecorder | None:
+    """
+    Starts recording to TELEMETRY_DIR, with at most TELEMETRY_MAX_MB (512 by default) of segments
+    :param writer: Writer thread shared with other recorders
+    :return: The recorder, or None if TELEMETRY_DIR is not set
+    """
+    directory = directory or os.getenv('TELEMETRY_DIR')
+    if not directory:
+        return None
+    max_bytes = int(float(os.getenv('TELEMETRY_MAX_MB', '512')) * 1024 * 1024)
+    recorder = TelemetryRecorder(directory, max_bytes=max_bytes, metadata=metadata, writer=writer)
+    print(f"[Telemetry] Recording to {directory}")
+    return recorder
+
+
+def _parse_time(text: str | None) -> float | None:
+    """
+    Seconds since the epoch, or an ISO date and time in local time
+    """
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        from datetime import datetime
+        return datetime.fromisoformat(text).timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queries the telemetry recorded by the sentry")
+    parser.add_argument("command", choices=("summary", "export"))
+    parser.add_argument("directory", help="TELEMETRY_DIR of the recording")
+    parser.add_argument("--since", help="Start time, epoch seconds or ISO date (e.g. 2026-10-19T14:00)")
+    parser.add_argument("--until", help="End time, epoch seconds or ISO date")
+    parser.add_argument("--columns", help=f"Comma separated columns to export, among {', '.join(n for n, _, _ in COLUMNS)}")
+    parser.add_argument("-o", "--output", help="CSV file to export to, standard output by default")
+    args = parser.parse_args()
+
+    reader = TelemetryReader(args.directory)
+    since, until = _parse_time(args.since), _parse_time(args.until)
+    if args.command == "summary":
+        for key, value in reader.summary(since, until).items():
+            print(f"{key}: {value}")
+    else:
+        columns = args.columns.split(",") if args.columns else None
+        if args.output:
+            with open(args.output, "w") as output:
+                count = reader.export_csv(output, columns, since, until)
+            print(f"Exported {count} rows to {args.output}")
+        else:
+            reader.export_csv(sys.stdout, columns, since, until)
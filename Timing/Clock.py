@@ -0,0 +1,116 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Time source of the control code. URSentry, BBoxProcessor and the entry points read the time, sleep and
+# schedule delayed calls through a clock instead of the time module, so the same code runs in real time with
+# the SystemClock, or as fast as possible with a VirtualClock (see Simulation/SentrySimulation.py).
+
+
+class Clock:
+    """
+    Interface of the clocks
+    """
+
+    def time(self) -> float:
+        """
+        Wall clock time, in seconds since the epoch
+        """
+        raise NotImplementedError
+
+    def monotonic(self) -> float:
+        raise NotImplementedError
+
+    def sleep(self, seconds: float):
+        raise NotImplementedError
+
+    def call_later(self, delay: float, function):
+        """
+        Calls `function()` after `delay` seconds
+        :return: A handle whose cancel() method cancels the call
+        """
+        raise NotImplementedError
+
+
+class SystemClock(Clock):
+    """
+    Real time, from the time module. Delayed calls run on a threading.Timer
+    """
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def call_later(self, delay: float, function):
+        timer = threading.Timer(delay, function)
+        timer.start()
+        return timer
+
+
+class VirtualCall:
+    """
+    Handle of a call scheduled on a VirtualClock
+    """
+    __slots__ = ("when", "function", "cancelled")
+
+    def __init__(self, when: float, function):
+        self.when = when
+        self.function = function
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock(Clock):
+    """
+    Deterministic clock that only moves when told to. sleep() advances it instantly, running the calls that
+    became due on the way, in order, on the calling thread. Meant for single threaded simulations.
+    :param start: Initial wall clock time; the monotonic time starts at 0
+    """
+
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.start = start
+        self.now = 0.0
+        self._calls = []
+        self._sequence = itertools.count()  # Keeps calls due at the same time in scheduling order
+
+    def time(self) -> float:
+        return self.start + self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def call_later(self, delay: float, function) -> VirtualCall:
+        call = VirtualCall(self.now + max(delay, 0.0), function)
+        heapq.heappush(self._calls, (call.when, next(self._sequence), call))
+        return call
+
+    def advance(self, seconds: float):
+        """
+        Moves the clock forward, running the scheduled calls at their time
+        """
+        end = self.now + max(seconds, 0.0)
+        while self._calls and self._calls[0][0] <= end:
+            when, _, call = heapq.heappop(self._calls)
+            if call.cancelled:
+                continue
+            self.now = max(self.now, when)
+            call.function()
+        self.now = end
+
+    def pending(self) -> int:
+        return sum(1 for _, _, call in self._calls if not call.cancelled)
+
+
+# Real time clock used by default
+system_clock = SystemClock()
@@ -0,0 +1,400 @@
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+
+# Lookup table from where the target is in the image, and how high the arm looks, to the joint moves that center it.
+#
+# The joystick position given by BBoxProcessor (the aim point of the box, from -1 to 1 on each axis) says in which
+# direction to turn, but not by how much: the angle behind a pixel depends on the lens, and the camera is not exactly
+# on the axis of the arm. The table gives, for a grid of image positions and pose parameters, the base rotation
+# (radians) and the change of pose parameter that bring the target to the center. The pose parameter places the
+# shoulder, elbow and wrist 1 on the line from the imposing pose (0) to the looking down pose (1), which is how
+# URSentry moves them.
+#
+#     python -m Tracking.AimCalibration model -o aim.json --hfov 90 --vfov 60
+#     python -m Tracking.AimCalibration fit --telemetry telemetry/ --prior aim.json -o aim.json
+#     python -m Tracking.AimCalibration show aim.json
+#
+# It starts from a pinhole model of the camera, refined with samples from recorded runs (see TelemetryRecorder) or
+# from the CalibrationRoutine. Lookups interpolate between the 8 surrounding grid points, so they take the same time
+# whatever the size of the table. Set AIM_CALIBRATION to the table to have URSentry use it.
+
+DEFAULT_SHAPE = (21, 21, 5)
+
+
+def pose_parameter(angles, imposing_pose, looking_down_pose) -> float:
+    """
+    Position of the shoulder, elbow and wrist 1 angles on the line from the imposing pose (0) to the looking down
+    pose (1), clamped to that range
+    """
+    direction = [looking_down_pose[i] - imposing_pose[i] for i in range(1, 4)]
+    length = sum(d * d for d in direction)
+    p = sum((angles[i] - imposing_pose[i]) * direction[i - 1] for i in range(1, 4)) / length
+    return max(0.0, min(1.0, p))
+
+
+class AimCalibration:
+    """
+    :param deltas: Array of shape (x points, y points, pose points, 2), the base rotation and the change of pose
+                   parameter centering a target at each grid point. The x and y points span -1 to 1, the pose
+                   points 0 to 1
+    :param imposing_pose: Poses defining the pose parameter
+    :param looking_down_pose:
+    :param metadata: Where the table comes from
+    """
+
+    def __init__(self, deltas: np.ndarray, imposing_pose, looking_down_pose, metadata: dict | None = None):
+        deltas = np.asarray(deltas, dtype=np.float64)
+        if deltas.ndim != 4 or deltas.shape[3] != 2 or min(deltas.shape[:3]) < 2:
+            raise ValueError(f"deltas must have a shape (x, y, pose, 2) with at least 2 points per axis, not {deltas.shape}")
+        self.deltas = deltas
+        self.shape = deltas.shape[:3]
+        self.imposing_pose = tuple(imposing_pose)
+        self.looking_down_pose = tuple(looking_down_pose)
+        self.metadata = metadata or {}
+        # Nested lists are faster to index one value at a time than an array
+        self._values = deltas.tolist()
+
+    # Lookup
+
+    @staticmethod
+    def _cell(value: float, low: float, high: float, points: int) -> tuple[int, float]:
+        """
+        :return: Index of the grid cell holding the value, and the position of the value within it (0 to 1)
+        """
+        position = (min(high, max(low, value)) - low) / (high - low) * (points - 1)
+        index = min(int(position), points - 2)
+        return index, position - index
+
+    def lookup(self, x: float, y: float, p: float) -> tuple[float, float]:
+        """
+        :param x: Normalized image position of the target, as given by BBoxProcessor
+        :param y:
+        :param p: Pose parameter of the arm, see pose_parameter
+        :return: The base rotation (radians) and the change of pose parameter that center the target
+        """
+        i, fx = self._cell(x, -1.0, 1.0, self.shape[0])
+        j, fy = self._cell(y, -1.0, 1.0, self.shape[1])
+        k, fp = self._cell(p, 0.0, 1.0, self.shape[2])
+        values = self._values
+        base = 0.0
+        pose = 0.0
+        for di, wx in ((0, 1 - fx), (1, fx)):
+            plane = values[i + di]
+            for dj, wy in ((0, 1 - fy), (1, fy)):
+                line = plane[j + dj]
+                for dk, wp in ((0, 1 - fp), (1, fp)):
+                    weight = wx * wy * wp
+                    value = line[k + dk]
+                    base += weight * value[0]
+                    pose += weight * value[1]
+        return base, pose
+
+    def pose_parameter(self, angles) -> float:
+        return pose_parameter(angles, self.imposing_pose, self.looking_down_pose)
+
+    def joint_deltas(self, x: float, y: float, angles) -> list[float]:
+        """
+        :param angles: Current joint angles
+        :return: The joint moves that center the target, staying between the imposing and looking down poses
+        """
+        p = self.pose_parameter(angles)
+        base, pose = self.lookup(x, y, p)
+        pose = max(-p, min(1 - p, pose))
+        return [base] + [pose * (self.looking_down_pose[i] - self.imposing_pose[i]) for i in range(1, 4)] + [0.0, 0.0]
+
+    def grid(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: The x, y and pose parameter of the grid points
+        """
+        return (np.linspace(-1, 1, self.shape[0]), np.linspace(-1, 1, self.shape[1]), np.linspace(0, 1, self.shape[2]))
+
+    # Construction
+
+    @classmethod
+    def from_camera_model(cls, imposing_pose, looking_down_pose, horizontal_fov: float = 90.0,
+                          vertical_fov: float = 60.0, center=(0.0, 0.0), shape=DEFAULT_SHAPE) -> "AimCalibration":
+        """
+        Table of a pinhole camera looking along the arm: the base turns by the horizontal angle of the target, and
+        the pose parameter changes by its vertical angle over the pitch change from the imposing to the looking
+        down pose
+        :param center: Normalized image position the arm points at, if the camera is not aligned with it
+        """
+        pitch_range = sum(looking_down_pose[i] - imposing_pose[i] for i in range(1, 4))
+        tan_h = math.tan(math.radians(horizontal_fov) / 2)
+        tan_v = math.tan(math.radians(vertical_fov) / 2)
+        x, y, _ = np.meshgrid(np.linspace(-1, 1, shape[0]), np.linspace(-1, 1, shape[1]), np.zeros(shape[2]),
+                              indexing="ij")
+        deltas = np.empty(tuple(shape) + (2,))
+        # A target on the right (x > 0) is reached by turning the base negatively, see URSentry
+        deltas[..., 0] = -(np.arctan(x * tan_h) - math.atan(center[0] * tan_h))
+        # A target below the center (y > 0) is reached by looking down, towards p = 1
+        deltas[..., 1] = (np.arctan(y * tan_v) - math.atan(center[1] * tan_v)) / pitch_range
+        return cls(deltas, imposing_pose, looking_down_pose, {
+            "source": "camera_model", "horizontal_fov": horizontal_fov, "vertical_fov": vertical_fov,
+            "center": list(center),
+        })
+
+    def fit(self, samples, bandwidth: float = 1.5, prior_weight: float = 1.0) -> "AimCalibration":
+        """
+        Refines this table with measured samples. At each grid point, the difference between the samples and the
+        table is averaged with a Gaussian kernel, and shrunk towards 0 where samples are few
+        :param samples: (x, y, p, base delta, pose delta) of each sample
+        :param bandwidth: Width of the kernel, in grid steps
+        :param prior_weight: Weight of the current table against the samples, at each grid point
+        :return: The refined table
+        """
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, 5)
+        if len(samples) == 0:
+            return self
+        residuals = samples[:, 3:5] - np.array([self.lookup(x, y, p) for x, y, p in samples[:, :3]])
+
+        steps = np.array([2 / (self.shape[0] - 1), 2 / (self.shape[1] - 1), 1 / (self.shape[2] - 1)])
+        gx, gy, gp = np.meshgrid(*self.grid(), indexing="ij")
+        nodes = np.stack([gx.ravel(), gy.ravel(), gp.ravel()], axis=1)
+        deltas = self.deltas.reshape(-1, 2).copy()
+        for start in range(0, len(nodes), 512):
+            block = nodes[start:start + 512]
+            distances = ((block[:, None, :] - samples[None, :, :3]) / steps) ** 2
+            weights = np.exp(-0.5 * distances.sum(axis=2) / bandwidth ** 2)
+            deltas[start:start + 512] += weights @ residuals / (weights.sum(axis=1, keepdims=True) + prior_weight)
+
+        metadata = dict(self.metadata)
+        metadata["samples"] = metadata.get("samples", 0) + len(samples)
+        # How far the table was from the samples, for the base and the pose parameter
+        metadata["prior_rms"] = np.sqrt(np.mean(residuals ** 2, axis=0)).round(5).tolist()
+        return AimCalibration(deltas.reshape(self.deltas.shape), self.imposing_pose, self.looking_down_pose, metadata)
+
+    # Files
+
+    def to_dict(self) -> dict:
+        return {
+            "imposing_pose": list(self.imposing_pose),
+            "looking_down_pose": list(self.looking_down_pose),
+            "metadata": self.metadata,
+            "deltas": np.round(self.deltas, 6).tolist(),
+        }
+
+    def save(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, path: str) -> "AimCalibration":
+        """
+        :raises ValueError: if the file is not a valid table
+        """
+        with open(path) as file:
+            data = json.load(file)
+        try:
+            return cls(np.array(data["deltas"]), data["imposing_pose"], data["looking_down_pose"],
+                       data.get("metadata"))
+        except KeyError as e:
+            raise ValueError(f"{path}: missing {e}") from None
+
+
+def load_aim_calibration(path: str | None = None) -> AimCalibration | None:
+    """
+    Loads the table at `path`, AIM_CALIBRATION by default
+    :return: The table, or None if no path is set or the table could not be loaded
+    """
+    path = path or os.getenv('AIM_CALIBRATION')
+    if not path:
+        return None
+    try:
+        calibration = AimCalibration.load(path)
+    except (OSError, ValueError) as e:
+        print(f"[AimCalibration] Could not load {path}: {e}")
+        return None
+    print(f"[AimCalibration] Loaded {path} ({calibration.metadata.get('source', 'fitted')}, "
+          f"{calibration.metadata.get('samples', 0)} samples)")
+    return calibration
+
+
+# Samples
+
+def samples_from_telemetry(directory: str, imposing_pose, looking_down_pose, horizon: float = 2.0,
+                           centered: float = 0.03, since: float | None = None, until: float | None = None) -> list:
+    """
+    Samples of recorded runs (see Telemetry/TelemetryRecorder.py). While following, each tick is paired with the
+    first tick, within `horizon` seconds, where the target is centered: the joint moves in between are the ones
+    that centered the target seen at the first tick. This holds for a target standing still or moving slowly, so
+    the horizon is kept short.
+    :param centered: Largest joystick position, on both axes, of a centered target
+    :return: (x, y, p, base delta, pose delta) of each sample
+    """
+    from Telemetry.TelemetryRecorder import TelemetryReader
+
+    reader = TelemetryReader(directory)
+    states = reader.states()
+    if "following" not in states:
+        return []
+    data = reader.query(["mono", "state", "joystick", "angles"], since, until)
+    mono = data["mono"][:, 0]
+    following = data["state"][:, 0] == states.index("following")
+    joystick = data["joystick"].astype(np.float64)
+    angles = data["angles"].astype(np.float64)
+    valid = following & np.isfinite(joystick).all(axis=1)
+    is_centered = valid & (np.abs(joystick) <= centered).all(axis=1)
+    centered_rows = np.flatnonzero(is_centered)
+    # A pair must not span ticks that were not following
+    breaks = np.cumsum(~valid)
+
+    samples = []
+    for i in np.flatnonzero(valid & ~is_centered):
+        n = np.searchsorted(centered_rows, i)
+        if n == len(centered_rows):
+            break
+        j = centered_rows[n]
+        if not 0 < mono[j] - mono[i] <= horizon or breaks[j] != breaks[i]:
+            continue
+        p_start = pose_parameter(angles[i], imposing_pose, looking_down_pose)
+        p_end = pose_parameter(angles[j], imposing_pose, looking_down_pose)
+        samples.append((float(joystick[i, 0]), float(joystick[i, 1]), p_start, float(angles[j, 0] - angles[i, 0]),
+                        p_end - p_start))
+    return samples
+
+
+class CalibrationRoutine:
+    """
+    Measures the table around the current pose, with a target standing still in front of the arm (a person, or a
+    marker the detector sees).
+
+    The arm visits a grid of base rotations and pose parameters with movej, and the target's position in the image
+    is read at each stop. The pose that centers the target is then found from the observations closest to the
+    center, and every observation gives a sample: the moves from its pose to that one.
+
+    :param robot: URRobot, AsyncURRobot or FakeURRobot
+    :param observe: observe() returns the normalized position of the target ([x, y], as BBoxProcessor gives it),
+                    or None if it is not seen
+    :param clock: Time source, to wait for the arm to stop
+    :param base_offsets: Base rotations around the starting angle, in radians
+    :param pose_parameters: Pose parameters visited, see pose_parameter
+    """
+
+    def __init__(self, robot, observe, clock, imposing_pose, looking_down_pose,
+                 base_offsets=(-0.5, -0.3, -0.15, 0.0, 0.15, 0.3, 0.5), pose_parameters=(0.0, 0.25, 0.5, 0.75, 1.0),
+                 acceleration: float = 0.5, speed: float = 0.5, readings: int = 3):
+        self.robot = robot
+        self.observe = observe
+        self.clock = clock
+        self.imposing_pose = tuple(imposing_pose)
+        self.looking_down_pose = tuple(looking_down_pose)
+        self.base_offsets = base_offsets
+        self.pose_parameters = pose_parameters
+        self.acceleration = acceleration
+        self.speed = speed
+        self.readings = readings
+        self.observations = []
+
+    def pose(self, base: float, p: float) -> list[float]:
+        return [base] + [self.imposing_pose[i] + p * (self.looking_down_pose[i] - self.imposing_pose[i])
+                         for i in range(1, 6)]
+
+    def wait_for_stop(self, timeout: float = 15.0, still_ticks: int = 3):
+        deadline = self.clock.monotonic() + timeout
+        still = 0
+        while still < still_ticks and self.clock.monotonic() < deadline:
+            self.clock.sleep(0.1)
+            still = still + 1 if all(speed == 0 for speed in self.robot.get_joint_speeds()) else 0
+
+    def run(self) -> list:
+        """
+        Sweeps the poses, then returns the arm to where it started
+        :return: (x, y, p, base delta, pose delta) of each sample
+        :raises ValueError: if the target was not seen from enough poses
+        """
+        start = self.robot.get_joint_angles()
+        for p in self.pose_parameters:
+            for offset in self.base_offsets:
+                self.robot.movej(self.pose(start[0] + offset, p), self.acceleration, self.speed)
+                self.wait_for_stop()
+                positions = []
+                for _ in range(self.readings):
+                    position = self.observe()
+                    if position is not None:
+                        positions.append(position)
+                    self.clock.sleep(0.1)
+                if positions:
+                    x, y = np.median(np.array(positions), axis=0)
+                    self.observations.append((float(x), float(y), start[0] + offset, p))
+                    print(f"[AimCalibration] base {offset:+.2f} p {p:.2f}: target at ({x:.3f}, {y:.3f})")
+                else:
+                    print(f"[AimCalibration] base {offset:+.2f} p {p:.2f}: target not seen")
+        self.robot.movej(start, self.acceleration, self.speed)
+        self.wait_for_stop()
+        return self.samples()
+
+    def samples(self) -> list:
+        """
+        Fits the image position as an affine function of the base angle and pose parameter, on the observations
+        near the center, and solves it for the centering pose
+        """
+        observations = np.array(self.observations, dtype=np.float64).reshape(-1, 4)
+        near = observations[(np.abs(observations[:, :2]) <= 0.6).all(axis=1)]
+        if len(near) < 3:
+            near = observations
+        if len(near) < 3:
+            raise ValueError(f"The target was seen from {len(observations)} poses, at least 3 are needed")
+        design = np.column_stack([np.ones(len(near)), near[:, 2], near[:, 3]])
+        coefficients, *_ = np.linalg.lstsq(design, near[:, :2], rcond=None)
+        # x = a0 + a1 base + a2 p, y = b0 + b1 base + b2 p, both 0 at the centering pose
+        gains = coefficients[1:].T
+        if abs(np.linalg.det(gains)) < 1e-9:
+            raise ValueError("The target did not move in the image as the arm moved")
+        base_center, p_center = np.linalg.solve(gains, -coefficients[0])
+        print(f"[AimCalibration] Target centered at base {base_center:.3f} p {p_center:.3f}")
+        return [(x, y, p, base_center - base, p_center - p) for x, y, base, p in observations]
+
+
+def _show(calibration: AimCalibration):
+    print(json.dumps(calibration.metadata))
+    xs, ys, ps = calibration.grid()
+    for p in ps:
+        print(f"pose parameter {p:.2f}: base delta (rad) along x at y = 0, then pose delta along y at x = 0")
+        print("  " + "  ".join(f"{x:+.1f}: {calibration.lookup(x, 0, p)[0]:+.3f}" for x in xs[::4]))
+        print("  " + "  ".join(f"{y:+.1f}: {calibration.lookup(0, y, p)[1]:+.3f}" for y in ys[::4]))
+
+
+if __name__ == "__main__":
+    from Config.SentryConfig import load_config
+
+    parser = argparse.ArgumentParser(description="Builds the lookup table from image positions to the joint moves centering them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    model = commands.add_parser("model", help="Table of a pinhole camera along the arm")
+    model.add_argument("--hfov", type=float, default=90.0, help="Horizontal field of view, degrees")
+    model.add_argument("--vfov", type=float, default=60.0, help="Vertical field of view, degrees")
+    model.add_argument("--center", type=float, nargs=2, default=(0.0, 0.0), help="Normalized image position the arm points at")
+    model.add_argument("--shape", type=int, nargs=3, default=DEFAULT_SHAPE, help="Points along x, y and the pose parameter")
+    model.add_argument("-o", "--output", required=True)
+    fit = commands.add_parser("fit", help="Refines a table with recorded runs")
+    fit.add_argument("--telemetry", action="append", required=True, help="TELEMETRY_DIR of a run, can be repeated")
+    fit.add_argument("--prior", help="Table to refine, the camera model by default")
+    fit.add_argument("--horizon", type=float, default=2.0, help="Longest time to center a target, seconds")
+    fit.add_argument("--bandwidth", type=float, default=1.5, help="Smoothing, in grid steps")
+    fit.add_argument("-o", "--output", required=True)
+    show = commands.add_parser("show", help="Prints a table")
+    show.add_argument("table")
+    args = parser.parse_args()
+
+    control = load_config().control
+    if args.command == "model":
+        table = AimCalibration.from_camera_model(control.imposing_pose, control.looking_down_pose, args.hfov, args.vfov,
+                                                 args.center, args.shape)
+        table.save(args.output)
+        _show(table)
+    elif args.command == "fit":
+        table = AimCalibration.load(args.prior) if args.prior else \
+            AimCalibration.from_camera_model(control.imposing_pose, control.looking_down_pose)
+        samples = []
+        for directory in args.telemetry:
+            samples += samples_from_telemetry(directory, table.imposing_pose, table.looking_down_pose, args.horizon)
+        print(f"{len(samples)} samples")
+        table = table.fit(samples, args.bandwidth)
+        table.save(args.output)
+        _show(table)
+    else:
+        _show(AimCalibration.load(args.table))
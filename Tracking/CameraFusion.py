@@ -0,0 +1,189 @@
+import json
+import math
+
+from BBoxProcessor import BBoxProcessor
+from Telemetry.LatencyTrace import DetectionTrace
+from Telemetry.Metrics import metrics
+from Tracking.TargetSelector import SelectionPolicy
+from Timing.Clock import Clock, system_clock
+
+out_of_view_total = metrics.counter("sentry_fusion_out_of_view_total",
+                                    "Aim points outside the image of the arm camera, followed at a reduced speed")
+
+
+def wrap_degrees(angle: float) -> float:
+    """
+    Wraps an angle to (-180, 180]
+    """
+    angle = (angle + 180.0) % 360.0 - 180.0
+    return 180.0 if angle == -180.0 else angle
+
+
+def arm_heading(angles, level: float) -> tuple[float, float]:
+    """
+    Bearing (yaw, pitch) in degrees of a camera carried by the arm, relative to its bearing at base angle 0 and at the
+    middle point pose. A positive base angle turns it left, and its pitch follows the sum of the shoulder, elbow and
+    wrist 1 angles
+    :param angles: Joint angles in radians
+    :param level: Sum of the shoulder, elbow and wrist 1 angles of the middle point pose, in radians
+    """
+    yaw = wrap_degrees(-math.degrees(angles[0]))
+    pitch = math.degrees(angles[1] + angles[2] + angles[3] - level)
+    return yaw, pitch
+
+
+class CameraCalibration:
+    """
+    Maps the image coordinates of a camera (0 to 1000 in both axes, as sent by Unifi) to bearings in a common frame.
+
+    `yaw` and `pitch` are the bearing, in degrees, of the center of the image in the common frame.
+    Azimuth grows to the right and elevation grows downwards, like the image coordinates.
+    """
+
+    def __init__(self, camera_id: str, yaw: float = 0.0, pitch: float = 0.0, horizontal_fov: float = 90.0, vertical_fov: float = 60.0):
+        self.camera_id = camera_id
+        self.yaw = yaw
+        self.pitch = pitch
+        self.horizontal_fov = horizontal_fov
+        self.vertical_fov = vertical_fov
+        self._tan_half_h = math.tan(math.radians(horizontal_fov / 2))
+        self._tan_half_v = math.tan(math.radians(vertical_fov / 2))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CameraCalibration":
+        return cls(
+            data["camera"],
+            data.get("yaw", 0.0),
+            data.get("pitch", 0.0),
+            data.get("horizontal_fov", 90.0),
+            data.get("vertical_fov", 60.0),
+        )
+
+    def to_bearing(self, x: float, y: float) -> tuple[float, float]:
+        """
+        Bearing (azimuth, elevation) in degrees of an image point, using a pinhole model
+        """
+        azimuth = self.yaw + math.degrees(math.atan((x / 500.0 - 1) * self._tan_half_h))
+        elevation = self.pitch + math.degrees(math.atan((y / 500.0 - 1) * self._tan_half_v))
+        return wrap_degrees(azimuth), elevation
+
+    def to_image(self, azimuth: float, elevation: float) -> tuple[float, float]:
+        """
+        Projection of a bearing on this camera's image plane, the inverse of to_bearing inside the field of view.
+        Outside of it, the projection is equiangular, which stays finite for bearings far from the camera's axis.
+        """
+        x = 500.0 + 500.0 * _project(wrap_degrees(azimuth - self.yaw), self.horizontal_fov / 2, self._tan_half_h)
+        y = 500.0 + 500.0 * _project(elevation - self.pitch, self.vertical_fov / 2, self._tan_half_v)
+        return x, y
+
+
+def _project(angle: float, half_fov: float, tan_half_fov: float) -> float:
+    """
+    Position from -1 to 1 across the image of an angle from its center, pinhole inside the half field of view and
+    equiangular outside of it, where both meet at the border
+    """
+    if abs(angle) <= half_fov:
+        return math.tan(math.radians(angle)) / tan_half_fov
+    return angle / half_fov
+
+
+def load_calibrations(path: str) -> dict[str, CameraCalibration]:
+    """
+    Loads a JSON list of calibrations, e.g. [{"camera": "668daa1e019ce603e4002d31", "yaw": 0, "horizontal_fov": 90}]
+    """
+    with open(path) as file:
+        return {data["camera"]: CameraCalibration.from_dict(data) for data in json.load(file)}
+
+
+class CameraFusion(BBoxProcessor):
+    """
+    Tracks the detections of several cameras as one set of targets.
+
+    Every box is converted to a bearing with its camera's calibration, and then projected on the image plane of the
+    reference camera (the one on the arm, which the joystick position is relative to). Boxes from the other cameras
+    simply land outside the 0-1000 range, so a target walking from one camera into another keeps its track ID and the
+    lock-on. Each camera sends its own frames: tracks seen by the other cameras survive on their time to live.
+
+    The other cameras are fixed, and their calibrations give their bearing in the frame of the robot base. The
+    calibration of the reference camera gives its bearing at base angle 0 and at the middle point pose: once
+    follow_arm is called, it turns with the joint angles of the robot, otherwise it is taken as fixed.
+    Aim points outside the reference image are followed with the largest joystick axis at `out_of_view_joystick`,
+    instead of turning the arm at full speed towards a target it cannot see.
+    """
+
+    def __init__(self, calibrations: dict[str, CameraCalibration], reference_camera: str, selector: SelectionPolicy | None = None,
+                 dist_threshold=80, time_to_live=0.5, assignment="greedy", clock: Clock = system_clock,
+                 out_of_view_joystick: float = 0.5):
+        super().__init__(selector, dist_threshold, time_to_live, assignment, clock)
+        if reference_camera not in calibrations:
+            raise ValueError(f"No calibration for the reference camera {reference_camera}")
+        self.calibrations = calibrations
+        self.reference = calibrations[reference_camera]
+        self.frames_per_camera = {camera: 0 for camera in calibrations}
+        self.out_of_view_joystick = out_of_view_joystick
+        self.out_of_view = 0
+        self.sentry = None
+
+    def follow_arm(self, sentry):
+        """
+        Turns the reference camera with the arm carrying it
+        :param sentry: URSentry driving the arm. The joint angles are the last ones its control loop read, and the
+            middle point pose of its current config levels the camera
+        """
+        self.sentry = sentry
+
+    def current_reference(self) -> CameraCalibration:
+        """
+        Calibration of the reference camera at the last joint angles read from the robot
+        """
+        if self.sentry is None:
+            return self.reference
+        angles, _ = self.sentry.robot.last_joint_state()
+        if angles is None:
+            return self.reference
+        config = self.sentry.config
+        level = sum((config.imposing_pose[i] + config.looking_down_pose[i]) / 2 for i in range(1, 4))
+        yaw, pitch = arm_heading(angles, level)
+        reference = self.reference
+        return CameraCalibration(reference.camera_id, wrap_degrees(reference.yaw + yaw), reference.pitch + pitch,
+                                 reference.horizontal_fov, reference.vertical_fov)
+
+    def to_reference_box(self, camera_id: str, box: list, reference: CameraCalibration | None = None) -> list:
+        """
+        Converts a box of a camera to the image coordinates of the reference camera
+        :param reference: Current calibration of the reference camera, see current_reference
+        """
+        calibration = self.calibrations[camera_id]
+        if calibration is self.reference:
+            return box
+        if reference is None:
+            reference = self.current_reference()
+        x0, y0 = reference.to_image(*calibration.to_bearing(box[0], box[1]))
+        x1, y1 = reference.to_image(*calibration.to_bearing(box[0] + box[2], box[1] + box[3]))
+        return [x0, y0, x1 - x0, y1 - y0]
+
+    def get_joystick_position_from_camera(self, camera_id: str | None, new_boxes: list, trace: DetectionTrace | None = None) -> list | None:
+        """
+        Same as get_joystick_position_from_new_set_of_bboxes, for boxes seen by the given camera.
+        Boxes from unknown cameras are ignored, and boxes without camera are taken as seen by the reference camera.
+        """
+        if camera_id is None:
+            camera_id = self.reference.camera_id
+        if camera_id not in self.calibrations:
+            new_boxes = []
+        else:
+            self.frames_per_camera[camera_id] += 1
+            reference = self.current_reference() if camera_id != self.reference.camera_id else self.reference
+            new_boxes = [self.to_reference_box(camera_id, box, reference) for box in new_boxes]
+        return self.get_joystick_position_from_new_set_of_bboxes(new_boxes, trace)
+
+    def get_normalized_box_position(self, box: list) -> list:
+        position = super().get_normalized_box_position(box)
+        largest = max(abs(position[0]), abs(position[1]))
+        if largest <= 1.0:
+            return position
+        # The target is outside the image of the arm camera: turn towards it at a reduced speed, keeping the direction
+        self.out_of_view += 1
+        out_of_view_total.inc()
+        scale = self.out_of_view_joystick / largest
+        return [round(position[0] * scale, 3), round(position[1] * scale, 3)]
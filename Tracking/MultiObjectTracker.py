@@ -0,0 +1,153 @@
+import itertools
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+class Track:
+    """
+    Compact record of a tracked object. The box itself lives in the tracker arrays, at index `slot`.
+    """
+    __slots__ = ("track_id", "slot", "first_seen")
+
+    def __init__(self, track_id: int, slot: int, first_seen: float):
+        self.track_id = track_id
+        self.slot = slot
+        self.first_seen = first_seen
+
+    def __repr__(self):
+        return f"Track(id={self.track_id}, slot={self.slot})"
+
+
+class MultiObjectTracker:
+    """
+    Multi-object tracker that keeps its state in preallocated NumPy arrays.
+
+    Every update builds the squared center-distance cost matrix between live tracks and new boxes in one step,
+    and assigns them one-to-one, either greedily (cheapest pair first) or optimally with the Hungarian
+    algorithm (requires scipy, falls back to greedy otherwise).
+    New boxes that match a track keep its ID. Unmatched tracks survive until `time_to_live` seconds after
+    their last appearance. Unmatched boxes start new tracks.
+    """
+
+    def __init__(self, dist_threshold: float = 80, time_to_live: float = 0.5, capacity: int = 64, assignment: str = "greedy"):
+        if assignment not in ("greedy", "hungarian"):
+            raise ValueError(f"Unknown assignment method: {assignment}")
+        if assignment == "hungarian" and linear_sum_assignment is None:
+            print("scipy is not installed, using greedy assignment")
+            assignment = "greedy"
+        self.assignment = assignment
+        self.dist_threshold = dist_threshold
+        self.time_to_live = time_to_live
+
+        self.boxes = np.zeros((capacity, 4), dtype=np.float64)
+        self.centers = np.zeros((capacity, 2), dtype=np.float64)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.records: list[Track | None] = [None] * capacity
+
+        self._next_id = itertools.count()
+
+    @property
+    def capacity(self) -> int:
+        return len(self.records)
+
+    def _grow(self):
+        """
+        Doubles the capacity of the arrays. Only happens when more objects are alive than ever before.
+        """
+        capacity = self.capacity
+        self.boxes = np.concatenate([self.boxes, np.zeros_like(self.boxes)])
+        self.centers = np.concatenate([self.centers, np.zeros_like(self.centers)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros_like(self.last_seen)])
+        self.active = np.concatenate([self.active, np.zeros_like(self.active)])
+        self.records.extend([None] * capacity)
+
+    def _assign(self, cost: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        One-to-one assignment of rows (tracks) to columns (new boxes), only for pairs below the threshold
+        :return: matched row indices and column indices
+        """
+        max_cost = self.dist_threshold ** 2
+        if self.assignment == "hungarian":
+            # Pairs above the threshold are made too expensive to ever be preferred, and discarded afterwards
+            rows, cols = linear_sum_assignment(np.where(cost < max_cost, cost, max_cost * 1e3))
+            keep = cost[rows, cols] < max_cost
+            return rows[keep], cols[keep]
+
+        rows, cols = np.nonzero(cost < max_cost)
+        if len(rows) == 0:
+            return rows, cols
+        order = np.argsort(cost[rows, cols], kind="stable")
+        used_rows = set()
+        used_cols = set()
+        matched_rows = []
+        matched_cols = []
+        for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+            if row in used_rows or col in used_cols:
+                continue
+            used_rows.add(row)
+            used_cols.add(col)
+            matched_rows.append(row)
+            matched_cols.append(col)
+        return np.array(matched_rows, dtype=np.intp), np.array(matched_cols, dtype=np.intp)
+
+    def update(self, new_boxes: list, timestamp: float) -> list[Track]:
+        """
+        Receives a reading of bounding boxes ([x, y, w, h] each) and updates the tracks
+        :return: the live tracks
+        """
+        live = np.flatnonzero(self.active)
+        matched_slots = np.zeros(0, dtype=np.intp)
+
+        if len(new_boxes):
+            boxes = np.asarray(new_boxes, dtype=np.float64).reshape(-1, 4)
+            centers = boxes[:, :2] + boxes[:, 2:] / 2
+            new_is_matched = np.zeros(len(boxes), dtype=bool)
+
+            if len(live):
+                diff = self.centers[live, None, :] - centers[None, :, :]
+                cost = np.einsum("ijk,ijk->ij", diff, diff)
+                rows, cols = self._assign(cost)
+                matched_slots = live[rows]
+                self.boxes[matched_slots] = boxes[cols]
+                self.centers[matched_slots] = centers[cols]
+                self.last_seen[matched_slots] = timestamp
+                new_is_matched[cols] = True
+
+            unmatched = np.flatnonzero(~new_is_matched)
+            if len(unmatched):
+                free = np.flatnonzero(~self.active)
+                while len(free) < len(unmatched):
+                    self._grow()
+                    free = np.flatnonzero(~self.active)
+                slots = free[:len(unmatched)]
+                self.boxes[slots] = boxes[unmatched]
+                self.centers[slots] = centers[unmatched]
+                self.last_seen[slots] = timestamp
+                self.active[slots] = True
+                for slot in slots.tolist():
+                    self.records[slot] = Track(next(self._next_id), slot, timestamp)
+
+        # Unmatched tracks die once they outlive their last appearance
+        expired = self.active & (timestamp >= self.last_seen + self.time_to_live)
+        expired[matched_slots] = False
+        for slot in np.flatnonzero(expired).tolist():
+            self.records[slot] = None
+        self.active &= ~expired
+
+        return self.get_tracks()
+
+    def get_tracks(self) -> list[Track]:
+        return [self.records[slot] for slot in np.flatnonzero(self.active).tolist()]
+
+    def get_box(self, track: Track) -> list:
+        return self.boxes[track.slot].tolist()
+
+    def reset(self):
+        self.active[:] = False
+        self.records = [None] * self.capacity
@@ -0,0 +1,195 @@
+import math
+from collections import deque
+
+from Timing.Clock import Clock, system_clock
+
+# Unifi Protect gives boxes in a 1000x1000 image, whatever the resolution of the camera
+IMAGE_CENTER = (500.0, 500.0)
+IMAGE_HALF_SIZE = 500.0
+# The arm aims at the upper third of a box, around the chest of a person
+AIM_HEIGHT = 1 / 3
+# The original selection measures the distance from the middle of the boxes to a point above the image center
+SELECTION_CENTER = (500.0, 400.0)
+
+
+class SelectionPolicy:
+    """
+    Base class for target selection policies.
+    A policy receives the tracked boxes of the current frame and decides which one the robot should follow.
+    Tracks are given as (track_id, box, first_seen) tuples, where box is [x, y, w, h] in the 0-1000 image range.
+    """
+
+    def select(self, tracks: list, timestamp: float) -> tuple | None:
+        """
+        Returns the (track_id, box) to follow, or None if there is nothing to follow
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+    def get_metrics(self) -> dict:
+        return {}
+
+
+class ClosestToCenterPolicy(SelectionPolicy):
+    """
+    Original behaviour: every frame follows whichever box has its middle closest to SELECTION_CENTER.
+    """
+
+    def __init__(self, center=SELECTION_CENTER):
+        self.center = center
+
+    def select(self, tracks: list, timestamp: float) -> tuple | None:
+        closest = None
+        closest_distance = math.inf
+        for track_id, box, _ in tracks:
+            distance = (box[0] + box[2] / 2 - self.center[0]) ** 2 + (box[1] + box[3] / 2 - self.center[1]) ** 2
+            if distance < closest_distance:
+                closest = (track_id, box)
+                closest_distance = distance
+        return closest
+
+
+class LockOnPolicy(SelectionPolicy):
+    """
+    Locks onto a track ID and keeps following it while it is alive.
+
+    Candidates are scored by size, dwell time and centrality of their aim point (each normalized to 0-1 and
+    weighted). Every track is scored once per frame, so crowded scenes cost O(N).
+    A challenger only steals the lock if its score beats the locked target by `switch_margin`
+    continuously for at least `min_switch_time` seconds. If the locked target disappears, the best
+    candidate is acquired right away.
+    """
+
+    def __init__(
+        self,
+        switch_margin: float = 0.15,
+        min_switch_time: float = 0.4,
+        size_weight: float = 0.3,
+        dwell_weight: float = 0.2,
+        centrality_weight: float = 0.5,
+        center=IMAGE_CENTER,
+        dwell_saturation: float = 2.0,
+        metrics_window: float = 10.0,
+        clock: Clock = system_clock,
+    ):
+        self.switch_margin = switch_margin
+        self.min_switch_time = min_switch_time
+        self.size_weight = size_weight
+        self.dwell_weight = dwell_weight
+        self.centrality_weight = centrality_weight
+        self.center = center
+        self.dwell_saturation = dwell_saturation
+        self.clock = clock
+        # Largest distance from the center that can happen inside a 1000x1000 image
+        self.max_center_distance = math.hypot(max(center[0], 1000 - center[0]), max(center[1], 1000 - center[1]))
+
+        self.locked_id = None
+        self.challenger_id = None
+        self.challenger_since = 0.0
+
+        # Metrics
+        self.metrics_window = metrics_window
+        self.switch_times = deque()
+        self.switches = 0
+        self.acquisitions = 0
+        self.selections = 0
+        self.locked_since = None
+        self.locked_time = 0.0
+
+    def score(self, box: list, dwell: float) -> float:
+        """
+        Priority of a box, between 0 and 1
+        """
+        size = min(1.0, math.sqrt(max(box[2], 0) * max(box[3], 0)) / 1000.0)
+        dwell = min(1.0, dwell / self.dwell_saturation)
+        distance = math.hypot(box[0] + box[2] / 2 - self.center[0], box[1] + box[3] * AIM_HEIGHT - self.center[1])
+        centrality = 1.0 - min(1.0, distance / self.max_center_distance)
+        return self.size_weight * size + self.dwell_weight * dwell + self.centrality_weight * centrality
+
+    def select(self, tracks: list, timestamp: float) -> tuple | None:
+        self.selections += 1
+        if not tracks:
+            self._unlock(timestamp)
+            return None
+
+        best_id, best_box, best_first_seen = max(tracks, key=lambda track: self.score(track[1], timestamp - track[2]))
+
+        locked = None
+        for track in tracks:
+            if track[0] == self.locked_id:
+                locked = track
+                break
+
+        if locked is None:
+            # Lost (or never had) a target: acquire the best one immediately
+            if self.locked_id is not None:
+                self.switch_times.append(timestamp)
+                self.switches += 1
+            self._unlock(timestamp)
+            self._lock(best_id, timestamp)
+            self.acquisitions += 1
+            return best_id, best_box
+
+        if best_id == self.locked_id:
+            self.challenger_id = None
+            return locked[0], locked[1]
+
+        locked_score = self.score(locked[1], timestamp - locked[2])
+        best_score = self.score(best_box, timestamp - best_first_seen)
+        if best_score < locked_score + self.switch_margin:
+            self.challenger_id = None
+            return locked[0], locked[1]
+
+        # The challenger must keep its advantage for a while before we switch
+        if self.challenger_id != best_id:
+            self.challenger_id = best_id
+            self.challenger_since = timestamp
+            return locked[0], locked[1]
+        if timestamp - self.challenger_since < self.min_switch_time:
+            return locked[0], locked[1]
+
+        self.switch_times.append(timestamp)
+        self.switches += 1
+        self._unlock(timestamp)
+        self._lock(best_id, timestamp)
+        return best_id, best_box
+
+    def reset(self):
+        self._unlock(self.clock.time())
+
+    def _lock(self, track_id, timestamp):
+        self.locked_id = track_id
+        self.locked_since = timestamp
+        self.challenger_id = None
+
+    def _unlock(self, timestamp):
+        if self.locked_since is not None:
+            self.locked_time += timestamp - self.locked_since
+        self.locked_id = None
+        self.locked_since = None
+        self.challenger_id = None
+
+    def get_switch_rate(self, now: float | None = None) -> float:
+        """
+        Returns the number of switches per second over the last `metrics_window` seconds
+        """
+        now = self.clock.time() if now is None else now
+        while self.switch_times and self.switch_times[0] < now - self.metrics_window:
+            self.switch_times.popleft()
+        return len(self.switch_times) / self.metrics_window
+
+    def get_metrics(self, now: float | None = None) -> dict:
+        now = self.clock.time() if now is None else now
+        locked_time = self.locked_time
+        if self.locked_since is not None:
+            locked_time += now - self.locked_since
+        return {
+            "locked_id": self.locked_id,
+            "switches": self.switches,
+            "acquisitions": self.acquisitions,
+            "selections": self.selections,
+            "switch_rate": self.get_switch_rate(now),
+            "locked_time": round(locked_time, 3),
+        }
@@ -1,22 +1,72 @@
 from Robot.UR.URRobot import URRobot
 from time import sleep
 import math
-import threading
+import time
 from Robot.UR.URModbusServer import ModbusError
+from Robot.UR.EmergencyStop import EmergencyStop
+from Telemetry.LatencyTrace import DetectionTrace, tracer
+from Telemetry.Metrics import metrics
+from Telemetry.ReadinessGate import readiness
+from Timing.Clock import Clock, system_clock
+from Config.SentryConfig import ControlConfig
+from Motion.VelocityProfile import VelocityProfile
+from Tracking.AimCalibration import AimCalibration
+
+TICK_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.15, 0.25, 0.5, 1.0)
+tick_seconds = metrics.histogram("sentry_tick_seconds", "Time spent in each control tick", TICK_BUCKETS)
+tick_interval_seconds = metrics.histogram("sentry_tick_interval_seconds", "Time between the starts of consecutive control ticks", TICK_BUCKETS)
+tick_jitter_seconds = metrics.histogram("sentry_tick_jitter_seconds", "Deviation of the tick interval from the tick period", TICK_BUCKETS)
+state_gauge = metrics.gauge("sentry_state", "Current state of the sentry, 1 for the active state")
+
+# States reported by URSentry.get_state
+STATES = ("estopped", "robot_fault", "modbus_unhealthy", "initializing", "awaiting_stop", "returning_to_zero", "sentry", "following")
+STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+NO_JOINTS = (math.nan,) * 6
 
 class URSentry:
-    def __init__(self, host):
-        self.robot = URRobot(host)
-        self.sentry_pose = [0.785, -2.094, 0.96, -0.436, -1.571, 1.326]
+    def __init__(self, host, robot=None, call_later=None, tick_period=0.1, clock: Clock = system_clock,
+                 config: ControlConfig | None = None, name: str | None = None, recorder=None, monitor=None,
+                 aim_calibration: AimCalibration | None = None):
+        """
+        :param host: IP address of the robot
+        :param robot: Robot interface to use instead of connecting a URRobot to the host (e.g. AsyncURRobot)
+        :param call_later: call_later(delay, function) schedules a cancellable call, defaults to the clock's
+        :param tick_period: Expected time between calls to control_robot, to measure the tick jitter
+        :param clock: Time source, a VirtualClock runs the sentry faster than real time
+        :param config: Speeds, dead zones, poses..., can be replaced while running with set_config
+        :param name: Name of the cell in a fleet, added as a `cell` label to the metrics of the sentry
+        :param recorder: TelemetryRecorder receiving a row per tick
+        :param monitor: DashboardMonitor reporting the robot faults, such as protective stops
+        :param aim_calibration: Table of the joint moves centering a target, replacing the fixed speed gains
+        """
+        self.robot = robot if robot is not None else URRobot(host)
+        self.clock = clock
+        self.call_later = call_later if call_later is not None else clock.call_later
+        self.config = config if config is not None else ControlConfig()
+        # A new config waits here until the start of the next tick, so a tick never mixes two configs
+        self.pending_config = None
+        self.name = name
+        self.labels = {"cell": name} if name else {}
         #self.forward_pose = [1.571, -1.949, 1.974, -2.548, -1.571, 1.326]
-        self.imposing_pose = [1.571, -1.41, 1.411, -2.859, -1.604, 1.326]
-        self.looking_down_pose = [1.571, -2.3, 2.323, -2.452, -1.604, 1.326]
-        self.middle_point_pose = [(self.imposing_pose[i] + self.looking_down_pose[i]) / 2 for i in range(6)]
         self.robot_speed = [0, 0, 0, 0, 0, 0]
+        # Speeds of the last speedj, after the velocity profile
+        self.commanded_speed = [0, 0, 0, 0, 0, 0]
         self.detections = []
+        self.aim_calibration = aim_calibration
+        if aim_calibration is not None and (aim_calibration.imposing_pose != self.config.imposing_pose
+                                            or aim_calibration.looking_down_pose != self.config.looking_down_pose):
+            print("Warning: the aim calibration was made for other imposing and looking down poses")
+        self.recorder = recorder
+        if recorder is not None:
+            # Segments store the state as an index in STATES
+            recorder.metadata.setdefault("states", list(STATES))
 
         # Flags
-        self.ESTOP = False
+        self.estop = EmergencyStop(self.robot)
+
+        # Fault reported by the dashboard server, the arm is held until it clears
+        self.monitor = monitor
+        self.robot_fault = None
 
         self.await_stop = True
         self.await_stop_ticks = 0
@@ -31,9 +81,88 @@ class URSentry:
 
         # Smooth stopping
         self.smooth_stop_delayed_call = None
+        # Set by the delayed stop, the next tick then resets the speeds and the velocity profile
+        self.delayed_stop_sent = False
+
+        # Speeds actually sent, following robot_speed with limited acceleration and jerk
+        self.velocity_profile = VelocityProfile(self.config.max_joint_speed, self.config.base_acceleration,
+                                                self.config.max_jerk, period=tick_period)
+
+        # Latency tracing of the detection that last drove the robot
+        self.last_recorded_trace = None
+
+        # Tick timing
+        self.tick_period = tick_period
+        self.last_tick_start = None
 
         self.modbus_healthy = self.Modbus_check()
 
+    @property
+    def sentry_pose(self) -> list:
+        return list(self.config.sentry_pose)
+
+    @property
+    def imposing_pose(self) -> list:
+        return list(self.config.imposing_pose)
+
+    @property
+    def looking_down_pose(self) -> list:
+        return list(self.config.looking_down_pose)
+
+    @property
+    def middle_point_pose(self) -> list:
+        return [(self.imposing_pose[i] + self.looking_down_pose[i]) / 2 for i in range(6)]
+
+    @property
+    def ESTOP(self) -> bool:
+        return self.estop.latched
+
+    def emergency_stop(self, reason: str = "manual"):
+        """
+        Stops the arm with stopj right away, from the calling thread, and latches the sentry in the "estopped"
+        state until reset_emergency_stop. Thread safe: the pending delayed stop is left to the next tick, which
+        cancels it on the control thread when it sees the latch
+        """
+        self.estop.trigger(reason, self.config.estop_deceleration)
+
+    def reset_emergency_stop(self) -> bool:
+        """
+        Unlatches the e-stop. The sentry then starts over by returning to the sentry pose.
+        The ticks do nothing while the e-stop is latched, so the flags are reset before unlatching it
+        :return: False if it was not latched
+        """
+        if not self.estop.latched:
+            return False
+        self.has_initialized = False
+        self.send_to_zero_on_stop = False
+        self.none_input_ticks = 0
+        return self.estop.reset()
+
+    def hold_for_fault(self, fault: str):
+        """
+        Stops commanding the arm while the robot is faulted. Once the fault clears, the sentry checks Modbus again
+        and returns to the sentry pose
+        """
+        print(f"Robot fault: {fault}, holding until it clears")
+        self.robot_fault = fault
+        delayed_call = self.smooth_stop_delayed_call
+        if delayed_call is not None:
+            delayed_call.cancel()
+            self.smooth_stop_delayed_call = None
+        self.robot_speed = [0, 0, 0, 0, 0, 0]
+        self.commanded_speed = [0, 0, 0, 0, 0, 0]
+        self.velocity_profile.reset()
+        self.modbus_healthy = False
+        self.has_initialized = False
+        self.send_to_zero_on_stop = False
+        self.none_input_ticks = 0
+
+    def set_config(self, config: ControlConfig):
+        """
+        Replaces the control parameters. Thread safe, the new config is applied at the start of the next tick
+        """
+        self.pending_config = config
+
     def Modbus_check(self):
         try:
             self.robot.get_joint_angles()
@@ -45,15 +174,34 @@ class URSentry:
             print("########################################################")
             print("####            MODBUS HEALTHCHECK FAILED           ####")
             print("########################################################")
+            if self.monitor is not None:
+                print("Robot status: ", self.monitor.describe())
             return False
         print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
         print("~~~~            MODBUS HEALTHCHECK PASSED           ~~~~")
         print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+        readiness.mark("modbus_healthy")
         return True
 
+    def is_at_pose(self, pose, tolerance=0.01) -> bool:
+        """
+        True if the robot stands still within `tolerance` radians of the pose on every joint
+        """
+        try:
+            angles = self.robot.get_joint_angles()
+            speeds = self.robot.get_joint_speeds()
+        except ModbusError:
+            return False
+        return all(speed == 0 for speed in speeds) and all(abs(a - b) <= tolerance for a, b in zip(angles, pose))
+
     def initialize_pose(self):
-        self.await_stop = True
-        self.sentry_position()
+        # After a restart the arm is usually still in the sentry pose, so there is no need to move it and wait for it to stop
+        if self.modbus_healthy and self.is_at_pose(self.sentry_pose):
+            print("Already in the sentry pose")
+            self.await_stop = False
+        else:
+            self.await_stop = True
+            self.sentry_position()
         self.has_initialized = True
         self.is_on_sentry_mode = True
 
@@ -63,19 +211,25 @@ class URSentry:
         """
         return self.robot.get_joint_angles()
 
-    def sentry_position(self, a=0.5, v=1.5):
+    def sentry_position(self, a=None, v=None):
         """
         Return the robot to the sentry position
         """
-        self.robot.movej(self.sentry_pose, a=0.5, v=1.5)
+        a = self.config.pose_acceleration if a is None else a
+        v = self.config.pose_speed if v is None else v
+        self.robot.movej(self.sentry_pose, a=a, v=v)
 
-    def forward_position(self, a=0.5, v=1.5):
+    def forward_position(self, a=None, v=None):
+        a = self.config.pose_acceleration if a is None else a
+        v = self.config.pose_speed if v is None else v
         self.robot.movej(self.imposing_pose, a, v)
 
     def update_detections(self, detections):
         self.detections = detections
 
-    def forward_position_to_base_angle_degrees(self, base_angle, a=0.5, v=1.5):
+    def forward_position_to_base_angle_degrees(self, base_angle, a=None, v=None):
+        a = self.config.pose_acceleration if a is None else a
+        v = self.config.pose_speed if v is None else v
         pose = self.middle_point_pose.copy()
         pose[0] = math.radians(base_angle)
         self.robot.movej(pose, a, v)
@@ -88,20 +242,148 @@ class URSentry:
 
     def smooth_stop(self):
         self.robot_speed = [0, 0, 0, 0, 0, 0]
-        self.robot.speedj([0, 0, 0, 0, 0, 0], 1.5)
+        self.commanded_speed = [0, 0, 0, 0, 0, 0]
+        self.velocity_profile.reset()
+        self.robot.speedj([0, 0, 0, 0, 0, 0], self.config.smooth_stop_acceleration)
+        print("xxxxxxxxx Smooth stopping xxxxxxxxx")
+
+    def delayed_stop(self):
+        """
+        Stops the arm when no input came for smooth_stop_delay seconds. With the SystemClock it runs on a timer
+        thread, so it only sends the command, and leaves the speeds and the velocity profile to the next tick
+        """
+        if self.estop.latched:
+            return
+        if self.config.max_jerk > 0:
+            self.robot.speedj([0, 0, 0, 0, 0, 0], self.config.smooth_stop_acceleration)
+        else:
+            self.robot.speedj([0, 0, 0, 0, 0, 0], self.config.base_acceleration, self.config.speedj_time)
+        self.delayed_stop_sent = True
         print("xxxxxxxxx Smooth stopping xxxxxxxxx")
 
+    def calibrated_speeds(self, target_x: float, target_y: float, current_pose) -> list[float]:
+        """
+        Speeds making, within calibration_horizon, the joint moves that the aim calibration gives to center the
+        target, so the arm reaches it in one move instead of correcting a little on every tick. They are kept within
+        base_max_speed, and the vertical ones within the speed the joystick gains allow
+        :param target_x: Normalized image position of the target, as given by BBoxProcessor
+        :param target_y:
+        """
+        config = self.config
+        deltas = self.aim_calibration.joint_deltas(target_x, target_y, current_pose)
+        horizon = config.calibration_horizon
+        base_speed = max(-config.base_max_speed, min(config.base_max_speed, deltas[0] / horizon))
+        if base_speed != 0 and abs(base_speed) < config.base_min_speed:
+            base_speed = math.copysign(config.base_min_speed, base_speed)
+        speeds = [round(base_speed, 5), 0, 0, 0, 0, 0]
+        # Largest change of pose parameter per second of move_robot_with_joystick
+        max_rate = config.vertical_speed * config.vertical_clamp
+        rates = [abs(deltas[i] / horizon / (config.looking_down_pose[i] - config.imposing_pose[i]))
+                 for i in range(1, 4) if config.looking_down_pose[i] != config.imposing_pose[i]]
+        scale = min(1.0, max_rate / max(rates)) if rates and max(rates) > 0 else 1.0
+        for i in range(1, 4):
+            speeds[i] = round(deltas[i] / horizon * scale, 5)
+        return speeds
+
     def lerp(self, a, b, t):
         return a + t * (b - a)
 
 
-    def control_robot(self, joystick_pos: list[float] | None):
+    def get_state(self) -> str:
+        """
+        Current state of the sentry, one of STATES
+        """
+        if self.estop.latched:
+            return "estopped"
+        if self.robot_fault is not None:
+            return "robot_fault"
+        if not self.modbus_healthy:
+            return "modbus_unhealthy"
+        if not self.has_initialized:
+            return "initializing"
+        if self.await_stop:
+            return "awaiting_stop"
+        if self.send_to_zero_on_stop:
+            return "returning_to_zero"
+        return "sentry" if self.is_on_sentry_mode else "following"
+
+    def control_robot(self, joystick_pos: list[float] | None, trace: DetectionTrace | None = None):
         """
         Control the robot based on a joystick input.
+        If the trace of the detection behind the input is given, it is stamped when the tick starts and when the
+        resulting command is sent, and recorded once in the latency tracer, by the first tick given it. It counts as
+        dropped if that tick sent no command for it, e.g. while awaiting a stop or with the target already centered.
+        The duration of the tick, the interval since the previous one and the resulting state are exported as metrics.
+        """
+        start = time.perf_counter()
+        tick_start = self.clock.monotonic()
+        if self.last_tick_start is not None:
+            interval = tick_start - self.last_tick_start
+            tick_interval_seconds.observe(interval, **self.labels)
+            tick_jitter_seconds.observe(abs(interval - self.tick_period), **self.labels)
+        self.last_tick_start = tick_start
+        try:
+            self._control_robot(joystick_pos, trace)
+        finally:
+            if trace is not None and trace is not self.last_recorded_trace:
+                tracer.record(trace)
+                self.last_recorded_trace = trace
+            tick_seconds.observe(time.perf_counter() - start, **self.labels)
+            current_state = self.get_state()
+            for state in STATES:
+                state_gauge.set(1 if state == current_state else 0, state=state, **self.labels)
+            if self.recorder is not None:
+                self._record_tick(tick_start, joystick_pos, current_state)
+
+    def _record_tick(self, tick_start: float, joystick_pos, state: str):
         """
+        Records the tick with the joint state read during it, without reading it again
+        """
+        angles, speeds = self.robot.last_joint_state()
+        joystick_x, joystick_y = joystick_pos if joystick_pos is not None else (math.nan, math.nan)
+        self.recorder.record((
+            self.clock.time(), tick_start, STATE_INDEX[state], joystick_x, joystick_y,
+            *(angles or NO_JOINTS), *(speeds or NO_JOINTS), *self.robot_speed, *self.commanded_speed,
+        ))
+
+    def _control_robot(self, joystick_pos: list[float] | None, trace: DetectionTrace | None = None):
+        if self.pending_config is not None:
+            self.config, self.pending_config = self.pending_config, None
+            self.velocity_profile.set_limits(self.config.max_joint_speed, self.config.base_acceleration, self.config.max_jerk)
+            print("Control config updated")
+        config = self.config
+
         #print("Joystick pos: ", joystick_pos)
         # Check for flags that would block control due to things happening
 
+        # Nothing moves until the e-stop is reset
+        if self.estop.latched:
+            if self.smooth_stop_delayed_call is not None:
+                self.smooth_stop_delayed_call.cancel()
+                self.smooth_stop_delayed_call = None
+            self.robot_speed = [0, 0, 0, 0, 0, 0]
+            self.commanded_speed = [0, 0, 0, 0, 0, 0]
+            self.velocity_profile.reset()
+            return
+
+        # The arm was stopped by the delayed stop since the last tick
+        if self.delayed_stop_sent:
+            self.delayed_stop_sent = False
+            self.robot_speed = [0, 0, 0, 0, 0, 0]
+            self.commanded_speed = [0, 0, 0, 0, 0, 0]
+            self.velocity_profile.reset()
+
+        # The dashboard server tells right away why the robot stopped, instead of Modbus timing out
+        if self.monitor is not None:
+            fault = self.monitor.fault
+            if fault is not None:
+                if fault != self.robot_fault:
+                    self.hold_for_fault(fault)
+                return
+            if self.robot_fault is not None:
+                print(f"Robot recovered from {self.robot_fault}, starting over from the sentry pose")
+                self.robot_fault = None
+
         # Initialize robot if it hasn't already
         if not self.modbus_healthy:
             self.modbus_healthy = self.Modbus_check()
@@ -114,8 +396,10 @@ class URSentry:
                 return
 
             # If we are awaiting a stop, we do not control the robot until it remains at a standstill for a certain amount of ticks
-            ticks_to_wait = 6
+            ticks_to_wait = config.await_stop_ticks
             if self.await_stop:
+                # The arm is stopped by a pose move or a stop, the profile starts over from rest
+                self.velocity_profile.reset()
                 joint_speeds = self.robot.get_joint_speeds()
                 print("Awaiting stop -------------------- speeds: ", joint_speeds)
                 if all([speed == 0 for speed in joint_speeds]):
@@ -138,7 +422,7 @@ class URSentry:
             # We only do this if we have detected something at least once, as the camera gets buggy after fast movements
             if joystick_pos is None:
                 if not self.is_on_sentry_mode:
-                    ticks_for_return_to_sentry = 600 if self.has_detected_once else 3000
+                    ticks_for_return_to_sentry = config.return_to_sentry_ticks if self.has_detected_once else config.return_to_sentry_ticks_before_detection
                     self.none_input_ticks += 1
                     print("None input ticks: ", self.none_input_ticks, " / ", ticks_for_return_to_sentry)
                     if self.none_input_ticks > ticks_for_return_to_sentry:
@@ -153,14 +437,19 @@ class URSentry:
             # If we have detected something, we reset the none input ticks
 
             # If all flags are clear, we can control the robot
+            # The tick stage ends here, after the checks that can hold the command back
+            if trace is not None:
+                trace.mark_tick()
             if self.is_on_sentry_mode:
-                self.awake_from_sentry_mode(joystick_pos[0], joystick_pos[1])
+                sent = self.awake_from_sentry_mode(joystick_pos[0], joystick_pos[1])
                 self.has_detected_once = False
             else:
                 # is on forward mode
-                self.move_robot_with_joystick(joystick_pos[0], joystick_pos[1])
+                sent = self.move_robot_with_joystick(joystick_pos[0], joystick_pos[1])
                 self.has_detected_once = True
                 self.none_input_ticks = 0
+            if sent and trace is not None:
+                trace.mark_send()
         except ModbusError as me:
             print("[Modbus error]: ", me)
             self.modbus_healthy = False
@@ -171,20 +460,24 @@ class URSentry:
             return
 
 
-    def awake_from_sentry_mode(self, joystick_pos_x: float, joystick_pos_y: float):
+    def awake_from_sentry_mode(self, joystick_pos_x: float, joystick_pos_y: float) -> bool:
+        """
+        :return: True if the arm was sent towards the target
+        """
         if joystick_pos_x == 0 and joystick_pos_y == 0:
-            return
+            return False
 
         theta_rad = math.atan2(joystick_pos_x, -joystick_pos_y)
         theta_deg = math.degrees(theta_rad) - 45
         print("Theta: ", theta_deg)
 
         self.await_stop = True
-        self.forward_position_to_base_angle_degrees(-theta_deg, 1.5, 0.8)
+        self.forward_position_to_base_angle_degrees(-theta_deg, self.config.awake_acceleration, self.config.awake_speed)
         self.is_on_sentry_mode = False
+        return True
         
 
-    def move_robot_with_joystick(self, joystick_pos_x: float = 0, joystick_pos_y: float = 0):
+    def move_robot_with_joystick(self, joystick_pos_x: float = 0, joystick_pos_y: float = 0) -> bool:
         """
         Move the robot based on a joystick input,
         where the the center is (0, 0) and the bottom right corner is (1, 1).
@@ -204,12 +497,18 @@ class URSentry:
 
         If flag await_stop is set True, we check if the current speed is 0 wait until all joints are stopped before moving again.
 
+        :return: True if a speedj command following the input was sent
         """
+        config = self.config
+        # Image position of the target, for the aim calibration
+        target_x, target_y = joystick_pos_x, joystick_pos_y
+        calibrated = None
+
         # Reverse the x axis
         joystick_pos_x = -joystick_pos_x
 
         # Limit the y axis between +-0.5 to prevent speeding down too fast
-        joystick_pos_y = max(-0.5, min(0.5, joystick_pos_y))
+        joystick_pos_y = max(-config.vertical_clamp, min(config.vertical_clamp, joystick_pos_y))
 
         # We omit all processing until the robot has stopped moving for a certain amount of calls ('ticks')
 
@@ -229,19 +528,18 @@ class URSentry:
         # joystick_pos_y = -joystick_pos_y
 
         # Deadzones where we still consider the target in the middle, to avoid jittering
-        horizontal_dead_zone_radius = 0.05
-        vertical_dead_zone_radius = 0.01
+        horizontal_dead_zone_radius = config.horizontal_dead_zone
+        vertical_dead_zone_radius = config.vertical_dead_zone
 
         # Speeds for the base and neck joints
-        base_max_speed = 1.5
-        base_min_speed = 0.0
-        vertical_speed = 2.0
+        base_max_speed = config.base_max_speed
+        base_min_speed = config.base_min_speed
+        vertical_speed = config.vertical_speed
 
-        base_acceleration = 1.5
+        base_acceleration = config.base_acceleration
 
         # Maximum and minimum angles
-        base_max_angle = 315
-        base_danger_angle = 340
+        base_max_angle = config.base_max_angle
 
         movement_happened = False
         current_pose = None
@@ -250,8 +548,8 @@ class URSentry:
             # We are in the deadzone, so we stop moving it
             if abs(joystick_pos_y) < vertical_dead_zone_radius:
                 # Both deadzones, so we check if the robot is already stopped. If it is, return and do nothing
-                if all([speed == 0 for speed in self.robot_speed]):
-                    return
+                if all([speed == 0 for speed in self.robot_speed]) and self.velocity_profile.at_rest():
+                    return False
             self.robot_speed[0] = 0
 
         else:
@@ -267,7 +565,7 @@ class URSentry:
                 self.smooth_stop()
                 # self.robot_speed[0] = 0
                 # self.robot.speedj(self.robot_speed, base_acceleration, 1)
-                return
+                return False
 
             # We are not in the deadzone, so we need to move the base
             # Calculate the speed based on the distance from the center
@@ -276,6 +574,9 @@ class URSentry:
                 self.lerp(base_min_speed, base_max_speed, abs(joystick_pos_x))
                 * direction
             )
+            if self.aim_calibration is not None:
+                calibrated = self.calibrated_speeds(target_x, target_y, current_pose)
+                base_speed = calibrated[0]
             self.robot_speed[0] = base_speed
 
         #### Vertical movement ####
@@ -287,29 +588,39 @@ class URSentry:
                 current_pose = self.get_joint_angles()
             movement_happened = True
             direction = math.copysign(1, joystick_pos_y) # 1 if looking down, -1 if looking up
-            joint_limit = self.looking_down_pose if direction > 0 else self.imposing_pose
+            looking_down_pose, imposing_pose = config.looking_down_pose, config.imposing_pose
+            joint_limit = looking_down_pose if direction > 0 else imposing_pose
             #print("Joint limit: ", joint_limit, "Direction: ", direction) 
             for i in range(1, 4):
-                joint_difference = self.looking_down_pose[i] - self.imposing_pose[i]
-                joint_direction = math.copysign(1, self.looking_down_pose[i] - self.imposing_pose[i]) * direction
+                joint_difference = looking_down_pose[i] - imposing_pose[i]
+                joint_direction = math.copysign(1, looking_down_pose[i] - imposing_pose[i]) * direction
                 difference_from_limit = (joint_limit[i] - current_pose[i])
                 # difference_from_limit = difference_from_limit if difference_from_limit * joint_direction > 0 else 0
                 # self.robot_speed[i] = round(difference_from_limit * vertical_speed * abs(joystick_pos_y), 5) 
                 self.robot_speed[i] = round(joint_difference * vertical_speed * joystick_pos_y, 5) if difference_from_limit * joint_direction > 0 else 0
                 print("Joint: ", i, " limit:", joint_limit[i], " current:" , current_pose[i] , " reachedlimit: ", not (difference_from_limit * joint_direction > 0), " Speed: ", self.robot_speed[i])
+            if self.aim_calibration is not None:
+                if calibrated is None:
+                    calibrated = self.calibrated_speeds(target_x, target_y, current_pose)
+                self.robot_speed[1:4] = calibrated[1:4]
             print("")
             #self.set_neck_speed(neck_speed)
 
 
         if movement_happened:
             # Schedule smooth stop if no input is given for a second
-            self.smooth_stop_delayed_call = threading.Timer(
-                0.4, self.move_robot_with_joystick, args=[]
-            )
-            self.smooth_stop_delayed_call.start()
+            self.smooth_stop_delayed_call = self.call_later(config.smooth_stop_delay, self.delayed_stop)
+
+        # Each joint follows its setpoint with limited acceleration and jerk, instead of jumping to it
+        if config.max_jerk > 0:
+            speeds = self.velocity_profile.update(self.robot_speed, self.clock.monotonic())
+        else:
+            speeds = self.robot_speed
 
         #print("Base speed: ", self.robot_speed[0], " Joystick: ", joystick_pos_x)
-        self.robot.speedj(self.robot_speed, base_acceleration, 1)
+        self.commanded_speed = list(speeds)
+        self.robot.speedj(speeds, base_acceleration, config.speedj_time)
+        return True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+from typing import Union
+
+from UnifiWebsockets.decode import decode_packet, decode_packet_filtered, FrameFilter, is_event_packet, json_loads
+
+
+class Detection:
+    """
+    A single detected object of a liveDetectTrack message.
+    `box` is [x, y, w, h] in the 0-1000 image range of the camera.
+    """
+    __slots__ = ("box", "object_type", "tracker_id", "confidence", "depth", "camera")
+
+    def __init__(self, box: list, object_type: str | None = None, tracker_id=None, confidence: float | None = None,
+                 depth: float | None = None, camera: str | None = None):
+        self.box = box
+        self.object_type = object_type
+        self.tracker_id = tracker_id
+        self.confidence = confidence
+        self.depth = depth
+        self.camera = camera
+
+    @classmethod
+    def from_dict(cls, data: dict, camera: str | None = None) -> "Detection":
+        return cls(
+            data["coord"],
+            data.get("objectType", data.get("type")),
+            data.get("trackerId", data.get("id")),
+            data.get("confidence"),
+            data.get("depth"),
+            camera,
+        )
+
+    def __repr__(self):
+        return f"Detection({self.box}, type={self.object_type}, tracker={self.tracker_id}, camera={self.camera})"
+
+
+def find_detections(payload, camera: str | None = None, detections: list | None = None) -> list[Detection]:
+    """
+    Collects every object with a "coord" field in a parsed payload, at any depth and regardless of field order
+    """
+    if detections is None:
+        detections = []
+    if isinstance(payload, dict):
+        coord = payload.get("coord")
+        if isinstance(coord, list) and len(coord) == 4:
+            detections.append(Detection.from_dict(payload, camera))
+        else:
+            for value in payload.values():
+                if isinstance(value, (dict, list)):
+                    find_detections(value, camera, detections)
+    elif isinstance(payload, list):
+        for value in payload:
+            if isinstance(value, (dict, list)):
+                find_detections(value, camera, detections)
+    return detections
+
+
+def find_payload_timestamp(payload) -> float | None:
+    """
+    Returns the capture time of a parsed payload, in wall clock seconds, or None if it has no timestamp
+    """
+    if not isinstance(payload, dict):
+        return None
+    timestamp = payload.get("timestamp")
+    if not isinstance(timestamp, (int, float)):
+        return None
+    # Unifi timestamps are in milliseconds
+    return timestamp / 1000 if timestamp > 1e11 else float(timestamp)
+
+
+def decode_message(message: Union[bytes, memoryview, str], camera: str | None = None,
+                   frame_filter: FrameFilter | None = None) -> tuple[float | None, list[Detection]] | None:
+    """
+    Decodes a websocket message into its capture time and detections.
+    Binary messages framed like the realtime events API go through its decoding (see decode.py), text messages and
+    other binary messages are parsed as JSON.
+    If a frame filter is given, binary messages are checked against it before their payload is decoded.
+    :return: (timestamp, detections), (None, []) if the message could not be decoded,
+        or None if the frame filter dropped it
+    """
+    if isinstance(message, str) or not is_event_packet(message):
+        try:
+            payload = json_loads(message)
+        except ValueError as error:
+            print(f"Error decoding message: {error}")
+            return None, []
+    else:
+        if frame_filter is None:
+            packet = decode_packet(message)
+        else:
+            packet = decode_packet_filtered(message, frame_filter)
+        if packet is None:
+            return None, []
+        header, payload = packet
+        if payload is None:
+            return None
+        if not isinstance(payload, (dict, list)):
+            return None, []
+
+    return find_payload_timestamp(payload), find_detections(payload, camera)
@@ -0,0 +1,246 @@
+import math
+import multiprocessing
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+
+from Telemetry.LatencyTrace import tracer
+from UnifiWebsockets.Detection import Detection
+
+# Ring buffer of detection readings in shared memory, written by the ingest process and read by the control process.
+#
+# +--------------------------------------------+
+# | Header: magic, slots, max detections,      |
+# |         reserved, write sequence (u64)     |
+# +--------------------------------------------+
+# | Slot 0: sequence (u64), camera timestamp,  |
+# |         receive wall, receive monotonic,   |
+# |         count (u16), camera id (32 bytes), |
+# |         count x (x, y, w, h, confidence)   |
+# +--------------------------------------------+
+# | Slot 1 ...                                 |
+#
+# There is a single writer. Each slot is a seqlock: its sequence is odd while the writer fills it and becomes
+# 2 * n + 2 once reading n is complete, so readers never lock, and detect torn or overwritten slots by
+# checking the sequence before and after reading. All fields are fixed size, so slots are read in place.
+
+MAGIC = 0x55525344  # "URSD"
+HEADER = struct.Struct("<IIIIQ")
+WRITE_SEQUENCE_OFFSET = 16
+SEQUENCE = struct.Struct("<Q")
+MAX_CAMERA_ID = 32
+SLOT_HEADER = struct.Struct(f"<QdddH{MAX_CAMERA_ID}s6x")
+DETECTION = struct.Struct("<5f")
+
+
+def slot_size(max_detections: int) -> int:
+    return SLOT_HEADER.size + max_detections * DETECTION.size
+
+
+class SharedDetectionRing:
+    """
+    Shared memory ring of detection readings. The creator owns (and unlinks) the memory, other processes attach
+    to it by name.
+    """
+
+    def __init__(self, name: str | None = None, slots: int = 64, max_detections: int = 32, create: bool = True):
+        if create:
+            size = HEADER.size + slots * slot_size(max_detections)
+            self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+            HEADER.pack_into(self.memory.buf, 0, MAGIC, slots, max_detections, 0, 0)
+        else:
+            self.memory = shared_memory.SharedMemory(name)
+            magic, slots, max_detections, _, _ = HEADER.unpack_from(self.memory.buf, 0)
+            if magic != MAGIC:
+                raise ValueError(f"Shared memory {name} is not a detection ring")
+        self.owner = create
+        self.name = self.memory.name
+        self.slots = slots
+        self.max_detections = max_detections
+        self.slot_size = slot_size(max_detections)
+
+    def slot_offset(self, sequence: int) -> int:
+        return HEADER.size + (sequence % self.slots) * self.slot_size
+
+    def write_sequence(self) -> int:
+        return SEQUENCE.unpack_from(self.memory.buf, WRITE_SEQUENCE_OFFSET)[0]
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class RingWriter:
+    """
+    Writes readings into the ring. Has the put interface of a queue, so the Unifi ingest can write to it directly.
+    Detections beyond `max_detections` are dropped. Readings whose camera id is longer than MAX_CAMERA_ID bytes in
+    UTF-8 are rejected and counted, rather than stored under a cut id that would match no camera.
+    """
+
+    def __init__(self, ring: SharedDetectionRing):
+        self.ring = ring
+        self.buf = ring.memory.buf
+        self.sequence = ring.write_sequence()
+        self.truncated = 0
+        self.rejected = 0
+        self.rejected_cameras = set()
+
+    def put(self, reading, block=True, timeout=None):
+        detections, trace, camera = reading
+        camera_id = (camera or "").encode("utf-8")
+        if len(camera_id) > MAX_CAMERA_ID:
+            self.rejected += 1
+            if camera not in self.rejected_cameras:
+                self.rejected_cameras.add(camera)
+                print(f"[DetectionRing] Rejecting the readings of camera {camera}, its id is longer than {MAX_CAMERA_ID} bytes")
+            return
+        if len(detections) > self.ring.max_detections:
+            self.truncated += 1
+            detections = detections[:self.ring.max_detections]
+        offset = self.ring.slot_offset(self.sequence)
+        camera_ts = trace.camera_ts if trace.camera_ts is not None else math.nan
+
+        # Mark the slot as being written, fill it, then publish it
+        SEQUENCE.pack_into(self.buf, offset, 2 * self.sequence + 1)
+        SLOT_HEADER.pack_into(self.buf, offset, 2 * self.sequence + 1, camera_ts, trace.receive_wall, trace.receive_mono,
+                              len(detections), camera_id)
+        position = offset + SLOT_HEADER.size
+        for detection in detections:
+            confidence = detection.confidence if detection.confidence is not None else math.nan
+            DETECTION.pack_into(self.buf, position, *detection.box, confidence)
+            position += DETECTION.size
+        SEQUENCE.pack_into(self.buf, offset, 2 * self.sequence + 2)
+        self.sequence += 1
+        SEQUENCE.pack_into(self.buf, WRITE_SEQUENCE_OFFSET, self.sequence)
+
+    def put_nowait(self, reading):
+        self.put(reading, False)
+
+
+class RingReader:
+    """
+    Reads readings from the ring, in order, as (detections, trace, camera) like the ingest queue.
+    Has the get/get_nowait interface of a queue. If the reader falls more than a ring behind, the overwritten
+    readings are skipped and counted as dropped.
+    """
+
+    def __init__(self, ring: SharedDetectionRing, poll_interval: float = 0.001):
+        self.ring = ring
+        self.buf = ring.memory.buf
+        self.next_sequence = ring.write_sequence()
+        self.poll_interval = poll_interval
+
+        self.consumed = 0
+        self.dropped = 0
+        self.torn = 0
+
+    def _read(self, sequence: int):
+        offset = self.ring.slot_offset(sequence)
+        expected = 2 * sequence + 2
+        while True:
+            if SEQUENCE.unpack_from(self.buf, offset)[0] != expected:
+                return None
+            _, camera_ts, receive_wall, receive_mono, count, camera = SLOT_HEADER.unpack_from(self.buf, offset)
+            boxes = [DETECTION.unpack_from(self.buf, offset + SLOT_HEADER.size + i * DETECTION.size) for i in range(count)]
+            if SEQUENCE.unpack_from(self.buf, offset)[0] == expected:
+                break
+            # The writer got to the slot while we were reading it
+            self.torn += 1
+
+        camera = camera.rstrip(b"\0").decode("utf-8") or None
+        detections = [
+            Detection([x, y, w, h], confidence=None if math.isnan(confidence) else confidence, camera=camera)
+            for x, y, w, h, confidence in boxes
+        ]
+        trace = tracer.start(None if math.isnan(camera_ts) else camera_ts, receive_wall, receive_mono)
+        return detections, trace, camera
+
+    def get_nowait(self):
+        """
+        :raises queue.Empty: if there is nothing new to read
+        """
+        while True:
+            written = self.ring.write_sequence()
+            if self.next_sequence >= written:
+                raise queue.Empty
+            if written - self.next_sequence > self.ring.slots:
+                self.dropped += written - self.ring.slots - self.next_sequence
+                self.next_sequence = written - self.ring.slots
+            reading = self._read(self.next_sequence)
+            self.next_sequence += 1
+            if reading is not None:
+                self.consumed += 1
+                return reading
+            self.dropped += 1
+
+    def get(self, block=True, timeout=None):
+        """
+        Polls the ring every `poll_interval` seconds until something arrives
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                if not block or (end is not None and time.monotonic() >= end):
+                    raise
+                time.sleep(self.poll_interval)
+
+    def empty(self) -> bool:
+        return self.next_sequence >= self.ring.write_sequence()
+
+    def get_metrics(self) -> dict:
+        return {
+            "written": self.ring.write_sequence(),
+            "consumed": self.consumed,
+            "dropped": self.dropped,
+            "torn": self.torn,
+        }
+
+
+def run_ingest(ring_name: str, passwrd: str | None, cameras: list[str] | None, record_path: str | None):
+    """
+    Entry point of the ingest process: runs the Unifi session, writing every reading into the ring
+    """
+    # Imported here, so the control process does not need the websocket dependencies
+    import asyncio
+    from UnifiWebsockets import Unifi
+
+    ring = SharedDetectionRing(ring_name, create=False)
+    session = Unifi.create_session(RingWriter(ring), passwrd, cameras, record_path)
+    try:
+        asyncio.run(session.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class IngestProcess:
+    """
+    Runs the Unifi ingest and decoding in a separate process, so parsing bursts can not pause the control loop.
+    `reader` is read like the ingest queue.
+    The process is forked, so it should be started before the control process starts its own threads.
+    """
+
+    def __init__(self, passwrd: str | None = None, cameras: list[str] | None = None, record_path: str | None = None,
+                 slots: int = 64, max_detections: int = 32):
+        self.ring = SharedDetectionRing(slots=slots, max_detections=max_detections)
+        self.reader = RingReader(self.ring)
+        context = multiprocessing.get_context("fork")
+        self.process = context.Process(
+            target=run_ingest, args=(self.ring.name, passwrd, cameras, record_path), name="unifi-ingest", daemon=True
+        )
+
+    def start(self):
+        self.process.start()
+
+    def stop(self, timeout: float = 2.0):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        # Drop our views of the memory before closing it
+        self.reader.buf = None
+        self.ring.close()
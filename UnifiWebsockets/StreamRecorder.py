@@ -0,0 +1,212 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from Telemetry.LatencyTrace import tracer
+from UnifiWebsockets.Detection import decode_message
+from UnifiWebsockets.decode import FrameFilter
+
+# A recording is made of two append-only files:
+#
+# <path>      : magic, then one record per websocket frame
+#               +-----------+-------------+-----------+------+------------+--------+---------+
+#               | length u32| receive f64 | mono f64  | kind | camera len | camera | payload |
+#               |           | (wall, s)   | (s)       | u8   | u16        | utf-8  |         |
+#               +-----------+-------------+-----------+------+------------+--------+---------+
+#               `length` counts everything after itself. kind is 0 for binary frames and 1 for text frames.
+# <path>.idx  : one (offset u64, receive f64) entry per record, so any frame can be reached without scanning.
+
+MAGIC = b"URSREC1\n"
+RECORD_HEADER = struct.Struct("<IddBH")
+INDEX_ENTRY = struct.Struct("<Qd")
+
+BINARY = 0
+TEXT = 1
+
+
+class StreamRecorder:
+    """
+    Appends raw websocket frames, with their receive time and camera, to a recording.
+    An existing recording is extended, not overwritten.
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        self.path = path
+        self.flush_every = flush_every
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        self.index = open(path + ".idx", "ab")
+        if new_file:
+            self.file.write(MAGIC)
+        self.offset = self.file.tell()
+        self.frames = 0
+        self._lock = threading.Lock()
+
+    def record(self, message, camera: str | None = None, receive_wall: float | None = None, receive_mono: float | None = None):
+        receive_wall = time.time() if receive_wall is None else receive_wall
+        receive_mono = time.monotonic() if receive_mono is None else receive_mono
+        if isinstance(message, str):
+            kind = TEXT
+            payload = message.encode("utf-8")
+        else:
+            kind = BINARY
+            payload = message
+        camera_bytes = (camera or "").encode("utf-8")
+        length = RECORD_HEADER.size - 4 + len(camera_bytes) + len(payload)
+
+        with self._lock:
+            self.file.write(RECORD_HEADER.pack(length, receive_wall, receive_mono, kind, len(camera_bytes)))
+            self.file.write(camera_bytes)
+            self.file.write(payload)
+            self.index.write(INDEX_ENTRY.pack(self.offset, receive_wall))
+            self.offset += 4 + length
+            self.frames += 1
+            if self.frames % self.flush_every == 0:
+                self.flush()
+
+    def flush(self):
+        # The index is flushed last, so it never points past the data on disk
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.file.close()
+            self.index.close()
+
+
+class Frame:
+    """
+    A recorded websocket frame. `payload` is a memoryview into the mapped recording
+    """
+    __slots__ = ("receive_wall", "receive_mono", "kind", "camera", "payload")
+
+    def __init__(self, receive_wall: float, receive_mono: float, kind: int, camera: str | None, payload: memoryview):
+        self.receive_wall = receive_wall
+        self.receive_mono = receive_mono
+        self.kind = kind
+        self.camera = camera
+        self.payload = payload
+
+    def message(self):
+        """
+        The frame as it was received: str for text frames, bytes for binary ones
+        """
+        if self.kind == TEXT:
+            return str(self.payload, "utf-8")
+        return self.payload.tobytes()
+
+
+class StreamReader:
+    """
+    Reads a recording through mmap. Frames are looked up through the index, and their payloads are not copied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a camera stream recording")
+        with open(path + ".idx", "rb") as index:
+            index_data = index.read()
+        # Ignore a half-written entry at the end
+        self.index = index_data[:len(index_data) - len(index_data) % INDEX_ENTRY.size]
+        self.view = memoryview(self.data)
+
+    def __len__(self) -> int:
+        return len(self.index) // INDEX_ENTRY.size
+
+    def __getitem__(self, i: int) -> Frame:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        offset, _ = INDEX_ENTRY.unpack_from(self.index, i * INDEX_ENTRY.size)
+        length, receive_wall, receive_mono, kind, camera_length = RECORD_HEADER.unpack_from(self.data, offset)
+        camera_start = offset + RECORD_HEADER.size
+        payload_start = camera_start + camera_length
+        camera = str(self.view[camera_start:payload_start], "utf-8") or None
+        return Frame(receive_wall, receive_mono, kind, camera, self.view[payload_start:offset + 4 + length])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def duration(self) -> float:
+        if len(self) < 2:
+            return 0.0
+        return self[-1].receive_mono - self[0].receive_mono
+
+    def close(self):
+        try:
+            self.view.release()
+            self.data.close()
+        except BufferError:
+            # Frames still point into the mapping, it is unmapped once they are gone
+            pass
+        self.file.close()
+
+
+class StreamReplayer:
+    """
+    Feeds a recording into a queue, as (detections, trace, camera) like the live ingest does.
+
+    `speed` is the replay speed: 1 is real time, 10 is ten times faster, and 0 is as fast as possible.
+    Camera timestamps are shifted by the time elapsed since the recording, so latency traces stay meaningful.
+    """
+
+    def __init__(self, path: str, queue, speed: float = 1.0, loop: bool = False, frame_filter: FrameFilter | None = None):
+        self.reader = StreamReader(path)
+        self.frame_filter = frame_filter
+        self.queue = queue
+        self.speed = speed
+        self.loop = loop
+        self.keep_running = True
+        self.frames = 0
+
+    def run(self):
+        while self.keep_running:
+            start_mono = time.monotonic()
+            first = None
+            for frame in self.reader:
+                if not self.keep_running:
+                    break
+                if first is None:
+                    first = frame
+                    shift = time.time() - frame.receive_wall
+                if self.speed > 0:
+                    delay = (frame.receive_mono - first.receive_mono) / self.speed - (time.monotonic() - start_mono)
+                    if delay > 0:
+                        time.sleep(delay)
+                message = frame.payload if frame.kind == BINARY else frame.message()
+                decoded = decode_message(message, frame.camera, self.frame_filter)
+                if decoded is None:
+                    continue
+                timestamp, detections = decoded
+                trace = tracer.start(timestamp + shift if timestamp is not None else None)
+                self.queue.put((detections, trace, frame.camera))
+                self.frames += 1
+            if not self.loop:
+                break
+
+    def stop(self):
+        self.keep_running = False
+
+
+if __name__ == "__main__":
+    # Prints a summary of a recording: python -m UnifiWebsockets.StreamRecorder recording.rec
+    reader = StreamReader(sys.argv[1])
+    cameras = {}
+    size = 0
+    for frame in reader:
+        cameras[frame.camera] = cameras.get(frame.camera, 0) + 1
+        size += len(frame.payload)
+    print(f"Frames: {len(reader)}  Duration: {round(reader.duration(), 3)}s  Payload bytes: {size}")
+    for camera, frames in cameras.items():
+        print(f"  Camera {camera}: {frames} frames")
+    reader.close()
@@ -1,78 +1,48 @@
 import asyncio
+import os
 import queue
-import json
-import requests
-import websockets
-import ssl
-import re
-import dotenv
 
-# from UnifiWebsockets.decode import decode_packet
+from Config.SentryConfig import SentryConfig, load_config
+from UnifiWebsockets.StreamRecorder import StreamRecorder
+from UnifiWebsockets.decode import FrameFilter
 
+# requests, websockets and dotenv take a while to import, so they are only imported when a session is created.
+# Importing this module stays cheap, and the ingest thread pays for them while the robot connects.
 
-# REST login script to get the CSRF token
-def get_token(base_url, username, password):
-    login_url = f"{base_url}/api/auth/login"
-    payload = {"username": username, "password": password}
-    headers = {"Content-Type": "application/json"}
-    try:
-        session = requests.Session()
-        response = session.post(login_url, json=payload, headers=headers, verify=False)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        return session.cookies
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to obtain token: {e}")
-        return None, None
 
+DEFAULT_CAMERA = "668daa1e019ce603e4002d31"
 
-# Function to connect to the websocket and print the event stream
-async def listen_to_event_stream(ws_url, cookies, queue):
-    cookie_header = "".join([f"{key}={value}" for key, value in cookies.items()])
-    headers = {"Cookie": cookie_header}
 
-    ssl_context = ssl._create_unverified_context()  # Create an unverified SSL context
-    try:
-        async with websockets.connect(
-            ws_url, extra_headers=headers, ssl=ssl_context
-        ) as websocket:
-            while True:
-                try:
-                    message = await websocket.recv()
-                    message = str(message)
+def create_session(q, passwrd: str | None = None, cameras: list[str] | None = None, record_path: str | None = None,
+                   frame_filter: FrameFilter | None = None, config: SentryConfig | None = None) -> "UnifiSession":
+    """
+    The Unifi addresses and username come from the configuration (see Config/SentryConfig.py).
+    The auth cookie is cached in UNIFI_COOKIE_CACHE (.unifi_cookies.json by default, empty to disable)
+    """
+    from UnifiWebsockets.UnifiSession import UnifiSession
 
-                    queue.put(find_coords(message))
-                    # print(find_coords(message))
-
-                    # coords_begin = message.find('coord') + 7
-                    # coords_end = message[coords_begin:].find(']')
-                    # print(message[coords_begin:])
-
-                    # print(decode_packet(message))
-                except websockets.ConnectionClosed:
-                    print("Connection closed")
-                    break
-    except Exception as e:
-        print(f"WebSocket connection failed: {e}")
-
-
-def find_coords(message: str) -> list[str]:
-    coords_begin = [m.start() + 8 for m in re.finditer('"coord":', message)]
-    coords_end = [m.start() + 1 for m in re.finditer('],"depth":', message)]
-    coords = [
-        json.loads(message[coords_begin[i] : coords_end[i]])
-        for i in range(len(coords_begin))
-    ]
-    return coords
-
-
-def run(q: queue.Queue, passwrd : str | None = None) -> None:
-    base_url = "https://172.22.114.176"  # Replace with your UniFi Protect base URL
-    username = "engr-ugaif"  # Replace with your username
+    if config is None:
+        config = load_config()
+    base_url = config.unifi_base_url
+    username = config.unifi_username
     if passwrd is None:
+        import dotenv
         password = dotenv.get_key(dotenv.find_dotenv(), "UNIFI_PASSWORD")
     else:
         password = passwrd
-    ws_url = "wss://172.22.114.176/proxy/protect/ws/liveDetectTrack?camera=668daa1e019ce603e4002d31"  # Replace with your WebSocket URL
-
-    cookies = get_token(base_url, username, password)
-    asyncio.run(listen_to_event_stream(ws_url, cookies, q))
+    ws_base_url = config.unifi_ws_url
+    if not cameras:
+        cameras = [DEFAULT_CAMERA]
+
+    # The session logs in, and reconnects every camera whenever its connection drops
+    # Raw frames can be recorded to replay them later (see StreamRecorder.py)
+    recorder = StreamRecorder(record_path) if record_path else None
+    cookie_cache = os.getenv('UNIFI_COOKIE_CACHE', ".unifi_cookies.json") or None
+    return UnifiSession(base_url, username, password, ws_base_url, cameras, q, recorder=recorder, frame_filter=frame_filter,
+                        cookie_cache=cookie_cache)
+
+
+def run(q: queue.Queue, passwrd : str | None = None, cameras: list[str] | None = None, record_path: str | None = None,
+        frame_filter: FrameFilter | None = None, config: SentryConfig | None = None) -> None:
+    session = create_session(q, passwrd, cameras, record_path, frame_filter, config)
+    asyncio.run(session.run())
@@ -0,0 +1,333 @@
+import asyncio
+import json
+import os
+import random
+import ssl
+import time
+
+import requests
+import websockets
+
+from Telemetry.LatencyTrace import tracer
+from Telemetry.Metrics import metrics
+from Telemetry.ReadinessGate import readiness
+from UnifiWebsockets.Detection import decode_message
+from UnifiWebsockets.StreamRecorder import StreamRecorder
+from UnifiWebsockets.decode import FrameFilter
+
+# Connection states
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+BACKOFF = "backoff"
+STOPPED = "stopped"
+
+DECODE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+frames_total = metrics.counter("sentry_websocket_frames_total", "Websocket frames received from each camera")
+readings_total = metrics.counter("sentry_websocket_readings_total", "Decoded detection readings put in the queue, per camera")
+decode_seconds = metrics.histogram("sentry_websocket_decode_seconds", "Time spent decoding each websocket frame", DECODE_BUCKETS)
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+class CameraConnection:
+    """
+    State and metrics of the websocket of a single camera
+    """
+
+    def __init__(self, camera: str):
+        self.camera = camera
+        self.state = DISCONNECTED
+        self.attempt = 0
+        self.connects = 0
+        self.failures = 0
+        self.messages = 0
+        self.stalls = 0
+        self.disconnected_since = time.monotonic()
+        self.connected_at = None
+        self.last_message = None
+        self.last_time_to_reconnect = None
+        self.max_time_to_reconnect = 0.0
+        self.total_downtime = 0.0
+
+    def stall_time(self) -> float:
+        """
+        Seconds since the last message (or since the connection went down)
+        """
+        if self.last_message is None or self.state != CONNECTED:
+            return time.monotonic() - self.disconnected_since
+        return time.monotonic() - self.last_message
+
+    def get_metrics(self) -> dict:
+        return {
+            "state": self.state,
+            "connects": self.connects,
+            "failures": self.failures,
+            "messages": self.messages,
+            "stalls": self.stalls,
+            "stall_time": round(self.stall_time(), 3),
+            "last_time_to_reconnect": self.last_time_to_reconnect,
+            "max_time_to_reconnect": round(self.max_time_to_reconnect, 3),
+            "total_downtime": round(self.total_downtime, 3),
+        }
+
+
+class UnifiSession:
+    """
+    Supervised connection to the liveDetectTrack websockets of Unifi Protect.
+
+    Logs in with a persistent requests.Session and refreshes the auth cookie when it expires or is rejected.
+    Each camera websocket is reconnected after any failure, waiting a jittered exponential backoff in between.
+    Pings keep the connection alive, and a connection that stays silent for `stall_timeout` seconds is restarted.
+    Every reading is put in the queue as (detections, trace, camera).
+    If a recorder is given, every raw frame is also appended to it.
+    If a frame filter is given, binary frames it rejects are dropped before their payload is decoded.
+    If a cookie cache path is given, the auth cookie is saved there after every login, and reused on the next
+    start while it is still valid, so a restart does not wait for the REST login.
+    """
+
+    def __init__(self, base_url: str, username: str, password: str, ws_base_url: str, cameras: list[str], queue,
+                 token_ttl: float = 3600, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 ping_interval: float = 5.0, ping_timeout: float = 5.0, stall_timeout: float = 30.0,
+                 recorder: StreamRecorder | None = None, frame_filter: FrameFilter | None = None,
+                 cookie_cache: str | None = None):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.ws_base_url = ws_base_url
+        self.queue = queue
+
+        self.token_ttl = token_ttl
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.stall_timeout = stall_timeout
+        self.recorder = recorder
+        self.frame_filter = frame_filter
+
+        self.http = requests.Session()
+        self.http.verify = False
+        self.token_expires = 0.0
+        self.logins = 0
+        self._login_lock = None
+        self.cookie_cache = cookie_cache
+        self.cached_logins = 0
+        self._cache_tried = False
+
+        self.connections = {camera: CameraConnection(camera) for camera in cameras}
+        self.ssl_context = ssl._create_unverified_context()
+        self._stopping = False
+        self._tasks = []
+
+    def login(self):
+        """
+        Logs in through the REST API, storing the auth cookie in the session
+        :raises AuthenticationError: if the login fails
+        """
+        try:
+            response = self.http.post(
+                f"{self.base_url}/api/auth/login",
+                json={"username": self.username, "password": self.password},
+                headers={"Content-Type": "application/json"},
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise AuthenticationError(f"Failed to obtain token: {e}") from e
+
+        # Refresh a bit before the cookie really expires
+        expires = [cookie.expires for cookie in self.http.cookies if cookie.expires]
+        lifetime = min(expires) - time.time() if expires else self.token_ttl
+        self.token_expires = time.monotonic() + max(lifetime * 0.9, 1.0)
+        self.logins += 1
+        print(f"[Unifi] Logged in, token valid for {round(lifetime)}s")
+        readiness.mark("camera_login")
+        if self.cookie_cache:
+            self.save_cookies(time.time() + max(lifetime * 0.9, 1.0))
+
+    def save_cookies(self, expires: float):
+        """
+        Writes the auth cookies and their expiry (wall clock) to the cookie cache, readable only by the owner
+        """
+        cookies = [
+            {"name": cookie.name, "value": cookie.value, "domain": cookie.domain, "path": cookie.path}
+            for cookie in self.http.cookies
+        ]
+        temporary = f"{self.cookie_cache}.tmp"
+        try:
+            descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "w") as file:
+                json.dump({"base_url": self.base_url, "expires": expires, "cookies": cookies}, file)
+            os.replace(temporary, self.cookie_cache)
+        except OSError as e:
+            print(f"[Unifi] Could not save the cookie cache: {e}")
+
+    def load_cookies(self, margin: float = 60.0) -> bool:
+        """
+        Restores the cookies of the cache, if they belong to this server and stay valid for at least `margin` seconds
+        :return: True if the cookies were restored
+        """
+        try:
+            with open(self.cookie_cache) as file:
+                cached = json.load(file)
+            remaining = cached["expires"] - time.time()
+            if cached["base_url"] != self.base_url or remaining < margin:
+                return False
+            for cookie in cached["cookies"]:
+                self.http.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self.token_expires = time.monotonic() + remaining
+        self.cached_logins += 1
+        print(f"[Unifi] Reusing the cached token, valid for {round(remaining)}s")
+        readiness.mark("camera_login")
+        return True
+
+    def token_expired(self) -> bool:
+        return time.monotonic() >= self.token_expires
+
+    async def ensure_token(self, force: bool = False):
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if force or self.token_expired():
+                # The cache is only tried once: if its token gets rejected, the next attempt logs in
+                if not force and self.cookie_cache and not self._cache_tried:
+                    self._cache_tried = True
+                    if self.load_cookies():
+                        return
+                await asyncio.to_thread(self.login)
+
+    def cookie_header(self) -> str:
+        return "; ".join([f"{key}={value}" for key, value in self.http.cookies.items()])
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def listen(self, connection: CameraConnection):
+        """
+        Connects to the websocket of a camera and forwards its readings until it closes or stalls
+        """
+        ws_url = f"{self.ws_base_url}?camera={connection.camera}"
+        connection.state = CONNECTING
+        async with websockets.connect(
+            ws_url,
+            extra_headers={"Cookie": self.cookie_header()},
+            ssl=self.ssl_context,
+            ping_interval=self.ping_interval,
+            ping_timeout=self.ping_timeout,
+        ) as websocket:
+            now = time.monotonic()
+            downtime = now - connection.disconnected_since
+            connection.state = CONNECTED
+            connection.connects += 1
+            connection.connected_at = now
+            connection.last_message = now
+            if connection.connects > 1:
+                connection.last_time_to_reconnect = round(downtime, 3)
+                connection.max_time_to_reconnect = max(connection.max_time_to_reconnect, downtime)
+            connection.total_downtime += downtime
+            print(f"[Unifi] Camera {connection.camera} connected")
+            readiness.mark("camera_connected")
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), self.stall_timeout)
+                except asyncio.TimeoutError:
+                    connection.stalls += 1
+                    print(f"[Unifi] Camera {connection.camera} stalled for {self.stall_timeout}s, reconnecting")
+                    return
+                receive_wall = time.time()
+                connection.last_message = receive_mono = time.monotonic()
+                connection.messages += 1
+                frames_total.inc(camera=connection.camera)
+                if self.recorder is not None:
+                    self.recorder.record(message, connection.camera, receive_wall, receive_mono)
+
+                decode_start = time.perf_counter()
+                decoded = decode_message(message, connection.camera, self.frame_filter)
+                decode_seconds.observe(time.perf_counter() - decode_start)
+                if decoded is None:
+                    continue
+                timestamp, detections = decoded
+                trace = tracer.start(timestamp, receive_wall, receive_mono)
+                self.queue.put((detections, trace, connection.camera))
+                readings_total.inc(camera=connection.camera)
+                readiness.mark("first_reading")
+
+    async def supervise(self, connection: CameraConnection):
+        """
+        Keeps the websocket of a camera connected until the session is stopped
+        """
+        while not self._stopping:
+            force_login = False
+            try:
+                await self.ensure_token()
+                await self.listen(connection)
+            except asyncio.CancelledError:
+                break
+            except websockets.exceptions.InvalidStatusCode as e:
+                print(f"[Unifi] Camera {connection.camera} rejected the connection: {e}")
+                force_login = e.status_code in (401, 403)
+                connection.failures += 1
+            except websockets.ConnectionClosed as e:
+                print(f"[Unifi] Camera {connection.camera} connection closed: {e}")
+            except AuthenticationError as e:
+                print(f"[Unifi] {e}")
+                connection.failures += 1
+            except Exception as e:
+                print(f"[Unifi] Camera {connection.camera} connection failed: {e}")
+                connection.failures += 1
+
+            if connection.state == CONNECTED:
+                connection.disconnected_since = time.monotonic()
+                # A connection that stayed up for a while was healthy, so the next one starts with a short backoff
+                if connection.disconnected_since - connection.connected_at > self.backoff_max:
+                    connection.attempt = 0
+            if self._stopping:
+                break
+            connection.state = BACKOFF
+            delay = self.backoff_delay(connection.attempt)
+            connection.attempt += 1
+            if force_login:
+                self.token_expires = 0.0
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                break
+        connection.state = STOPPED
+
+    async def run(self):
+        """
+        Supervises the websockets of all the cameras concurrently, until stop() is called
+        """
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self.supervise(connection)) for connection in self.connections.values()]
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            self.http.close()
+            if self.recorder is not None:
+                self.recorder.close()
+
+    def stop(self):
+        """
+        Stops every connection. Must be called from the event loop running the session
+        """
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+
+    def get_metrics(self) -> dict:
+        return {
+            "logins": self.logins,
+            "cached_logins": self.cached_logins,
+            "frame_filter": self.frame_filter.get_metrics() if self.frame_filter is not None else None,
+            "token_expires_in": round(max(self.token_expires - time.monotonic(), 0.0), 1),
+            "cameras": {camera: connection.get_metrics() for camera, connection in self.connections.items()},
+        }
@@ -3,6 +3,12 @@ import struct
 import json
 from typing import Tuple, Union
 
+# orjson parses straight from bytes and memoryviews, the stdlib json needs a copy into bytes
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Constants
 EVENT_PACKET_HEADER_SIZE = 8
 
@@ -15,12 +21,48 @@ JSON_TYPE = 1
 STRING_TYPE = 2
 BUFFER_TYPE = 3
 
-def decode_packet(packet: bytes) -> Union[Tuple[dict, Union[dict, str, bytes]], None]:
+def json_loads(data: Union[bytes, memoryview, str]):
+    """
+    Parses JSON with orjson if it is installed, falling back to the stdlib
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+def get_data_offset(packet: memoryview) -> int:
+    """
+    Returns the offset of the payload frame, checking that the packet length matches both frame headers
+    """
+    data_offset = struct.unpack_from('>I', packet, ProtectEventPacketHeader.PAYLOAD_SIZE)[0] + EVENT_PACKET_HEADER_SIZE
+
+    if len(packet) != (data_offset + EVENT_PACKET_HEADER_SIZE + struct.unpack_from('>I', packet, data_offset + ProtectEventPacketHeader.PAYLOAD_SIZE)[0]):
+        raise ValueError("Packet length doesn't match header information.")
+    return data_offset
+
+def is_event_packet(packet: Union[bytes, memoryview]) -> bool:
+    """
+    Checks the framing of a binary message without decoding it: a header frame, then a payload frame, with lengths
+    matching the message. Other binary messages are not from the realtime events API
+    """
+    packet = memoryview(packet)
+    if len(packet) < 2 * EVENT_PACKET_HEADER_SIZE or packet[ProtectEventPacketHeader.TYPE] != HEADER:
+        return False
+    try:
+        get_data_offset(packet)
+    except (struct.error, ValueError):
+        return False
+    return True
+
+def decode_packet(packet: Union[bytes, memoryview]) -> Union[Tuple[dict, Union[dict, str, memoryview]], None]:
+    """
+    Decodes a binary packet of the realtime events API into its header and payload frames.
+    Frames are sliced as memoryviews of the packet, so nothing is copied until it is decompressed or parsed.
+    """
+    packet = memoryview(packet)
     try:
-        data_offset = struct.unpack('>I', packet[ProtectEventPacketHeader.PAYLOAD_SIZE:ProtectEventPacketHeader.PAYLOAD_SIZE + 4])[0] + EVENT_PACKET_HEADER_SIZE
-        
-        if len(packet) != (data_offset + EVENT_PACKET_HEADER_SIZE + struct.unpack('>I', packet[data_offset + ProtectEventPacketHeader.PAYLOAD_SIZE:data_offset + ProtectEventPacketHeader.PAYLOAD_SIZE + 4])[0]):
-            raise ValueError("Packet length doesn't match header information.")
+        data_offset = get_data_offset(packet)
     except Exception as error:
         print(f"Error decoding update packet: {error}")
         return None
@@ -33,7 +75,7 @@ def decode_packet(packet: bytes) -> Union[Tuple[dict, Union[dict, str, bytes]],
 
     return header_frame, payload_frame
 
-def decode_frame(packet: bytes, packet_type: int) -> Union[dict, str, bytes, None]:
+def decode_frame(packet: memoryview, packet_type: int) -> Union[dict, str, memoryview, bytes, None]:
     frame_type = packet[ProtectEventPacketHeader.TYPE]
 
     if packet_type != frame_type:
@@ -42,45 +84,102 @@ def decode_frame(packet: bytes, packet_type: int) -> Union[dict, str, bytes, Non
     payload_format = packet[ProtectEventPacketHeader.PAYLOAD_FORMAT]
     is_deflated = packet[ProtectEventPacketHeader.DEFLATED]
 
-    if is_deflated:
-        payload = zlib.decompress(packet[EVENT_PACKET_HEADER_SIZE:])
-    else:
-        payload = packet[EVENT_PACKET_HEADER_SIZE:]
+    try:
+        if is_deflated:
+            payload = zlib.decompress(packet[EVENT_PACKET_HEADER_SIZE:])
+        else:
+            payload = packet[EVENT_PACKET_HEADER_SIZE:]
+
+        if frame_type == HEADER:
+            if payload_format == JSON_TYPE:
+                return json_loads(payload)
+            else:
+                return None
 
-    if frame_type == HEADER:
         if payload_format == JSON_TYPE:
-            return json.loads(payload.decode('utf-8'))
+            return json_loads(payload)
+        elif payload_format == STRING_TYPE:
+            return str(payload, 'utf-8')
+        elif payload_format == BUFFER_TYPE:
+            return payload
         else:
+            print(f"Unknown payload packet type received in the realtime events API: {payload_format}")
             return None
-
-    if payload_format == JSON_TYPE:
-        return json.loads(payload.decode('utf-8'))
-    elif payload_format == STRING_TYPE:
-        return payload.decode('utf-8')
-    elif payload_format == BUFFER_TYPE:
-        return payload
-    else:
-        print(f"Unknown payload packet type received in the realtime events API: {payload_format}")
+    except (zlib.error, ValueError) as error:
+        # Truncated deflate stream, invalid JSON or UTF-8 (JSONDecodeError and UnicodeDecodeError are ValueErrors)
+        print(f"Error decoding frame: {error}")
         return None
 
-def decode_packet_from_mac(packet: bytes, mac: str) -> Union[Tuple[dict, Union[dict, str, bytes]], None]:
+def decode_packet_from_mac(packet: Union[bytes, memoryview], mac: str) -> Union[Tuple[dict, Union[dict, str, memoryview]], None]:
+    # Check if modelKey is 'camera' and mac matches
+    result = decode_packet_filtered(packet, FrameFilter(cameras=[mac], model_keys=['camera'], payload_formats=None,
+                                                        camera_field='mac'))
+    if result is None or result[1] is None:
+        return None
+    return result
+
+class FrameFilter:
+    """
+    Decides from the headers of a packet whether its payload is worth decoding.
+
+    The payload format in the 8-byte frame header is checked first, then the (small) header JSON frame:
+    camera id, modelKey and action. Any criterion left as None accepts everything.
+    """
+
+    def __init__(self, cameras=None, model_keys=None, actions=None, payload_formats=(JSON_TYPE,), camera_field='id'):
+        self.cameras = set(cameras) if cameras is not None else None
+        self.model_keys = set(model_keys) if model_keys is not None else None
+        self.actions = set(actions) if actions is not None else None
+        self.payload_formats = set(payload_formats) if payload_formats is not None else None
+        self.camera_field = camera_field
+
+        self.accepted = 0
+        self.dropped = {'format': 0, 'camera': 0, 'model_key': 0, 'action': 0}
+
+    def accepts_format(self, payload_format: int) -> bool:
+        if self.payload_formats is not None and payload_format not in self.payload_formats:
+            self.dropped['format'] += 1
+            return False
+        return True
+
+    def accepts_header(self, header: dict) -> bool:
+        if self.cameras is not None and header.get(self.camera_field) not in self.cameras:
+            self.dropped['camera'] += 1
+            return False
+        if self.model_keys is not None and header.get('modelKey') not in self.model_keys:
+            self.dropped['model_key'] += 1
+            return False
+        if self.actions is not None and header.get('action') not in self.actions:
+            self.dropped['action'] += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def get_metrics(self) -> dict:
+        return {'accepted': self.accepted, 'dropped': dict(self.dropped)}
+
+def decode_packet_filtered(packet: Union[bytes, memoryview], frame_filter: FrameFilter) -> Union[Tuple[dict, Union[dict, str, memoryview, None]], None]:
+    """
+    Same as decode_packet, but the payload is only decompressed and parsed if the filter accepts the headers.
+    :return: (header, payload), (header, None) if the packet was filtered out, or None if it could not be decoded
+    """
+    packet = memoryview(packet)
     try:
-        data_offset = struct.unpack('>I', packet[ProtectEventPacketHeader.PAYLOAD_SIZE:ProtectEventPacketHeader.PAYLOAD_SIZE + 4])[0] + EVENT_PACKET_HEADER_SIZE
-        
-        if len(packet) != (data_offset + EVENT_PACKET_HEADER_SIZE + struct.unpack('>I', packet[data_offset + ProtectEventPacketHeader.PAYLOAD_SIZE:data_offset + ProtectEventPacketHeader.PAYLOAD_SIZE + 4])[0]):
-            raise ValueError("Packet length doesn't match header information.")
+        data_offset = get_data_offset(packet)
     except Exception as error:
         print(f"Error decoding update packet: {error}")
         return None
 
+    if not frame_filter.accepts_format(packet[data_offset + ProtectEventPacketHeader.PAYLOAD_FORMAT]):
+        return {}, None
+
     header_frame = decode_frame(packet[:data_offset], HEADER)
-    
+
     if not header_frame:
         return None
 
-    # Check if modelKey is 'camera' and mac matches
-    if header_frame.get('modelKey') != 'camera' or header_frame.get('mac') != mac:
-        return None
+    if not frame_filter.accepts_header(header_frame):
+        return header_frame, None
 
     payload_frame = decode_frame(packet[data_offset:], PAYLOAD)
 
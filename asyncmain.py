@@ -0,0 +1,197 @@
+import asyncio
+import os
+import signal
+
+import BBoxProcessor
+from URSentry import URSentry
+from Robot.UR.AsyncURRobot import AsyncURRobot
+from Communication.LatestValueChannel import LatestValueChannel
+from Telemetry.LatencyTrace import tracer
+from Telemetry.Metrics import start_metrics_server
+from Telemetry.ModbusStats import modbus_stats
+from Telemetry.ReadinessGate import readiness
+from Config.SentryConfig import load_config
+from Config.ControlServer import start_control_server
+from Telemetry.SamplingProfiler import profiler
+from Telemetry.TelemetryRecorder import start_telemetry_recorder
+from Robot.UR.DashboardMonitor import start_dashboard_monitor
+from Tracking.AimCalibration import load_aim_calibration
+from Tracking.CameraFusion import CameraFusion, load_calibrations
+from UnifiWebsockets import Unifi
+from UnifiWebsockets.StreamRecorder import StreamReplayer
+
+# Runs ingest, tracking, the control tick and robot I/O as tasks of a single event loop.
+# Same environment variables and configuration as dockermain.py.
+# uvloop is used as the event loop if it is installed.
+
+CONTROL_PERIOD = 0.1
+TRACKING_PERIOD = 0.05  # Tracks are expired at least this often, even without new readings
+
+
+class SentryState:
+    """
+    Latest output of the tracker, read by the control tick
+    """
+    def __init__(self):
+        self.joystick = None
+        self.trace = None
+
+
+async def tracking(channel: LatestValueChannel, processor: BBoxProcessor.BBoxProcessor, state: SentryState):
+    loop = asyncio.get_running_loop()
+    readings = asyncio.Event()
+    listener = lambda: loop.call_soon_threadsafe(readings.set)
+    channel.add_listener(listener)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(readings.wait(), TRACKING_PERIOD)
+            except asyncio.TimeoutError:
+                pass
+            readings.clear()
+            drained = False
+            while not channel.empty():
+                detections, trace, camera = channel.get_nowait()
+                state.joystick = processor.get_joystick_position_from_camera(camera, [d.box for d in detections], trace)
+                state.trace = trace
+                drained = True
+            if not drained:
+                state.joystick = processor.get_joystick_position_from_camera(None, [])
+    finally:
+        channel.remove_listener(listener)
+
+
+async def control(sentry: URSentry, robot: AsyncURRobot, state: SentryState):
+    """
+    Control tick at a fixed rate. Deadlines are absolute, so a slow tick does not shift the following ones
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    while True:
+        await robot.poll_state()
+        sentry.control_robot(state.joystick, state.trace)
+        deadline += CONTROL_PERIOD
+        delay = deadline - loop.time()
+        if delay < 0:
+            # We fell behind, skip the missed ticks
+            deadline = loop.time()
+            delay = 0
+        await asyncio.sleep(delay)
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop.set)
+        except NotImplementedError:
+            pass
+
+    metrics_server = start_metrics_server()
+    # SIGUSR2 toggles the sampling profiler
+    profiler.install_signal_handler()
+
+    config = load_config()
+
+    # Only the newest reading of each camera is kept, so the tracker never works on stale frames
+    channel = LatestValueChannel("conflate", key=lambda reading: reading[2])
+
+    # Several cameras can be fused by listing their calibrations in a JSON file (see Tracking/CameraFusion.py)
+    calibration_path = os.getenv('CAMERA_CALIBRATION')
+    if calibration_path:
+        calibrations = load_calibrations(calibration_path)
+        cameras = list(calibrations)
+        processor = CameraFusion(calibrations, cameras[0], dist_threshold=config.tracker.dist_threshold,
+                                 time_to_live=config.tracker.time_to_live)
+    else:
+        cameras = None
+        processor = BBoxProcessor.BBoxProcessor(dist_threshold=config.tracker.dist_threshold,
+                                                time_to_live=config.tracker.time_to_live)
+
+    replay_path = os.getenv('UNIFI_REPLAY')
+    replayer = None
+    if replay_path:
+        replayer = StreamReplayer(replay_path, channel, float(os.getenv('UNIFI_REPLAY_SPEED', '1')))
+        ingest = asyncio.to_thread(replayer.run)
+    else:
+        session = Unifi.create_session(channel, os.getenv('UNIFI_PASSWORD') or None, cameras, os.getenv('UNIFI_RECORD'),
+                                       config=config)
+        ingest = session.run()
+    # The cameras log in and connect while the robot connects
+    ingest_task = asyncio.create_task(ingest, name="ingest")
+
+    host = config.robot_host
+    robot = AsyncURRobot(host)
+    _, connected = await asyncio.gather(robot.poll_state(), robot.secondaryInterface.connect())
+    if connected:
+        readiness.mark("robot_connected")
+    recorder = start_telemetry_recorder()
+    # Polls the dashboard server on its own thread, see Robot/UR/DashboardMonitor.py
+    monitor = start_dashboard_monitor(host)
+    sentry = URSentry(host, robot=robot, call_later=loop.call_later, tick_period=CONTROL_PERIOD, config=config.control,
+                      recorder=recorder, monitor=monitor, aim_calibration=load_aim_calibration())
+    if isinstance(processor, CameraFusion):
+        # The first camera is on the arm
+        processor.follow_arm(sentry)
+    control_server = start_control_server(sentry, config)
+    state = SentryState()
+
+    tasks = [
+        ingest_task,
+        asyncio.create_task(tracking(channel, processor, state), name="tracking"),
+        asyncio.create_task(control(sentry, robot, state), name="control"),
+        asyncio.create_task(robot.run(), name="robot_io"),
+    ]
+    stopper = asyncio.create_task(stop.wait(), name="stop")
+
+    # Run until asked to stop, or until any task dies
+    done, _ = await asyncio.wait(tasks + [stopper], return_when=asyncio.FIRST_COMPLETED)
+    for task in done:
+        if task is not stopper and task.exception() is not None:
+            print(f"Task {task.get_name()} failed: {task.exception()!r}")
+
+    print("Shutting down")
+    if replayer is not None:
+        replayer.stop()
+    for task in tasks + [stopper]:
+        if task.get_name() != "robot_io":
+            task.cancel()
+    await asyncio.gather(*tasks[:-1], stopper, return_exceptions=True)
+
+    # Stop the arm, and give the robot I/O task a moment to send it before closing the connections
+    try:
+        sentry.smooth_stop()
+        await asyncio.wait_for(robot.outbox.join(), 1.0)
+    except asyncio.TimeoutError:
+        print("Could not send the stop command")
+    tasks[-1].cancel()
+    await asyncio.gather(tasks[-1], return_exceptions=True)
+    await robot.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if control_server is not None:
+        control_server.stop()
+
+    tracer.print_summary()
+    modbus_stats.print_summary()
+    profiler.stop()
+    if recorder is not None:
+        recorder.close()
+        print("Telemetry: ", recorder.get_metrics())
+    if monitor is not None:
+        monitor.stop()
+        print("Dashboard: ", monitor.get_metrics())
+    print("Camera channel: ", channel.get_metrics())
+
+
+if __name__ == "__main__":
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -1,9 +1,22 @@
 from UnifiWebsockets import Unifi
-from URSentry import URSentry
+from SentryStartup import SentryStartup
 import queue
-import time
 import threading
 import BBoxProcessor
+from Telemetry.LatencyTrace import tracer
+from Telemetry.Metrics import start_metrics_server
+from Telemetry.ModbusStats import modbus_stats
+from Telemetry.SamplingProfiler import profiler
+from Telemetry.TelemetryRecorder import start_telemetry_recorder
+from Robot.UR.DashboardMonitor import start_dashboard_monitor
+from Tracking.AimCalibration import load_aim_calibration
+from Timing.Clock import system_clock
+from Config.SentryConfig import load_config
+from Config.ControlServer import start_control_server
+from Tracking.CameraFusion import CameraFusion, load_calibrations
+from Communication.LatestValueChannel import LatestValueChannel
+from UnifiWebsockets.StreamRecorder import StreamReplayer
+from UnifiWebsockets.SharedDetectionRing import IngestProcess
 import os
 
 unifi_password = os.getenv('UNIFI_PASSWORD')
@@ -11,14 +24,64 @@ if unifi_password == '':
     print("Please set the 'UNIFI_PASSWORD' environment variable.")
     exit(1)
 
-q = queue.Queue()
-
-x = threading.Thread(target=Unifi.run, args=(q,unifi_password))
-x.start()
-
-b = BBoxProcessor.BBoxProcessor()
-
-ur = URSentry("172.22.114.160")
+# Time source of the control code, see Timing/Clock.py
+clock = system_clock
+
+# Addresses and control parameters, from SENTRY_CONFIG and the environment (see Config/SentryConfig.py)
+config = load_config()
+
+# Only the newest reading of each camera is kept, so the tracker never works on stale frames
+q = LatestValueChannel("conflate", key=lambda reading: reading[2])
+
+# Several cameras can be fused by listing their calibrations in a JSON file (see Tracking/CameraFusion.py)
+calibration_path = os.getenv('CAMERA_CALIBRATION')
+if calibration_path:
+    calibrations = load_calibrations(calibration_path)
+    cameras = list(calibrations)
+    b = CameraFusion(calibrations, cameras[0], dist_threshold=config.tracker.dist_threshold,
+                     time_to_live=config.tracker.time_to_live, clock=clock)
+else:
+    cameras = None
+    b = BBoxProcessor.BBoxProcessor(dist_threshold=config.tracker.dist_threshold,
+                                    time_to_live=config.tracker.time_to_live, clock=clock)
+
+# UNIFI_RECORD records the camera streams to a file, UNIFI_REPLAY plays a recording instead of the live cameras
+replay_path = os.getenv('UNIFI_REPLAY')
+# UNIFI_INGEST_PROCESS runs the camera ingest in its own process, readings come through shared memory
+ingest_process = None
+if replay_path:
+    replayer = StreamReplayer(replay_path, q, float(os.getenv('UNIFI_REPLAY_SPEED', '1')))
+    x = threading.Thread(target=replayer.run)
+    x.start()
+elif os.getenv('UNIFI_INGEST_PROCESS'):
+    ingest_process = IngestProcess(unifi_password, cameras, os.getenv('UNIFI_RECORD'))
+    ingest_process.start()
+    q = ingest_process.reader
+else:
+    x = threading.Thread(target=Unifi.run, args=(q, unifi_password, cameras, os.getenv('UNIFI_RECORD')), kwargs={"config": config})
+    x.start()
+
+# Prometheus metrics on http://127.0.0.1:9108/metrics (see METRICS_PORT and METRICS_ADDRESS)
+# Started after the ingest process is forked
+metrics_server = start_metrics_server()
+
+# `kill -USR2 <pid>` starts the sampling profiler, and a second one writes its flame graph stacks to PROFILE_DIR
+profiler.install_signal_handler()
+
+# The camera ingest started above logs in while the robot connects, see SentryStartup.py
+# TELEMETRY_DIR records joint states and commands on every tick (see Telemetry/TelemetryRecorder.py)
+recorder = start_telemetry_recorder()
+# The dashboard server (DASHBOARD_PORT) reports protective stops, power and brakes, see Robot/UR/DashboardMonitor.py
+monitor = start_dashboard_monitor(config.robot_host)
+# AIM_CALIBRATION maps image positions to the joint moves centering them, see Tracking/AimCalibration.py
+aim_calibration = load_aim_calibration()
+ur = SentryStartup(config.robot_host, clock, config.control, recorder, monitor, aim_calibration).start_robot()
+if isinstance(b, CameraFusion):
+    # The first camera is on the arm
+    b.follow_arm(ur)
+
+# Control parameters can be tuned while running, see Config/ControlServer.py
+control_server = start_control_server(ur, config)
 
 joystick_queue = queue.Queue()
 
@@ -30,16 +93,21 @@ class CameraJoystick(threading.Thread):
         self.keep_running = True
 
     def run(self):
-        global current_joystick
+        global current_joystick, current_trace
         while self.keep_running:
-            time.sleep(0.0001)
+            clock.sleep(0.0001)
             q_val = []
+            trace = None
+            camera = None
             try:
-                q_val = q.get_nowait()
+                detections, trace, camera = q.get_nowait()
+                q_val = [detection.box for detection in detections]
             except queue.Empty:
                 pass
             #print(bb)
-            current_joystick = b.get_joystick_position_from_new_set_of_bboxes(q_val)
+            current_joystick = b.get_joystick_position_from_camera(camera, q_val, trace)
+            if trace is not None:
+                current_trace = trace
             #self.joystick_queue.put(bb)
 
     def stop(self):
@@ -47,6 +115,7 @@ class CameraJoystick(threading.Thread):
 
 
 current_joystick = [0, 0]
+current_trace = None
 
 
 class JoystickScheduler(threading.Thread):
@@ -69,14 +138,25 @@ camera_joystick.start()
 # joystick_scheduler = JoystickScheduler(joystick_queue)
 # joystick_scheduler.start()
 
-ur.initialize_pose()
 
 while True:
     try:
-        ur.control_robot(current_joystick)
+        ur.control_robot(current_joystick, current_trace)
         #print("Setting robot base velocity to: ", current_joystick[0])
-        time.sleep(0.1)
+        clock.sleep(0.1)
     except KeyboardInterrupt:
         camera_joystick.stop()
+        tracer.print_summary()
+        modbus_stats.print_summary()
+        profiler.stop()
+        if recorder is not None:
+            recorder.close()
+            print("Telemetry: ", recorder.get_metrics())
+        if monitor is not None:
+            monitor.stop()
+            print("Dashboard: ", monitor.get_metrics())
+        print("Camera channel: ", q.get_metrics())
+        if ingest_process is not None:
+            ingest_process.stop()
         # joystick_scheduler.stop()
         break
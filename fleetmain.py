@@ -0,0 +1,267 @@
+import asyncio
+import os
+import signal
+import time
+
+import BBoxProcessor
+from URSentry import URSentry
+from asyncmain import CONTROL_PERIOD, SentryState, control, tracking
+from Robot.UR.AsyncURRobot import AsyncURRobot
+from Communication.LatestValueChannel import LatestValueChannel
+from Communication.ModbusClientPool import ModbusClientPool
+from Config.FleetConfig import CellConfig, load_fleet
+from Telemetry.LatencyTrace import tracer
+from Telemetry.Metrics import metrics, start_metrics_server
+from Telemetry.ModbusStats import modbus_stats
+from Telemetry.SamplingProfiler import profiler
+from Telemetry.TelemetryRecorder import TelemetryWriter, start_telemetry_recorder
+from Robot.UR.DashboardMonitor import start_dashboard_monitor
+from Tracking.AimCalibration import load_aim_calibration
+from Tracking.CameraFusion import CameraFusion, load_calibrations
+from UnifiWebsockets import Unifi
+from UnifiWebsockets.StreamRecorder import StreamReplayer
+
+# Runs several sentry cells (a robot and the cameras it follows) from one process, on a single event loop:
+#
+#     FLEET_CONFIG=fleet.json python fleetmain.py
+#
+# The cells share one Unifi session for all the cameras, one Modbus connection per robot, the metrics server, the
+# profiler and the telemetry writer thread. The dashboard servers of the robots are polled from the event loop.
+# Everything else (channel, tracker, sentry, robot connection) belongs to its cell. Each cell is
+# supervised on its own: when one of its tasks fails, the arm is stopped and the cell restarts after a backoff,
+# while the other cells keep running. See Config/FleetConfig.py for the configuration.
+
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+STABLE_RUN = 60.0  # A cell running this long is healthy again, its next restart is not delayed further
+
+cell_restarts_total = metrics.counter("sentry_cell_restarts_total", "Restarts of each cell after a failure")
+cell_up = metrics.gauge("sentry_cell_up", "1 while the cell is running, 0 while it waits to restart")
+
+
+class CameraRouter:
+    """
+    Hands each reading of the shared Unifi session to the channels of the cells following its camera
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.dropped = 0
+
+    def add_route(self, camera: str, channel: LatestValueChannel):
+        self.routes.setdefault(camera, []).append(channel)
+
+    def cameras(self) -> list[str]:
+        return list(self.routes)
+
+    def put(self, reading, block=True, timeout=None):
+        channels = self.routes.get(reading[2])
+        if not channels:
+            self.dropped += 1
+            return
+        for channel in channels:
+            channel.put(reading, block, timeout)
+
+
+class SentryCell:
+    """
+    A robot and its cameras, driven by tracking, control and robot I/O tasks of the shared event loop
+    """
+
+    def __init__(self, config: CellConfig, modbus_pool: ModbusClientPool, telemetry_writer: TelemetryWriter | None = None):
+        self.config = config
+        self.name = config.name
+        self.modbus_pool = modbus_pool
+        # Only the newest reading of each camera is kept, so the tracker never works on stale frames
+        self.channel = LatestValueChannel("conflate", key=lambda reading: reading[2])
+        if config.calibration:
+            calibrations = load_calibrations(config.calibration)
+            self.cameras = list(calibrations)
+            self.processor = CameraFusion(calibrations, self.cameras[0], dist_threshold=config.tracker.dist_threshold,
+                                          time_to_live=config.tracker.time_to_live)
+        else:
+            self.cameras = list(config.cameras)
+            self.processor = BBoxProcessor.BBoxProcessor(dist_threshold=config.tracker.dist_threshold,
+                                                         time_to_live=config.tracker.time_to_live)
+        self.robot = AsyncURRobot(config.robot_host, modbus=modbus_pool.acquire(config.robot_host))
+        # Each cell records its telemetry in its own directory, kept across restarts
+        telemetry_dir = os.getenv('TELEMETRY_DIR')
+        self.recorder = start_telemetry_recorder({"cell": self.name}, os.path.join(telemetry_dir, self.name),
+                                                 telemetry_writer) if telemetry_dir else None
+        # Each robot has its own dashboard server, polled by the run_async task of the monitor
+        self.monitor = start_dashboard_monitor(config.robot_host, {"cell": self.name}, asynchronous=True)
+        # Each arm carries its own camera, so each has its own table
+        self.aim_calibration = load_aim_calibration(config.aim_calibration) if config.aim_calibration else None
+        self.sentry = None
+        self.restarts = 0
+        self.last_error = None
+
+    def log(self, message: str):
+        print(f"[{self.name}] {message}")
+
+    async def run(self):
+        """
+        Runs the cell until cancelled, restarting it with an exponential backoff whenever it fails
+        """
+        failures = 0
+        while True:
+            started = time.monotonic()
+            cell_up.set(1, cell=self.name)
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = repr(e)
+                self.log(f"Failed: {e!r}")
+            finally:
+                cell_up.set(0, cell=self.name)
+            if time.monotonic() - started > STABLE_RUN:
+                failures = 0
+            delay = min(RESTART_DELAY * 2 ** failures, MAX_RESTART_DELAY)
+            failures += 1
+            self.restarts += 1
+            cell_restarts_total.inc(cell=self.name)
+            self.log(f"Restarting in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def run_once(self):
+        loop = asyncio.get_running_loop()
+        robot = self.robot
+        _, connected = await asyncio.gather(robot.poll_state(), robot.secondaryInterface.connect())
+        if not connected:
+            self.log("Could not connect to the secondary port of the robot")
+        self.sentry = URSentry(robot.host, robot=robot, call_later=loop.call_later, tick_period=CONTROL_PERIOD,
+                               config=self.config.control, name=self.name, recorder=self.recorder,
+                               monitor=self.monitor, aim_calibration=self.aim_calibration)
+        if isinstance(self.processor, CameraFusion):
+            # The first camera is on the arm
+            self.processor.follow_arm(self.sentry)
+        state = SentryState()
+        tasks = [
+            asyncio.create_task(tracking(self.channel, self.processor, state), name=f"{self.name}/tracking"),
+            asyncio.create_task(control(self.sentry, robot, state), name=f"{self.name}/control"),
+        ]
+        robot_io = asyncio.create_task(robot.run(), name=f"{self.name}/robot_io")
+        try:
+            # The tasks run forever, so the first one to finish has failed
+            done, _ = await asyncio.wait(tasks + [robot_io], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+            raise RuntimeError(f"{', '.join(task.get_name() for task in done)} stopped")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.stop_arm(robot_io)
+
+    async def stop_arm(self, robot_io: asyncio.Task):
+        """
+        Stops the arm, and gives the robot I/O task a moment to send the command before cancelling it
+        """
+        if self.sentry.smooth_stop_delayed_call is not None:
+            self.sentry.smooth_stop_delayed_call.cancel()
+        self.sentry.smooth_stop()
+        if not robot_io.done():
+            try:
+                await asyncio.wait_for(self.robot.outbox.join(), 1.0)
+            except asyncio.TimeoutError:
+                self.log("Could not send the stop command")
+        robot_io.cancel()
+        await asyncio.gather(robot_io, return_exceptions=True)
+
+    async def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        await self.robot.close()
+        await self.modbus_pool.release(self.robot.modbusTCP)
+
+    def get_metrics(self) -> dict:
+        return {
+            "state": self.sentry.get_state() if self.sentry is not None else None,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "channel": self.channel.get_metrics(),
+            "dashboard": self.monitor.get_metrics() if self.monitor is not None else None,
+        }
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_number, stop.set)
+        except NotImplementedError:
+            pass
+
+    config, cell_configs = load_fleet()
+
+    metrics_server = start_metrics_server()
+    # SIGUSR2 toggles the sampling profiler
+    profiler.install_signal_handler()
+
+    modbus_pool = ModbusClientPool(hooks=(modbus_stats,))
+    router = CameraRouter()
+    telemetry_writer = TelemetryWriter() if os.getenv('TELEMETRY_DIR') else None
+    cells = [SentryCell(cell_config, modbus_pool, telemetry_writer) for cell_config in cell_configs]
+    for cell in cells:
+        for camera in cell.cameras:
+            router.add_route(camera, cell.channel)
+    print(f"Running {len(cells)} cells: {', '.join(f'{cell.name} ({cell.config.robot_host})' for cell in cells)}")
+
+    replay_path = os.getenv('UNIFI_REPLAY')
+    replayer = None
+    if replay_path:
+        replayer = StreamReplayer(replay_path, router, float(os.getenv('UNIFI_REPLAY_SPEED', '1')))
+        ingest = asyncio.to_thread(replayer.run)
+    else:
+        session = Unifi.create_session(router, os.getenv('UNIFI_PASSWORD') or None, router.cameras(),
+                                       os.getenv('UNIFI_RECORD'), config=config)
+        ingest = session.run()
+    # The cameras log in and connect while the robots connect
+    ingest_task = asyncio.create_task(ingest, name="ingest")
+    cell_tasks = [asyncio.create_task(cell.run(), name=cell.name) for cell in cells]
+    # The monitors keep polling while their cell restarts
+    monitor_tasks = [asyncio.create_task(cell.monitor.run_async(), name=f"{cell.name}/dashboard")
+                     for cell in cells if cell.monitor is not None]
+    stopper = asyncio.create_task(stop.wait(), name="stop")
+
+    # Cells restart on their own, so only a stop request or the end of the ingest ends the fleet
+    done, _ = await asyncio.wait([ingest_task, stopper], return_when=asyncio.FIRST_COMPLETED)
+    if ingest_task in done and ingest_task.exception() is not None:
+        print(f"Task ingest failed: {ingest_task.exception()!r}")
+
+    print("Shutting down")
+    if replayer is not None:
+        replayer.stop()
+    for task in [ingest_task, stopper] + cell_tasks + monitor_tasks:
+        task.cancel()
+    # Cancelling a cell stops its arm, cancelling a monitor closes its connection
+    await asyncio.gather(ingest_task, stopper, *cell_tasks, *monitor_tasks, return_exceptions=True)
+    for cell in cells:
+        await cell.close()
+    if telemetry_writer is not None:
+        telemetry_writer.stop()
+    await modbus_pool.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+
+    tracer.print_summary()
+    modbus_stats.print_summary()
+    profiler.stop()
+    for cell in cells:
+        print(f"{cell.name}: ", cell.get_metrics())
+    print("Readings from unknown cameras: ", router.dropped)
+
+
+if __name__ == "__main__":
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())